@@ -0,0 +1,362 @@
+#! /usr/bin/env python
+"""
+Benchmarks of `Landmask` on particle-like workloads.
+
+Points are generated deterministically (seeded) from the mask pyramid:
+
+    global:   uniform over the globe
+    ocean:    uniform in blocks of the mask that are all water
+    coastal:  uniform in blocks of the mask that contain the coastline
+    extent:   uniform in a regional extent (the coast of Norway), checked with
+              a Landmask constructed with the extent
+
+Each workload is run for a sweep of numbers of points, with and without
+checking against the polygons, with the page cache of the mask cold and warm.
+Cold runs are run in a fresh process, with the mask and coastline cells
+evicted from the page cache (which requires that no other process has them
+mapped). Their residency is checked (`mincore`) after evicting, runs with
+more than 1 % of the pages resident are reported as 'partial' rather than
+'cold'. The cold start of `Landmask()` is measured in a fresh process, both
+with the mask already generated and with an empty cache directory.
+
+Results are written as JSON, one record per line.
+
+    python -m benchmarks.benchmark --max 1e6 --output results.jsonl
+
+run from the root of the repository (or with the package installed).
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+EXTENT = [4., 58., 12., 64.]
+WORKLOADS = ['global', 'ocean', 'coastal', 'extent']
+
+
+def points(landmask, workload, n, seed=0):
+    """
+    `n` points of `workload`, the same for every run.
+    """
+    rng = np.random.default_rng(seed)
+
+    if workload == 'global':
+        return rng.uniform(-180, 180, n), rng.uniform(-90, 90, n)
+
+    if workload == 'extent':
+        return (rng.uniform(EXTENT[0], EXTENT[2], n),
+                rng.uniform(EXTENT[1], EXTENT[3], n))
+
+    c = landmask.WATER if workload == 'ocean' else landmask.MIXED
+    blocks = np.argwhere(landmask.pyramid[0] == c)
+    b = blocks[rng.integers(0, len(blocks), n)]
+
+    # random cells in the blocks, clamped to the grid
+    s = 1 << landmask.pyramid_shift
+    ym = np.minimum(b[:, 0] * s + rng.uniform(0, s, n), landmask.ny - 1)
+    xm = np.minimum(b[:, 1] * s + rng.uniform(0, s, n), landmask.nx - 1)
+
+    x, y = landmask.get_transform() * (xm, ym)
+    return x, y
+
+
+def evict(f):
+    """
+    Evict file `f` from the page cache (only clean pages, no root required).
+    """
+    if f is None or not os.path.exists(f) or not hasattr(os, 'posix_fadvise'):
+        return False
+
+    fd = os.open(f, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def resident(f):
+    """
+    Fraction of the pages of file `f` in the page cache (`mincore`), None
+    where not supported.
+    """
+    import ctypes
+    import ctypes.util
+    import mmap
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [
+            ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int,
+            ctypes.c_int, ctypes.c_long
+        ]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [
+            ctypes.c_void_p, ctypes.c_size_t,
+            ctypes.POINTER(ctypes.c_ubyte)
+        ]
+    except (OSError, AttributeError):
+        return None
+
+    size = os.path.getsize(f)
+    if size == 0:
+        return 0.
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+
+    fd = os.open(f, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            vec = (ctypes.c_ubyte * pages)()
+            if libc.mincore(addr, size, vec) != 0:
+                return None
+            return float(np.count_nonzero(np.frombuffer(vec, np.uint8) & 1)
+                         ) / pages
+        finally:
+            libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+
+def rss():
+    """
+    Current and peak resident memory of this process, in MB.
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    if sys.platform == 'darwin':
+        peak /= 1024.
+
+    try:
+        with open('/proc/self/statm') as fd:
+            current = int(fd.read().split()[1]) * os.sysconf(
+                'SC_PAGE_SIZE') / 1024.**2
+    except OSError:
+        current = None
+
+    return current, peak
+
+
+def polygon_fraction(landmask, x, y):
+    """
+    Fraction of points that are on land in the mask and in cells crossed by
+    the coastline, and so are checked against the polygons.
+    """
+    if landmask.coast is None:
+        return 0.
+
+    land = landmask.contains(x, y, skippoly=True, checkextent=False)
+    if not np.any(land):
+        return 0.
+
+    xm, ym = landmask.invtransform * (x[land], y[land])
+    xm = np.clip(xm.astype(np.int32), 0, landmask.nx - 1)
+    ym = np.clip(ym.astype(np.int32), 0, landmask.ny - 1)
+    coastal = landmask.__lookup__(landmask.coast, xm, ym)
+
+    return float(np.count_nonzero(coastal)) / len(x)
+
+
+def cold_start(skippoly, generate):
+    """
+    Time of `Landmask()` in a fresh process. If `generate` the cache
+    directory is empty, so that the mask (and the coastline cells and tile
+    index, unless `skippoly`) is generated: a cold start. Otherwise the
+    default cache directory is used, generated first if needed so that the
+    timed start finds it: a start with a warm cache.
+    """
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as d:
+        if generate:
+            env['LANDMASK_CACHE'] = d
+
+        code = ("import time; t0 = time.time(); "
+                "from opendrift_landmask_data import Landmask; "
+                "t1 = time.time(); l = Landmask(skippoly=%s); "
+                "t2 = time.time(); print(t1 - t0, t2 - t1)" % skippoly)
+
+        def start():
+            return subprocess.run([sys.executable, '-c', code],
+                                  env=env,
+                                  check=True,
+                                  stdout=subprocess.PIPE,
+                                  universal_newlines=True).stdout
+
+        if not generate:
+            start()
+
+        imp, init = [float(t) for t in start().split()[-2:]]
+
+    return {'import_s': imp, 'init_s': init}
+
+
+def record(landmask, workload, x, y, skippoly, cache, times):
+    current, peak = rss()
+    best = min(times)
+
+    return {
+        'workload': workload,
+        'n': len(x),
+        'skippoly': skippoly,
+        'cache': cache,
+        'time_s': best,
+        'mean_s': float(np.mean(times)),
+        'points_per_s': len(x) / best,
+        'polygon_fraction':
+        0. if skippoly else polygon_fraction(landmask, x, y),
+        'rss_mb': current,
+        'peak_rss_mb': peak,
+    }
+
+
+def run(landmask, workload, n, skippoly, repeat):
+    """
+    Check `n` points of `workload` with the page cache warm.
+    """
+    x, y = points(landmask, workload, n)
+
+    times = []
+    for r in range(repeat + 1):
+        t0 = time.perf_counter()
+        landmask.contains(x, y, skippoly=skippoly)
+        times.append(time.perf_counter() - t0)
+
+    # the first run warms the page cache
+    return record(landmask, workload, x, y, skippoly, 'warm', times[1:])
+
+
+def run_cold(workload, n, skippoly, extent, load_polys):
+    """
+    Check `n` points of `workload` with the page cache cold, in this (fresh)
+    process.
+    """
+    from opendrift_landmask_data import Landmask
+
+    landmask = Landmask(extent=extent, skippoly=not load_polys)
+    x, y = points(landmask, workload, n)
+
+    files = [f for f in (landmask.mmapf, landmask.coastf) if f is not None]
+    evicted = all([evict(f) for f in files])
+    fractions = [resident(f) for f in files]
+    fraction = None if None in fractions else max(fractions)
+
+    t0 = time.perf_counter()
+    landmask.contains(x, y, skippoly=skippoly)
+    t = time.perf_counter() - t0
+
+    cold = evicted and fraction is not None and fraction <= .01
+    r = record(landmask, workload, x, y, skippoly,
+               'cold' if cold else 'partial', [t])
+    r['resident_fraction'] = fraction
+    return r
+
+
+def cold(workload, n, skippoly, extent, load_polys):
+    """
+    Run `run_cold` in a fresh process, the pages of the mask mapped by this
+    process can not be evicted.
+    """
+    spec = json.dumps([workload, n, skippoly, extent, load_polys])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.benchmark', '--cold-run', spec],
+        cwd=root,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--min', type=float, default=1e4,
+                        help='smallest number of points')
+    parser.add_argument('--max', type=float, default=1e7,
+                        help='largest number of points')
+    parser.add_argument('--workloads', nargs='+', default=WORKLOADS,
+                        choices=WORKLOADS)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repetitions of warm runs, after one warming the page cache (the best is reported)')
+    parser.add_argument('--skippoly-only', action='store_true',
+                        help='do not load or check against polygons')
+    parser.add_argument('--no-cold-start', action='store_true',
+                        help='do not measure the start (cold and with a warm cache) in a fresh process')
+    parser.add_argument('--output', default=None,
+                        help='file to write results to (default: stdout)')
+    parser.add_argument('--cold-run', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_run:
+        print(json.dumps(run_cold(*json.loads(args.cold_run))))
+        return
+
+    from opendrift_landmask_data import Landmask
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+
+    def emit(record):
+        record.update({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        })
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+    polys = [True] if args.skippoly_only else [True, False]
+
+    if not args.no_cold_start:
+        for skippoly in polys:
+            for generate in (False, True):
+                r = cold_start(skippoly, generate)
+                r.update({
+                    'benchmark': 'cold_start' if generate else 'start',
+                    'skippoly': skippoly,
+                    'generate': generate,
+                    'cache': 'empty' if generate else 'warm'
+                })
+                emit(r)
+
+    ns = np.logspace(np.log10(args.min), np.log10(args.max),
+                     int(round(np.log10(args.max / args.min))) + 1)
+    ns = [int(round(n)) for n in ns]
+
+    for workload in args.workloads:
+        extent = EXTENT if workload == 'extent' else None
+
+        for skippoly in polys:
+            for n in ns:
+                r = cold(workload, n, skippoly, extent,
+                         not args.skippoly_only)
+                r['benchmark'] = 'contains'
+                r['extent'] = extent
+                emit(r)
+
+        landmask = Landmask(extent=extent, skippoly=args.skippoly_only)
+        for skippoly in polys:
+            for n in ns:
+                r = run(landmask, workload, n, skippoly, args.repeat)
+                r['benchmark'] = 'contains'
+                r['extent'] = extent
+                emit(r)
+
+        # unmap the mask, so that it can be evicted for the next cold runs
+        del landmask
+        gc.collect()
+
+    if args.output:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,2 @@
-from .gshhs import get_gshhs_f
+from .gshhs import get_gshhs, get_gshhs_f
 from .mask import Landmask
@@ -0,0 +1,187 @@
+import numpy as np
+import shapely
+import shapely.prepared
+import shapely.vectorized
+
+shapely2 = int(shapely.__version__.split('.')[0]) >= 2
+
+
+class Backend:
+    """
+    Checks points against polygons, used for checking points against the
+    polygons of each tile.
+
+    Attributes:
+
+        name (str): name of backend
+
+        releases_gil (bool): `contains` releases the GIL, so that it can run in parallel on threads
+    """
+    name = None
+    releases_gil = False
+
+    def prepare(self, geom):
+        """
+        Prepare (multi)polygon `geom` for checking points against.
+        """
+        raise NotImplementedError
+
+    def contains(self, prepared, x, y):
+        """
+        Check if points x, y are inside the prepared geometry.
+
+        Returns:
+
+            array of bools same length as x and y
+        """
+        raise NotImplementedError
+
+
+class ShapelyBackend(Backend):
+    """
+    `shapely.vectorized.contains` against prepared geometries (shapely 1.x
+    API).
+    """
+    name = 'shapely'
+    releases_gil = shapely2  # in shapely 2 this wraps `contains_xy`
+
+    def prepare(self, geom):
+        return shapely.prepared.prep(geom)
+
+    def contains(self, prepared, x, y):
+        return shapely.vectorized.contains(prepared, x, y)
+
+
+class ContainsXYBackend(Backend):
+    """
+    `shapely.contains_xy` against prepared geometries, releases the GIL.
+    Requires shapely 2.
+    """
+    name = 'contains_xy'
+    releases_gil = True
+
+    def __init__(self):
+        assert shapely2, "the contains_xy backend requires shapely 2"
+
+    def prepare(self, geom):
+        shapely.prepare(geom)
+        return geom
+
+    def contains(self, prepared, x, y):
+        return shapely.contains_xy(prepared, x, y)
+
+
+class Edges:
+    """
+    The edges of the rings of a (multi)polygon, binned by latitude.
+    """
+
+    def __init__(self, geom, edges_per_bin=16):
+        from .coast import rings
+
+        x0, y0, x1, y1 = [], [], [], []
+        for r in rings(geom):
+            x0.append(r[:-1, 0])
+            y0.append(r[:-1, 1])
+            x1.append(r[1:, 0])
+            y1.append(r[1:, 1])
+
+        x0, y0, x1, y1 = [
+            np.concatenate(a) if a else np.zeros(0) for a in (x0, y0, x1, y1)
+        ]
+
+        # horizontal edges are never crossed
+        keep = y0 != y1
+        self.x0, self.y0, self.x1, self.y1 = x0[keep], y0[keep], x1[keep], y1[
+            keep]
+
+        n = len(self.x0)
+        self.nbins = max(n // edges_per_bin, 1)
+        if n > 0:
+            self.ymin = min(self.y0.min(), self.y1.min())
+            self.ymax = max(self.y0.max(), self.y1.max())
+        else:
+            self.ymin = self.ymax = 0.
+        self.dy = max((self.ymax - self.ymin) / self.nbins, 1.e-12)
+
+        # edges in each bin (a bin for each edge it spans)
+        b0 = self.bin(np.minimum(self.y0, self.y1))
+        b1 = self.bin(np.maximum(self.y0, self.y1))
+        nb = b1 - b0 + 1
+        e = np.repeat(np.arange(n), nb)
+        b = np.repeat(b0, nb) + np.arange(len(e)) - np.repeat(
+            np.cumsum(nb) - nb, nb)
+
+        order = np.argsort(b, kind='stable')
+        self.edges = e[order]
+        self.starts = np.searchsorted(b[order], np.arange(self.nbins + 1))
+
+    def bin(self, y):
+        return np.clip(((y - self.ymin) / self.dy).astype(np.int64), 0,
+                       self.nbins - 1)
+
+
+class CrossingNumberBackend(Backend):
+    """
+    Crossing number (even-odd) test in numpy on the coordinates of the rings,
+    extracted once. Edges are binned by latitude so that each point is only
+    tested against the edges in its bin.
+
+    Points exactly on an edge may be classified either way.
+    """
+    name = 'numpy'
+    releases_gil = True
+
+    def prepare(self, geom):
+        return Edges(geom)
+
+    def contains(self, edges, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        inside = np.zeros(x.shape, dtype=bool)
+        cand = np.flatnonzero((y >= edges.ymin) & (y <= edges.ymax))
+        if len(cand) == 0 or len(edges.x0) == 0:
+            return inside
+
+        b = edges.bin(y[cand])
+        n = edges.starts[b + 1] - edges.starts[b]
+
+        # all pairs of points and edges in the bin of the point
+        p = np.repeat(cand, n)
+        e = edges.edges[np.repeat(edges.starts[b], n) + np.arange(len(p)) -
+                        np.repeat(np.cumsum(n) - n, n)]
+
+        px, py = x[p], y[p]
+        x0, y0, x1, y1 = edges.x0[e], edges.y0[e], edges.x1[e], edges.y1[e]
+
+        # the ray from the point towards +x crosses the edge if the edge
+        # straddles the point and the point is to the left of the (upwards)
+        # edge.
+        c = (x1 - x0) * (py - y0) - (px - x0) * (y1 - y0)
+        crosses = ((y0 > py) != (y1 > py)) & ((c > 0) == (y1 > y0))
+
+        inside[:] = np.bincount(p[crosses], minlength=len(x)) % 2 == 1
+        return inside
+
+
+backends = {
+    b.name: b
+    for b in (ShapelyBackend, ContainsXYBackend, CrossingNumberBackend)
+}
+
+default = ContainsXYBackend.name if shapely2 else ShapelyBackend.name
+
+
+def get_backend(name=None):
+    """
+    Backend by name, or the default backend (`contains_xy` with shapely 2,
+    otherwise `shapely`).
+    """
+    if name is None:
+        name = default
+
+    assert name in backends, "unknown backend: %s, available: %s" % (
+        name, ', '.join(backends))
+
+    return backends[name]()
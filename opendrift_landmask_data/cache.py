@@ -0,0 +1,318 @@
+import os
+import os.path
+import json
+import hashlib
+import socket
+import threading
+import time
+import uuid
+import logging
+logger = logging.getLogger(__name__)
+
+## files generated in the cache directory are named by a key: the hash of the
+## resource they are generated from and their format, so that files generated
+## by different versions of the package or the data can coexist. each file has
+## a sidecar (`<file>.json`) recording its key, size and modification time, so
+## that it can be checked without reading it.
+
+
+def stream_hash(fd, cachedir=None):
+    """
+    The sha256 of the open file `fd`. If `cachedir` is given the hash is
+    remembered there, keyed by the name, size and modification time of the
+    file, so that large files are only hashed once.
+    """
+    memo = None
+    if cachedir is not None and hasattr(fd, 'fileno'):
+        st = os.fstat(fd.fileno())
+        memo = os.path.join(
+            cachedir, '.%s.%d.%d.sha256' %
+            (os.path.basename(getattr(fd, 'name', 'stream')), st.st_size,
+             st.st_mtime_ns))
+        try:
+            with open(memo, 'r') as m:
+                return m.read().strip()
+        except OSError:
+            pass
+
+    logger.debug("hashing %s.." % getattr(fd, 'name', 'stream'))
+    h = hashlib.sha256()
+    for b in iter(lambda: fd.read(1 << 20), b''):
+        h.update(b)
+    h = h.hexdigest()
+
+    if memo is not None:
+        try:
+            write_atomic(memo, h.encode())
+        except OSError:
+            logger.debug("could not remember hash in %s" % memo)
+
+    return h
+
+
+def cache_key(source, fmt):
+    """
+    Key of a file generated from a resource with hash `source` in format
+    `fmt`.
+    """
+    return hashlib.sha256(
+        ('%s:%s' % (source, fmt)).encode()).hexdigest()[:16]
+
+
+def write_atomic(f, data):
+    """
+    Write `data` (bytes) to a temporary file next to `f` and rename it to `f`.
+    """
+    import tempfile
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(f),
+                                     delete=False) as fd:
+        fd.write(data)
+    try:
+        os.chmod(fd.name, 0o444)
+        os.rename(fd.name, f)
+    except:
+        os.unlink(fd.name)
+        raise
+
+
+def cached_file(f, key, write, suffix=''):
+    """
+    Generate the file `f` (with key `key`) unless it is valid already:
+    `write(fd)` writes it to a temporary file next to it, which is made
+    read-only, given its sidecar and renamed to `f`. The temporary file is
+    removed if any of this fails.
+
+    Other processes (perhaps on other nodes) generating the same file wait
+    for it, the lock is skipped if it cannot be created.
+
+    Returns:
+
+        True if `f` was generated
+    """
+    import tempfile
+
+    with FileLock(f + '.lock', optional=True):
+        if valid(f, key):
+            return False
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(f),
+                                         suffix=suffix,
+                                         delete=False) as fd:
+            try:
+                write(fd)
+            except:
+                os.unlink(fd.name)
+                raise
+
+        try:
+            os.chmod(fd.name, 0o444)
+            write_sidecar(f, fd.name, key)
+            os.rename(fd.name, f)
+        except:
+            os.unlink(fd.name)
+            raise
+
+    return True
+
+
+def sidecar(f):
+    return f + '.json'
+
+
+def write_sidecar(f, tmpf, key):
+    """
+    Write the sidecar of the file `f` that is about to be renamed from
+    `tmpf` (the rename keeps the size and modification time). Must be written
+    before renaming, so that `f` is never valid without it.
+    """
+    st = os.stat(tmpf)
+    write_atomic(
+        sidecar(f),
+        json.dumps({
+            'key': key,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns
+        }).encode())
+
+
+def valid(f, key):
+    """
+    The file `f` exists, and matches its sidecar and `key`.
+    """
+    try:
+        with open(sidecar(f), 'r') as fd:
+            meta = json.load(fd)
+        st = os.stat(f)
+    except (OSError, ValueError):
+        return False
+
+    ok = (meta.get('key') == key and meta.get('size') == st.st_size
+          and meta.get('mtime_ns') == st.st_mtime_ns)
+    if not ok:
+        logger.warning("cached file %s does not match its sidecar" % f)
+    return ok
+
+
+class FileLock:
+    """
+    Lock between processes, also on different hosts sharing the directory
+    (NFS), by exclusively creating a lock file (`O_CREAT | O_EXCL` is atomic
+    on NFS v3 and later, unlike `fcntl` locks which are not supported
+    everywhere).
+
+    The lock file records the host and process holding it, and its
+    modification time is refreshed while the lock is held. A lock held by a
+    process that no longer exists on this host, or that has not been refreshed
+    in `stale` seconds, is broken: the lock file is renamed away, and put back
+    if it turns out to be another file than the one found stale (the lock was
+    broken and taken by another process meanwhile).
+
+    An `optional` lock is skipped (as a context manager) if the lock file
+    cannot be created, e.g. in a read-only directory.
+    """
+
+    def __init__(self, f, stale=60., poll=.1, optional=False):
+        self.f = f
+        self.stale = stale
+        self.poll = poll
+        self.optional = optional
+        # unique to this lock, also within a process
+        self.owner = '%s %d %s' % (socket.gethostname(), os.getpid(),
+                                   uuid.uuid4().hex[:8])
+        self.held = threading.Event()
+        self.heartbeat = None
+
+    def __enter__(self):
+        try:
+            self.acquire()
+        except OSError:
+            if not self.optional:
+                raise
+            logger.warning("could not create lock file %s, not locking" %
+                           self.f)
+        return self
+
+    def __exit__(self, *args):
+        if self.held.is_set():
+            self.release()
+
+    def __try_acquire__(self):
+        try:
+            fd = os.open(self.f, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            stale = self.__stale__()
+            if stale is not None and self.__break__(stale):
+                return self.__try_acquire__()
+            return False
+
+        with os.fdopen(fd, 'w') as fd:
+            fd.write(self.owner)
+        return True
+
+    @staticmethod
+    def __identity__(f):
+        """
+        The inode, modification time and owner of the lock file `f`.
+        """
+        with open(f, 'r') as fd:
+            st = os.fstat(fd.fileno())
+            return (st.st_ino, st.st_mtime_ns, fd.read())
+
+    def __stale__(self):
+        """
+        The identity of the lock file if it is stale, or None.
+        """
+        try:
+            identity = self.__identity__(self.f)
+        except OSError:
+            return None
+
+        owner = identity[2]
+        age = time.time() - identity[1] / 1.e9
+        host, pid = (owner.split(' ') + [''])[:2]
+        dead = False
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                dead = True
+            except OSError:
+                pass
+
+        if dead or age > self.stale:
+            return identity
+        return None
+
+    def __break__(self, stale):
+        """
+        Break the lock file if it is still the `stale` one: another process
+        may have broken it and taken the lock since it was found stale.
+        """
+        logger.warning("breaking stale lock %s held by %s" %
+                       (self.f, stale[2]))
+        # only one of the processes breaking the lock succeeds in renaming it
+        # away.
+        broken = '%s.%s.broken' % (self.f, self.owner.replace(' ', '.'))
+        try:
+            os.rename(self.f, broken)
+        except OSError:
+            return False
+
+        try:
+            if self.__identity__(broken) == stale:
+                os.unlink(broken)
+                return True
+
+            # a fresh lock: put it back, unless yet another lock has been
+            # taken meanwhile
+            logger.warning("lock %s was taken by another process meanwhile" %
+                           self.f)
+            os.link(broken, self.f)
+        except OSError:
+            logger.exception("could not restore lock %s" % self.f)
+
+        try:
+            os.unlink(broken)
+        except OSError:
+            pass
+
+        return False
+
+    def acquire(self, blocking=True):
+        """
+        Returns:
+
+            True if the lock was acquired
+        """
+        while not self.__try_acquire__():
+            if not blocking:
+                return False
+            time.sleep(self.poll)
+
+        self.held.set()
+        self.heartbeat = threading.Thread(target=self.__refresh__,
+                                          daemon=True)
+        self.heartbeat.start()
+        return True
+
+    def __refresh__(self):
+        while self.held.is_set():
+            time.sleep(min(self.stale / 4., 5.))
+            if self.held.is_set():
+                try:
+                    os.utime(self.f)
+                except OSError:
+                    pass
+
+    def release(self):
+        self.held.clear()
+        try:
+            with open(self.f, 'r') as fd:
+                owner = fd.read()
+            if owner == self.owner:
+                os.unlink(self.f)
+            else:
+                logger.warning("lock %s was broken and is now held by %s" %
+                               (self.f, owner))
+        except OSError:
+            logger.warning("lock file %s already removed" % self.f)
@@ -0,0 +1,90 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+
+def rings(land):
+    """
+    Iterate over the exterior and interior rings of the polygons in `land` as
+    (n, 2) arrays of coordinates.
+    """
+    polys = land.geoms if hasattr(land, 'geoms') else [land]
+    for p in polys:
+        yield np.asarray(p.exterior.coords)
+        for i in p.interiors:
+            yield np.asarray(i.coords)
+
+
+def coastline_rasterize(land, invtransform, out, eps=1.e-6, chunk=1000000):
+    """
+    Mark the cells touched by the boundary of the polygons in `land` in the
+    bit-packed mask `out` (same layout as the landmask).
+
+    Each segment of the boundary is split up in pieces no longer than a cell,
+    and the cells of the bounding box of each piece (padded by `eps` cells) are
+    marked. This marks every cell the boundary passes through, including cells
+    it only touches along an edge or corner, and occasionally a neighbouring
+    cell: cells are never missed.
+
+    Args:
+
+        land (MultiPolygon): land polygons
+
+        invtransform (Affine): transform from lon, lat to cell coordinates
+
+        out (array): bit-packed (ny, nx // 8) uint8 array to mark cells in
+
+        eps (float): padding of the bounding box of each piece, in cells
+
+        chunk (int): number of vertices to process at the time
+    """
+    ny, nxp = out.shape
+    nx = nxp * 8
+    flat = out.reshape(-1)
+
+    def mark(rs):
+        xy = np.concatenate(rs)
+        xm, ym = invtransform * (xy[:, 0], xy[:, 1])
+
+        # split segments into pieces no longer than a cell, segments between
+        # the last vertex of one ring and the first of the next are dropped.
+        dxm = np.diff(xm)
+        dym = np.diff(ym)
+        n = np.ceil(np.maximum(np.abs(dxm), np.abs(dym))).astype(np.int64)
+        n = np.maximum(n, 1)
+        n[np.cumsum([len(r) for r in rs[:-1]], dtype=np.int64) - 1] = 0
+        seg = np.repeat(np.arange(len(n)), n)
+        t = np.arange(len(seg)) - np.repeat(np.cumsum(n) - n, n)
+
+        x0 = xm[:-1][seg] + dxm[seg] * t / n[seg]
+        y0 = ym[:-1][seg] + dym[seg] * t / n[seg]
+        x1 = xm[:-1][seg] + dxm[seg] * (t + 1) / n[seg]
+        y1 = ym[:-1][seg] + dym[seg] * (t + 1) / n[seg]
+
+        cx0 = np.floor(np.minimum(x0, x1) - eps).astype(np.int64)
+        cx1 = np.floor(np.maximum(x0, x1) + eps).astype(np.int64)
+        cy0 = np.floor(np.minimum(y0, y1) - eps).astype(np.int64)
+        cy1 = np.floor(np.maximum(y0, y1) + eps).astype(np.int64)
+
+        # a piece spans at most three cells along each axis
+        for ox in range(3):
+            for oy in range(3):
+                s = (cx0 + ox <= cx1) & (cy0 + oy <= cy1)
+                cx = np.clip(cx0[s] + ox, 0, nx - 1)
+                cy = np.clip(cy0[s] + oy, 0, ny - 1)
+                np.bitwise_or.at(flat, cy * nxp + (cx >> 3),
+                                 (0x80 >> (cx & 7)).astype(np.uint8))
+
+    buf = []
+    nbuf = 0
+    for r in rings(land):
+        buf.append(r)
+        nbuf += len(r)
+
+        if nbuf >= chunk:
+            mark(buf)
+            buf = []
+            nbuf = 0
+
+    if buf:
+        mark(buf)
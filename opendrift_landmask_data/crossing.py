@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def traverse(u0, v0, u1, v1, nx, ny):
+    """
+    Cells crossed by the segments from (u0, v0) to (u1, v1), in (continuous)
+    cell coordinates, in order along each segment.
+
+    The segments are split where they cross the grid lines, each piece lies
+    in a single cell.
+
+    Args:
+
+        u0, v0, u1, v1 (arrays): start and end of segments
+
+        nx, ny (int): size of grid, the grid wraps around along x (segments
+        go the short way round, cells are taken modulo `nx`) and cells are
+        clamped along y
+
+    Returns:
+
+        seg (array): index of segment of each piece, sorted
+
+        t0, t1 (arrays): start and end of each piece, as fraction of segment
+
+        cx, cy (arrays): cell of each piece
+    """
+    # shortest way round along x, u1 may end up outside the grid
+    du = (u1 - u0 + .5 * nx) % nx - .5 * nx
+    u1 = u0 + du
+    dv = v1 - v0
+    fu0 = np.floor(u0)
+    fv0 = np.floor(v0)
+
+    nu = np.abs(np.floor(u1) - fu0).astype(np.int64)
+    nv = np.abs(np.floor(v1) - fv0).astype(np.int64)
+    n = len(u0)
+
+    def crossings(nc, f0, p0, d):
+        # parameter at which each segment crosses successive grid lines
+        seg = np.repeat(np.arange(n), nc)
+        k = np.arange(len(seg)) - np.repeat(np.cumsum(nc) - nc, nc) + 1
+        g = np.where(d[seg] > 0, f0[seg] + k, f0[seg] - k + 1)
+        return seg, (g - p0[seg]) / d[seg]
+
+    su, tu = crossings(nu, fu0, u0, du)
+    sv, tv = crossings(nv, fv0, v0, dv)
+
+    seg = np.concatenate((np.arange(n), su, sv))
+    t0 = np.concatenate((np.zeros(n), tu, tv))
+
+    order = np.lexsort((t0, seg))
+    seg = seg[order]
+    t0 = t0[order]
+
+    # each piece ends where the next starts
+    t1 = np.ones(t0.shape)
+    same = seg[1:] == seg[:-1]
+    t1[:-1][same] = t0[1:][same]
+
+    tm = .5 * (t0 + t1)
+    cx = (np.floor(u0[seg] + du[seg] * tm) % nx).astype(np.int32)
+    cy = np.clip(np.floor(v0[seg] + dv[seg] * tm), 0, ny - 1).astype(np.int32)
+
+    return seg, t0, t1, cx, cy
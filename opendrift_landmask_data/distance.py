@@ -0,0 +1,103 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+
+def coarsen(mask, factor, rows=512):
+    """
+    Coarsen the bit-packed mask by `factor` in both directions, a coarse
+    cell is land if any of its cells are land.
+
+    Args:
+
+        mask (array): bit-packed (ny, nx // 8) mask
+
+        factor (int): coarsening factor, must divide ny and nx
+
+        rows (int): number of mask rows to unpack at the time
+
+    Returns:
+
+        (ny // factor, nx // factor) array of bools
+    """
+    ny, nxp = mask.shape
+    nx = nxp * 8
+    rows = rows // factor * factor
+
+    land = np.empty((ny // factor, nx // factor), dtype=bool)
+    for r in range(0, ny, rows):
+        m = mask[r:r + rows, :]
+        c = land[r // factor:(r + len(m)) // factor, :]
+
+        if 8 % factor == 0:
+            # combine rows and test groups of bits in each byte directly
+            m = np.bitwise_or.reduce(m.reshape(-1, factor, nxp), axis=1)
+            g = 8 // factor
+            for i in range(g):
+                bits = ((1 << factor) - 1) << (8 - factor * (i + 1))
+                c[:, i::g] = (m & bits) != 0
+        else:
+            m = np.unpackbits(m, axis=1).astype(bool)
+            c[:] = m.reshape(len(m) // factor, factor, nx // factor,
+                             factor).any(axis=(1, 3))
+
+    return land
+
+
+def distance_rasterize(land, transform, out, maxd, unit, band=128):
+    """
+    Distance from each cell to the nearest land cell (between cell centers),
+    in metres, using an euclidean distance transform. Requires `scipy`.
+
+    The grid is processed in bands of rows, with enough rows and columns
+    (wrapping around in longitude) of neighbouring land to find all distances
+    up to `maxd`. Cells are `dx * cos(latitude)` by `dy` in size, with
+    `cos(latitude)` taken at the center of each band.
+
+    Args:
+
+        land (array): (ny, nx) array of bools, True on land
+
+        transform (Affine): transform from cells to lon, lat
+
+        out (array): (ny, nx) uint16 array, distances in units of `unit`. Zero on land, saturates at `maxd`.
+
+        maxd (float): maximum distance, in metres
+
+        unit (float): unit of `out`, in metres
+
+        band (int): number of rows in each band
+    """
+    from scipy.ndimage import distance_transform_edt
+
+    ny, nx = land.shape
+    dym = transform.e * 1852. * 60.
+    dxm = transform.a * 1852. * 60.
+    cap = int(np.ceil(maxd / unit))
+
+    hy = int(np.ceil(maxd / dym))  # halo rows
+
+    for r0 in range(0, ny, band):
+        r1 = min(r0 + band, ny)
+
+        _, lat0 = transform * (0, r0)
+        _, lat1 = transform * (0, r1)
+        coslat = np.cos(np.radians(.5 * (lat0 + lat1)))
+        mincos = max(np.cos(np.radians(max(abs(lat0), abs(lat1)))), 1.e-6)
+
+        h0 = max(r0 - hy, 0)
+        h1 = min(r1 + hy, ny)
+        hx = min(int(np.ceil(maxd / (dxm * mincos))) + 1, nx // 2)
+
+        b = land[h0:h1, :]
+        if not b.any():
+            out[r0:r1, :] = cap
+            continue
+
+        # wrap around in longitude
+        b = np.concatenate((b[:, -hx:], b, b[:, :hx]), axis=1)
+
+        d = distance_transform_edt(~b, sampling=(dym, dxm * coslat))
+        d = d[r0 - h0:r1 - h0, hx:hx + nx]
+
+        out[r0:r1, :] = np.minimum(np.round(d / unit), cap).astype(np.uint16)
@@ -3,9 +3,19 @@ import os.path
 shapes = os.path.join(os.path.dirname(__file__), 'shapes') + os.path.sep
 
 
-def get_gshhs_f():
+def get_gshhs(resolution='f'):
     from pkg_resources import resource_stream
     f = os.path.join(
         'shapes',
-        'gshhs_%s_-180.000000E-90.000000N180.000000E90.000000N.wkb' % 'f')
+        'gshhs_%s_-180.000000E-90.000000N180.000000E90.000000N.wkb' %
+        resolution)
+    if not os.path.exists(os.path.join(os.path.dirname(__file__), f)):
+        raise FileNotFoundError(
+            "no polygons for resolution '%s' (%s): generate them with "
+            "`python -m opendrift_landmask_data.regenerate %s`" %
+            (resolution, f, resolution))
     return resource_stream(__name__, f)
+
+
+def get_gshhs_f():
+    return get_gshhs('f')
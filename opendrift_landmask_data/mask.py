@@ -10,6 +10,54 @@ import logging
 logger = logging.getLogger(__name__)
 import threading
 import weakref
+from .backends import get_backend
+from .stats import Stats, NullStats
+from .cache import stream_hash, cache_key, cached_file, write_sidecar, valid, FileLock
+
+
+class LandPolygons:
+    """
+    Land polygons, shared between `Landmask` instances. The polygons are
+    parsed (or filtered by extent) and prepared on first use.
+    """
+    extent = None
+
+    def __init__(self, source, extent=None):
+        """
+        Args:
+
+            source (callable): returns the land polygons (MultiPolygon)
+
+            extent (array): [xmin, ymin, xmax, ymax], only keep polygons intersecting extent
+        """
+        self.source = source
+        self.lock = threading.Lock()
+        self.__polys__ = None
+        self.__land__ = None
+
+        if extent:
+            self.extent = shapely.prepared.prep(box(*extent))
+
+    def __load__(self):
+        with self.lock:
+            if self.__polys__ is None:
+                polys = self.source()
+                if self.extent is not None:
+                    polys = MultiPolygon(
+                        [l for l in polys.geoms if self.extent.intersects(l)])
+
+                self.__land__ = shapely.prepared.prep(polys)
+                self.__polys__ = polys
+
+    @property
+    def polys(self):
+        self.__load__()
+        return self.__polys__
+
+    @property
+    def land(self):
+        self.__load__()
+        return self.__land__
 
 
 class Landmask:
@@ -25,19 +73,140 @@ class Landmask:
     dx = float(extent[1] - extent[0]) / nx
     dy = float(extent[3] - extent[2]) / ny
 
-    polys = None
-    land = None
+    ## the mask is bit-packed along x: 8 cells per byte, most significant bit
+    ## first (as `np.packbits`).
+    nxp = nx // 8
+
+    ## resolution of the coastline (GSHHS: crude, low, intermediate, high and
+    ## full) and the size of the cells of the matching mask in nm. each
+    ## resolution is a subclass (see `for_resolution`) with its own grid, cache
+    ## files and loaded data.
+    resolutions = {'c': 4., 'l': 2., 'i': 1., 'h': .5, 'f': .25}
+    resolution = 'f'
+    __resolution_classes__ = {}
+
+    ## the masks of the resolutions, generated with `python -m
+    ## opendrift_landmask_data.rasterize`. only the mask of 'f' is shipped.
+    masksdir = os.path.join(os.path.dirname(__file__), 'masks')
+
+    ## summary pyramid of the mask: blocks of 512 x 512 cells at the finest
+    ## level, and 2 x 2 blocks of the level below for each coarser level.
+    WATER = 0
+    LAND = 1
+    MIXED = 2
+    pyramid_shift = 9
+    pyramid = None  # list of levels, finest first
+
+    ## polygons are loaded once and shared between instances, the polygons of
+    ## the world and the polygons filtered by extent (keyed by extent) are
+    ## released when no instance uses them anymore.
+    __polygons__ = lambda: None  # class weakreffed polygons of the world
+    __extent_polygons__ = weakref.WeakValueDictionary()
+    polygons = None  # instance ref to polygons
+    polygons_lock = threading.Lock()
+
     __mask__ = lambda: None  # class weakreffed mask
     mask = None  # instance ref to mask
+
+    ## the mask is shipped as compressed tiles of the blocks of the pyramid.
+    ## the tiles are decompressed in parallel on `generation_workers` threads
+    ## (default: number of CPUs) when generating the memmapped mask.
+    ## alternatively the mask is read directly from the tiles, decompressing
+    ## them on first use. at most 64 MB of decompressed tiles are kept.
+    storage = 'memmap'
+    tiled_cache = 64 << 20
+    generation_workers = None
+    __tiled__ = lambda: None  # class weakreffed tiled mask
+
+    ## cells crossed by the coastline, bit-packed like the mask. land cells
+    ## that are not crossed by the coastline are certainly land and are not
+    ## checked against the polygons. generated from the polygons on first
+    ## use, and stored like the mask: memmapped, or with `storage='tiles'` as
+    ## compressed tiles of the blocks of the pyramid crossed by the coastline
+    ## (nothing decompressed is left on disk).
+    __coast__ = lambda: None  # class weakreffed coast cells
+    coast = None  # instance ref to coast cells
+
+    ## the polygons clipped to tiles of 128 x 128 cells, coastline cells are
+    ## checked against the fragment in their tile. generated from the
+    ## polygons on first use.
+    tile_shift = 7
+    __tiles__ = lambda: None  # class weakreffed tile index
+    tiles = None  # instance ref to tile index
+
+    ## land cells crossed by the coastline subdivided into quadrants down to
+    ## `quadtree_depth` levels, used instead of the polygons with
+    ## `refine='quadtree'`. generated from the polygons on first use. at
+    ## depth 6 points are misclassified only within 10 m (the diagonal of 7 m
+    ## quadrants) of the coastline, and the file is about 100 bytes per
+    ## coastal cell (some 200 MB for 'f'). each level less doubles the error
+    ## and halves the size: depth 4 is 41 m and about 30 bytes per coastal
+    ## cell.
+    quadtree_depth = 6
+    quadtree_format = 'quadtree-2'
+    __quadtree__ = lambda: None  # class weakreffed quadtree
+    quadtree = None  # instance ref to quadtree
+
+    ## distance to the nearest land, on a grid of 4 x 4 cells (1 nm), in units
+    ## of 10 m up to 100 km. generated from the mask on first use.
+    distance_factor = 4
+    distance_unit = 10.
+    distance_max = 100000.
+    __distance__ = lambda: None  # class weakreffed distance raster
+    distance = None  # instance ref to distance raster
+
+    ## summed-area table of the land cells of the mask in blocks of 8 x 8
+    ## cells (2 nm), for the land fraction of boxes. generated from the mask on
+    ## first use.
+    sat_block = 8
+    __sat__ = lambda: None  # class weakreffed summed-area table
+    sat = None  # instance ref to summed-area table
+
+    ## water cells next to land, indexed for finding the nearest water cell
+    ## of points on land. the cells are generated from the mask on first use.
+    nearest_format = 'coastal-water-1'
+    __nearest__ = lambda: None  # class weakreffed index of water cells
+    nearest = None  # instance ref to index of water cells
     transform = None
     invtransform = None
 
-    tmpdir = os.path.join(tempfile.gettempdir(), 'landmask')
-    DEFAULT_MMAPF = os.path.join(tmpdir, 'mask.dat')
-    mmapf = os.path.join(tmpdir, 'mask.dat')
-    lockf = os.path.join(tmpdir, '.mask.dat.lock')
+    ## generated files are cached in `tmpdir` (set LANDMASK_CACHE to use
+    ## another directory, e.g. one shared between the nodes of a cluster).
+    ## the files are named by the hash of the resource they are generated
+    ## from and their format, so that files of different versions coexist
+    ## (see `cache`). bump the format when changing how a file is generated.
+    tmpdir = os.environ.get('LANDMASK_CACHE',
+                            os.path.join(tempfile.gettempdir(), 'landmask'))
+    mask_format = 'packed-1'
+    coast_format = 'coast-1'
+    tiles_format = 'tiles-1-%d' % tile_shift
+    distance_format = 'distance-1-%d-%g-%g' % (distance_factor, distance_unit,
+                                               distance_max)
+    sat_format = 'sat-1-%d' % sat_block
+    mask_key = None
+    distance_key = None
+    sat_key = None
+    nearest_key = None
+    polygons_source = None  # hash of polygons
+    coast_key = None
+    tiles_key = None
+    DEFAULT_MMAPF = None
+    mmapf = None
+    lockf = None
+    coastf = None
+    tilesf = None
+    distancef = None
+    satf = None
+    nearestf = None
 
     tmpmask = None
+    tmpcoast = None
+
+    ## parallel checking of points, in chunks
+    workers = 1
+    chunksize = 1 << 20
+    pool = None  # pool of processes checking polygons
+    backend = None  # backend checking points against polygons
 
     __concurrency_delay__ = 0
     __concurrency_abort__ = False
@@ -45,32 +214,242 @@ class Landmask:
     __fake_32_bit__ = False
     generation_lock = threading.Lock()
 
-    @staticmethod
-    def get_mask():
-        from pkg_resources import resource_stream
-        masktif = os.path.join('masks', 'mask_%.2f_nm.mm.xz' % Landmask.dnm)
-        return resource_stream(__name__, masktif)
+    ## loaded data and cache files, each resolution has its own (see
+    ## `for_resolution`). class weakrefs and cache files added above must be
+    ## listed here.
+    __resolution_attributes__ = (
+        'pyramid',
+        '__polygons__',
+        '__extent_polygons__',
+        '__mask__',
+        '__tiled__',
+        '__coast__',
+        '__tiles__',
+        '__quadtree__',
+        '__distance__',
+        '__sat__',
+        '__nearest__',
+        'mask_key',
+        'distance_key',
+        'sat_key',
+        'nearest_key',
+        'polygons_source',
+        'coast_key',
+        'tiles_key',
+        'DEFAULT_MMAPF',
+        'mmapf',
+        'lockf',
+        'coastf',
+        'tilesf',
+        'distancef',
+        'satf',
+        'nearestf',
+        'tmpmask',
+        'tmpcoast',
+    )
+
+    @classmethod
+    def for_resolution(cls, resolution):
+        """
+        The subclass of `Landmask` for `resolution` ('c', 'l', 'i', 'h' or
+        'f'), with the grid of the matching mask and its own cache files and
+        loaded data.
+        """
+        assert resolution in Landmask.resolutions, "unknown resolution: %s" % resolution
+        if resolution == Landmask.resolution:
+            return Landmask
+
+        sub = Landmask.__resolution_classes__.get(resolution)
+        if sub is None:
+            dnm = Landmask.resolutions[resolution]
+            nx = int(round(2 * 180 * 60 / dnm))
+            ny = int(round(2 * 90 * 60 / dnm))
+
+            attributes = {
+                'resolution': resolution,
+                'nx': nx,
+                'ny': ny,
+                'dnm': dnm,
+                'dm': dnm * 1852.,
+                'dx': 360. / nx,
+                'dy': 180. / ny,
+                'nxp': nx // 8,
+            }
+
+            # empty class weakrefs and dicts, and no files
+            for name in Landmask.__resolution_attributes__:
+                value = getattr(Landmask, name)
+                if isinstance(value, weakref.WeakValueDictionary):
+                    attributes[name] = weakref.WeakValueDictionary()
+                elif callable(value):
+                    attributes[name] = lambda: None
+                else:
+                    attributes[name] = None
 
-    @staticmethod
-    def get_transform():
+            sub = type('Landmask_%s' % resolution, (Landmask, ), attributes)
+            Landmask.__resolution_classes__[resolution] = sub
+
+        return sub
+
+    def __new__(cls, *args, resolution=None, **kwargs):
+        if resolution is not None:
+            cls = cls.for_resolution(resolution)
+        return super().__new__(cls)
+
+    @classmethod
+    def get_mask_file(cls, name):
+        """
+        Open the file `name` of the mask of this resolution in `masksdir`.
+        """
+        f = os.path.join(cls.masksdir, name)
+        if not os.path.exists(f):
+            raise FileNotFoundError(
+                "no mask for resolution '%s' (%s): generate the polygons with "
+                "`python -m opendrift_landmask_data.regenerate %s` and the "
+                "mask with `python -m opendrift_landmask_data.rasterize %s`" %
+                (cls.resolution, f, cls.resolution, cls.resolution))
+        return open(f, 'rb')
+
+    @classmethod
+    def get_tiled_mask(cls):
+        return cls.get_mask_file('mask_%.2f_nm.tiles.npz' % cls.dnm)
+
+    @classmethod
+    def get_pyramid(cls):
+        return cls.get_mask_file('pyramid_%.2f_nm.npz' % cls.dnm)
+
+    @classmethod
+    def get_cache_file(cls, name, key, ext='.dat'):
+        return os.path.join(cls.tmpdir, '%s.%s%s' % (name, key, ext))
+
+    @classmethod
+    def get_mmapf(cls):
+        """
+        The memmapped mask in the cache directory.
+        """
+        if cls.mask_key is None:
+            with cls.get_tiled_mask() as fd:
+                cls.mask_key = cache_key(stream_hash(fd),
+                                              cls.mask_format)
+
+        return cls.get_cache_file('mask_packed', cls.mask_key)
+
+    def __cache_files__(self):
+        if type(self).DEFAULT_MMAPF is None:
+            type(self).DEFAULT_MMAPF = self.get_mmapf()
+            type(self).mmapf = type(self).DEFAULT_MMAPF
+            type(self).lockf = type(self).mmapf + '.lock'
+            type(self).distance_key = cache_key(self.mask_key,
+                                              self.distance_format)
+            type(self).distancef = self.get_cache_file('distance',
+                                                     self.distance_key)
+            type(self).sat_key = cache_key(self.mask_key, self.sat_format)
+            type(self).satf = self.get_cache_file('sat', self.sat_key)
+            type(self).nearest_key = cache_key(self.mask_key,
+                                             self.nearest_format)
+            type(self).nearestf = self.get_cache_file('coastal_water',
+                                                    self.nearest_key, '.npy')
+
+    def __polygons_cache_files__(self):
+        if type(self).polygons_source is None:
+            from .gshhs import get_gshhs
+            with get_gshhs(self.resolution) as fd:
+                # the hash of the (large) polygons is remembered in the cache
+                # directory
+                type(self).polygons_source = stream_hash(
+                    fd, self.tmpdir if os.path.isdir(self.tmpdir) else None)
+
+            type(self).coast_key = cache_key(self.polygons_source,
+                                           self.coast_format)
+            type(self).coastf = self.get_cache_file('coast_packed',
+                                                  self.coast_key)
+            type(self).tiles_key = cache_key(self.polygons_source,
+                                           self.tiles_format)
+            type(self).tilesf = self.get_cache_file('coast_tiles',
+                                                  self.tiles_key, '.npz')
+
+    @classmethod
+    def get_transform(cls):
         from affine import Affine
         x = [-180, 180]
         y = [-90, 90]
-        resx = float(x[1] - x[0]) / Landmask.nx
-        resy = float(y[1] - y[0]) / Landmask.ny
+        resx = float(x[1] - x[0]) / cls.nx
+        resy = float(y[1] - y[0]) / cls.ny
         return Affine.translation(x[0] - resx / 2,
                                   y[0] - resy / 2) * Affine.scale(resx, resy)
 
-    @staticmethod
-    def get_inverse_transform():
-        return ~Landmask.get_transform()
+    @classmethod
+    def get_inverse_transform(cls):
+        return ~cls.get_transform()
+
+    @classmethod
+    def get_distance_transform(cls):
+        from affine import Affine
+        return cls.get_transform() * Affine.scale(
+            cls.distance_factor)
 
     def __32_bit__(self):
         import sys
         return sys.maxsize <= 2**32 or self.__fake_32_bit__
 
+    def __cached__(self, f, key):
+        """
+        `f` is a valid file in the cache directory, or a file generated in a
+        temporary location by this process.
+        """
+        if os.path.dirname(f) != self.tmpdir:
+            return os.path.exists(f)
+        return valid(f, key)
+
+    def __make_tmpdir__(self):
+        try:
+            os.makedirs(self.tmpdir, exist_ok=True)
+        except OSError:
+            logger.warning("could not create cache directory %s" % self.tmpdir)
+
+    def __cache_file__(self, f, key, write, suffix=''):
+        """
+        Generate the file `f` with `write(fd)` unless it is cached (see
+        `cached_file`). Called holding `generation_lock`.
+        """
+        if not self.__cached__(f, key):
+            self.__make_tmpdir__()
+            cached_file(f, key, write, suffix)
+
+    def __cache_object__(self, f, key, build, save, suffix=''):
+        """
+        Build an object and save it with `save(object, fd)` to the file `f`,
+        unless it is cached. If it cannot be saved (e.g. the cache directory
+        is not writable) it is kept in memory only. Called holding
+        `generation_lock`.
+
+        Returns:
+
+            the object if built, or None if it is to be loaded from `f`.
+        """
+        building = []
+        built = []
+
+        def write(fd):
+            building.append(True)
+            built.append(build())
+            save(built[0], fd)
+
+        try:
+            self.__cache_file__(f, key, write, suffix)
+        except Exception:
+            if building and not built:
+                raise
+
+            if not built:
+                built.append(build())
+            logger.exception("could not save %s, keeping it in memory only." %
+                             f)
+
+        return built[0] if built else None
+
     def __mask_exists__(self):
-        return os.path.exists(self.mmapf)
+        return self.__cached__(self.mmapf, self.mask_key)
 
     def __check_permissions__(self):
         if self.__mask_exists__():
@@ -81,13 +460,6 @@ class Landmask:
                     )
                     os.chmod(self.mmapf, 0o444)
 
-                if os.path.exists(self.lockf) and not os.stat(
-                        self.lockf).st_mode & 0o777 == 0o777:
-                    logger.warning(
-                        "permissions too restrictive on landmask lock file, trying to relax."
-                    )
-                    os.chmod(self.lockf, 0o777)
-
             except:
                 logger.exception(
                     "could not verify read permissions for group and others on landmask."
@@ -98,19 +470,17 @@ class Landmask:
             logger.warning("mask already exists, aborting generation..")
             return
 
-        try:
-            fd = tempfile.NamedTemporaryFile(delete=temporary)
-            if temporary:
-                mask = fd.name
-                Landmask.tmpmask = fd  # keep handle around and delete on destruct
-            else:
-                mask = self.DEFAULT_MMAPF
+        # not through `cached_file`: the generation already holds the lock
+        # of the mask. the temporary file is removed if generation fails.
+        fd = tempfile.NamedTemporaryFile(dir=None if temporary else self.tmpdir,
+                                         delete=temporary)
+        mask = fd.name if temporary else self.DEFAULT_MMAPF
 
+        try:
             logger.info("decompressing memmap landmask to %s.." % mask)
 
-            import lzma, shutil
-            with lzma.open(self.get_mask(), 'rb') as zmask:
-                shutil.copyfileobj(zmask, fd)
+            with self.__stats__.time('init.decompress'):
+                self.__tiled_mask__().write(fd, self.generation_workers)
             fd.flush()
 
             if self.__concurrency_delay__ > 0:
@@ -123,57 +493,58 @@ class Landmask:
                 logger.error("concurrency testing: landmask aborted (planned)")
                 fd.close()
                 os.unlink(fd.name)
+                return
 
-            else:
-                if not temporary:
-                    fd.close()
-                    os.rename(fd.name, mask)
-
-                try:
-                    os.chmod(mask, 0o444)
-                except:
-                    logger.exception(
-                        "could not set read permissions for group and others on landmask."
-                    )
-
-                Landmask.mmapf = mask
-                logger.info("landmask generated")
+            if not temporary:
+                fd.close()
+                write_sidecar(mask, fd.name, self.mask_key)
+                os.rename(fd.name, mask)
 
         except:
             logger.exception("failed to generate landmask")
+            fd.close()
+            if not temporary and os.path.exists(fd.name):
+                os.unlink(fd.name)
             raise
 
+        if temporary:
+            type(self).tmpmask = fd  # keep handle around and delete on destruct
+
+        try:
+            os.chmod(mask, 0o444)
+        except:
+            logger.exception(
+                "could not set read permissions for group and others on landmask."
+            )
+
+        type(self).mmapf = mask
+        logger.info("landmask generated")
+
     def __generate__(self):
         if not os.path.exists(self.tmpdir):
             os.makedirs(self.tmpdir)
 
         if self.generation_lock.acquire(blocking=False):
             try:
-                import fcntl
+                # try to get non-blocking lock, if fail, another process
+                # (perhaps on another node sharing the cache directory) is
+                # presumably generating the landmask. so we wait.
+                lock = FileLock(self.lockf)
+                logger.info("locking landmask for generation..")
 
-                with open(self.lockf, 'w') as fd:
+                if lock.acquire(blocking=False):
                     try:
-                        os.chmod(self.lockf, 0o777)
-                    except:
-                        logger.warning("could not permissions for lock file.")
-
-                    # try to get non-blocking lock, if fail, another process is presumably generating the
-                    # landmask. so we wait.
-                    try:
-                        logger.info("locking landmask for generation..")
-                        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-
                         # we got the lock, now generate mask
                         self.__generate_impl__()
+                    finally:
+                        lock.release()
 
-                    except OSError:
-                        # file already locked
-                        logger.warn(
-                            "landmask is being generated in another process, waiting for it to complete.."
-                        )
-
-                        fcntl.lockf(fd, fcntl.LOCK_EX)  # blocks
+                else:
+                    logger.warn(
+                        "landmask is being generated in another process, waiting for it to complete.."
+                    )
 
+                    with lock:  # blocks
                         logger.info(
                             "landmask generation done in another process, attempting to load.."
                         )
@@ -186,12 +557,6 @@ class Landmask:
                             # we already have lock
                             self.__generate_impl__()
 
-            except ImportError:
-                logger.error(
-                    "fcntl not available on this platform, concurrent generations of landmask (different threads or processes) might cause failing landmask generation. Make sure only one instance of landmask is running on the system the first time."
-                )
-                self.__generate_impl__()
-
             except:
                 logger.exception(
                     "failed to generate landmask: re-trying to create landmask in temporary location."
@@ -215,39 +580,70 @@ class Landmask:
                 "landmask generation done in another thread, attempting to load.."
             )
 
+    def __load_packed__(self, f, dtype='uint8', shape=None):
+        if shape is None:
+            shape = (type(self).ny, type(self).nxp)
+
+        if not self.__32_bit__():
+            m = np.memmap(f, dtype=dtype, mode='r', shape=shape)
+            # points are looked up all over the place, readahead only wastes
+            # reads
+            self.__madvise__(m, 'MADV_RANDOM')
+            return m
+        else:
+            logger.warning(
+                "cannot memorymap mask on 32-bit system, loading into memory.."
+            )
+            with open(f, 'rb') as fd:
+                logger.debug('reading into buffer..')
+                buffer = fd.read()
+                logger.debug('constructing array..')
+                return np.ndarray.__new__(np.ndarray,
+                                          buffer=buffer,
+                                          dtype=dtype,
+                                          shape=shape)
+
+    @staticmethod
+    def __madvise__(m, advice, rows=None):
+        """
+        Advise the kernel how rows r0:r1 (or all) of the memmapped array `m`
+        will be accessed (`advice` is the name of one of the `mmap.MADV_*`
+        constants). Ignored where not supported.
+        """
+        import mmap
+        mm = getattr(m, '_mmap', None)
+        advice = getattr(mmap, advice, None)
+        if mm is None or advice is None or not hasattr(mm, 'madvise'):
+            return
+
+        if rows is None:
+            start, length = 0, len(mm)
+        else:
+            start = rows[0] * m.strides[0]
+            start -= start % mmap.PAGESIZE
+            length = min(rows[1] * m.strides[0], len(mm)) - start
+
+        try:
+            mm.madvise(advice, start, length)
+        except OSError as ex:
+            logger.debug("madvise failed: %s" % ex)
+
     def __memmap_mask__(self):
-        self.mask = Landmask.__mask__()
+        self.mask = type(self).__mask__()
         if self.mask is None:
             try:
                 logger.debug("memmapping mask..")
-                Landmask.generation_lock.acquire(True)
-                if not self.__32_bit__():
-                    self.mask = np.memmap(self.mmapf,
-                                          dtype='uint8',
-                                          mode='r',
-                                          shape=(Landmask.ny, Landmask.nx))
-                else:
-                    logger.warning(
-                        "cannot memorymap mask on 32-bit system, loading into memory.."
-                    )
-                    with open(self.mmapf, 'rb') as fd:
-                        logger.debug('reading into buffer..')
-                        buffer = fd.read()
-                        logger.debug('constructing array..')
-                        self.mask = np.ndarray.__new__(np.ndarray,
-                                                       buffer=buffer,
-                                                       dtype='uint8',
-                                                       shape=(Landmask.ny,
-                                                              Landmask.nx))
-
-                Landmask.__mask__ = weakref.ref(self.mask)
+                type(self).generation_lock.acquire(True)
+                self.mask = self.__load_packed__(self.mmapf)
+
+                type(self).__mask__ = weakref.ref(self.mask)
 
                 # XXX: It seems that when the mask is generated in a
                 # temp-location because of failing normal generation, the
                 # weakref is not collected. At least not immediately.
-                Landmask.generation_lock.release()
+                type(self).generation_lock.release()
             except:
-                Landmask.generation_lock.release()
+                type(self).generation_lock.release()
                 raise
         else:
             logger.debug("mask already memmapped")
@@ -269,9 +665,483 @@ class Landmask:
             else:
                 raise
 
+    def __tiled_mask__(self):
+        """
+        The tiled mask, loaded if not already in use.
+        """
+        tiled = type(self).__tiled__()
+        if tiled is None:
+            from .tiledmask import TiledMask
+
+            logger.debug("loading tiled mask..")
+            level = self.pyramid[0]
+            with self.get_tiled_mask() as fd:
+                tiled = TiledMask.load(
+                    fd, np.where(level == self.LAND, 0xff, 0).astype(np.uint8),
+                    self.tiled_cache)
+
+            type(self).__tiled__ = weakref.ref(tiled)
+        else:
+            logger.debug("tiled mask already loaded")
+
+        return tiled
+
+    def __open_tiled_mask__(self):
+        self.mask = self.__tiled_mask__()
+
+    def __write_coast__(self, fd):
+        logger.info("classifying coastline cells of landmask..")
+        from .coast import coastline_rasterize
+
+        coast = np.memmap(fd,
+                          dtype='uint8',
+                          mode='w+',
+                          shape=(type(self).ny, type(self).nxp))
+        coastline_rasterize(self.__world__().polys, self.invtransform, coast)
+        coast.flush()
+        del coast
+        fd.flush()
+
+        logger.info("coastline cells generated")
+
+    def __build_tiled_coast__(self, fill):
+        """
+        Generate the coast cells in an unnamed temporary file, and compress
+        the blocks of the pyramid crossed by the coastline.
+        """
+        from .tiledmask import TiledMask
+
+        shape = (type(self).ny, type(self).nxp)
+        cols = (1 << self.pyramid_shift) // 8
+        mixed = np.zeros(fill.shape, dtype=bool)
+
+        with tempfile.TemporaryFile() as fd:
+            self.__write_coast__(fd)
+            coast = np.memmap(fd, dtype='uint8', mode='r', shape=shape)
+
+            rows = 1 << self.pyramid_shift
+            for i in range(mixed.shape[0]):
+                band = coast[i * rows:(i + 1) * rows, :].any(axis=0)
+                mixed[i, :] = np.logical_or.reduceat(
+                    band, np.arange(0, shape[1], cols))
+
+            tiled = TiledMask.build(coast, mixed, fill, self.pyramid_shift,
+                                    self.tiled_cache)
+            del coast
+
+        return tiled
+
+    def __open_tiled_coast__(self):
+        from .tiledmask import TiledMask
+
+        f = self.get_cache_file('coast_tiled', self.coast_key, '.npz')
+        fill = np.zeros(self.pyramid[0].shape, dtype=np.uint8)
+
+        self.coast = self.__cache_object__(
+            f, self.coast_key, lambda: self.__build_tiled_coast__(fill),
+            TiledMask.save, '.npz')
+        if self.coast is None:
+            logger.debug("loading tiled coast cells..")
+            self.coast = TiledMask.load(f, fill, self.tiled_cache)
+
+        type(self).__coast__ = weakref.ref(self.coast)
+
+    def __open_coast__(self):
+        self.coast = type(self).__coast__()
+        if self.coast is not None:
+            logger.debug("coast cells already loaded")
+            return
+
+        with type(self).generation_lock:
+            if self.storage == 'tiles':
+                self.__open_tiled_coast__()
+                return
+
+            try:
+                self.__cache_file__(self.coastf, self.coast_key,
+                                    self.__write_coast__)
+            except:
+                logger.exception(
+                    "failed to generate coast cells: re-trying in temporary location."
+                )
+                if self.__no_retry__:
+                    raise
+
+                fd = tempfile.NamedTemporaryFile(delete=True)
+                type(self).tmpcoast = fd  # keep handle around and delete on destruct
+                self.__write_coast__(fd)
+                type(self).coastf = fd.name
+
+            logger.debug("memmapping coast cells..")
+            self.coast = self.__load_packed__(self.coastf)
+            type(self).__coast__ = weakref.ref(self.coast)
+
+    def __open_tiles__(self):
+        from .tiles import TileIndex
+
+        self.tiles = type(self).__tiles__()
+        if self.tiles is not None:
+            logger.debug("tile index already loaded")
+            return
+
+        def build():
+            logger.info("clipping polygons to tiles in %s.." % self.tilesf)
+            return TileIndex.build(self.__world__().polys,
+                                   (type(self).ny, type(self).nx),
+                                   self.tile_shift, self.transform)
+
+        with type(self).generation_lock:
+            self.tiles = self.__cache_object__(self.tilesf, self.tiles_key,
+                                               build, TileIndex.save, '.npz')
+            if self.tiles is None:
+                logger.debug("loading tile index..")
+                self.tiles = TileIndex.load(self.tilesf)
+
+            type(self).__tiles__ = weakref.ref(self.tiles)
+
+    def __coastal_cells__(self, rows=512):
+        """
+        Sorted (ny * nx) indices of the land cells crossed by the coastline.
+        """
+        mask = self.__full_mask__()
+        cells = []
+        for r in range(0, self.ny, rows):
+            band = np.bitwise_and(mask[r:r + rows, :],
+                                  self.coast[r:r + rows, :])
+            br, bc = np.nonzero(band)
+            bits = np.unpackbits(band[br, bc][:, None], axis=1)
+            i, b = np.nonzero(bits)
+            cells.append((br[i].astype(np.int64) + r) * self.nx +
+                         bc[i].astype(np.int64) * 8 + b)
+
+        return np.concatenate(cells)
+
+    def __open_quadtree__(self):
+        from .quadtree import QuadTree
+
+        self.quadtree = type(self).__quadtree__()
+        if (self.quadtree is not None
+                and self.quadtree.depth == self.quadtree_depth):
+            logger.debug("quadtree already loaded")
+            return
+
+        key = cache_key(self.polygons_source,
+                        '%s-%d' % (self.quadtree_format, self.quadtree_depth))
+        f = self.get_cache_file('quadtree', key, '.npy')
+        self.quadtree = None
+
+        if not self.__cached__(f, key):
+            # generated from the polygons clipped to tiles
+            self.__open_tiles__()
+
+        def build():
+            logger.info("subdividing coastline cells to depth %d in %s.." %
+                        (self.quadtree_depth, f))
+            quadtree = QuadTree.build(self.tiles, self.__coastal_cells__(),
+                                      self.nx, self.transform,
+                                      self.quadtree_depth)
+            logger.info("quadtree of %d nodes (%d bytes) generated" %
+                        (len(quadtree), quadtree.nbytes))
+            return quadtree
+
+        with type(self).generation_lock:
+            self.quadtree = self.__cache_object__(f, key, build, QuadTree.save,
+                                                  '.npy')
+            if self.quadtree is None:
+                logger.debug("memmapping quadtree..")
+                self.quadtree = QuadTree.load(f, self.nx, self.transform)
+
+            type(self).__quadtree__ = weakref.ref(self.quadtree)
+
+        # the polygons are not needed for checking points
+        self.tiles = None
+
+    def __refiner__(self):
+        """
+        What points in cells crossed by the coastline are checked against.
+        """
+        return self.quadtree if self.quadtree is not None else self.tiles
+
+    def __open_distance__(self):
+        self.distance = type(self).__distance__()
+        if self.distance is not None:
+            logger.debug("distance raster already memmapped")
+            return
+
+        shape = (type(self).ny // self.distance_factor,
+                 type(self).nx // self.distance_factor)
+
+        def write(fd):
+            logger.info("generating distance raster in %s.." % self.distancef)
+            from .distance import coarsen, distance_rasterize
+
+            distance = np.memmap(fd, dtype='uint16', mode='w+', shape=shape)
+            distance_rasterize(
+                coarsen(self.__full_mask__(), self.distance_factor),
+                self.get_distance_transform(), distance, self.distance_max,
+                self.distance_unit)
+            distance.flush()
+            del distance
+            logger.info("distance raster generated")
+
+        with type(self).generation_lock:
+            self.__cache_file__(self.distancef, self.distance_key, write)
+
+            logger.debug("memmapping distance raster..")
+            self.distance = self.__load_packed__(self.distancef, 'uint16',
+                                                 shape)
+            type(self).__distance__ = weakref.ref(self.distance)
+
+    def __open_sat__(self):
+        self.sat = type(self).__sat__()
+        if self.sat is not None:
+            logger.debug("summed-area table already memmapped")
+            return
+
+        b = self.sat_block
+        shape = ((type(self).ny + b - 1) // b + 1, type(self).nx // b + 1)
+
+        def write(fd):
+            logger.info("generating summed-area table in %s.." % self.satf)
+            from .sat import sat_rasterize
+
+            sat = np.memmap(fd, dtype='uint32', mode='w+', shape=shape)
+            sat_rasterize(self.__full_mask__(), sat, b)
+            sat.flush()
+            del sat
+            logger.info("summed-area table generated")
+
+        with type(self).generation_lock:
+            self.__cache_file__(self.satf, self.sat_key, write)
+
+            logger.debug("memmapping summed-area table..")
+            self.sat = self.__load_packed__(self.satf, 'uint32', shape)
+            type(self).__sat__ = weakref.ref(self.sat)
+
+    def __open_nearest__(self):
+        from .nearest import NearestWater, coastal_water
+
+        self.nearest = type(self).__nearest__()
+        if self.nearest is not None:
+            logger.debug("water cells already indexed")
+            return
+
+        def build():
+            logger.info("finding water cells next to land in %s.." %
+                        self.nearestf)
+            cells = coastal_water(self.__full_mask__(), self.pyramid[0],
+                                  self.pyramid_shift, self.WATER, self.MIXED)
+            logger.info("%d water cells next to land found" % len(cells))
+            return cells
+
+        def save(cells, fd):
+            np.save(fd, cells.astype(np.uint32))
+
+        with type(self).generation_lock:
+            cells = self.__cache_object__(self.nearestf, self.nearest_key,
+                                          build, save, '.npy')
+            if cells is None:
+                cells = np.load(self.nearestf)
+
+            self.nearest = NearestWater(cells.astype(np.int64), self.nx,
+                                        self.transform)
+            type(self).__nearest__ = weakref.ref(self.nearest)
+
+    @classmethod
+    def __world_polygons__(cls):
+        """
+        The polygons of the world, shared if already in use. They are not
+        parsed until used.
+        """
+        with cls.polygons_lock:
+            world = cls.__polygons__()
+            if world is None:
+                world = LandPolygons(cls.__parse_world__)
+                cls.__polygons__ = weakref.ref(world)
+
+            return world
+
+    @classmethod
+    def __parse_world__(cls):
+        logger.debug("loading polygons..")
+        from .gshhs import get_gshhs
+        with get_gshhs(cls.resolution) as fd:
+            return wkb.load(fd)
+
+    def __world__(self):
+        """
+        The polygons of the world, parsed if not already in use.
+        """
+        world = self.__world_polygons__()
+        with self.__stats__.time('init.wkb'):
+            world.polys
+
+        return world
+
+    def __load_polygons__(self, extent):
+        if not extent:
+            self.polygons = self.__world_polygons__()
+        else:
+            key = tuple(float(e) for e in extent)
+            world = self.__world_polygons__
+
+            with type(self).polygons_lock:
+                self.polygons = type(self).__extent_polygons__.get(key)
+                if self.polygons is None:
+                    # filtered from the polygons of the world on first use
+                    self.polygons = LandPolygons(lambda: world().polys,
+                                                 extent)
+                    type(self).__extent_polygons__[key] = self.polygons
+                else:
+                    logger.debug("polygons for extent already loaded")
+
+            self.extent = self.polygons.extent
+
+    @property
+    def polys(self):
+        """
+        The land polygons (intersecting extent), parsed on first use.
+        """
+        return self.polygons.polys if self.polygons is not None else None
+
+    @property
+    def land(self):
+        """
+        The prepared land polygons (intersecting extent).
+        """
+        return self.polygons.land if self.polygons is not None else None
+
+    def __load_pyramid__(self):
+        if type(self).pyramid is None:
+            logger.debug("loading mask pyramid..")
+            with self.get_pyramid() as fd:
+                levels = np.load(fd)
+                type(self).pyramid = [
+                    levels['arr_%d' % i] for i in range(len(levels.files))
+                ]
+
+    @staticmethod
+    def __lookup__(packed, xm, ym):
+        """
+        Look up cells xm, ym directly in the bit-packed array (or window).
+        """
+        if hasattr(packed, 'lookup'):
+            return packed.lookup(xm, ym)
+
+        return (packed[ym, xm >> 3] >> (7 - (xm & 7))) & 1 == 1
+
+    def __crop__(self, extent, crop):
+        """
+        Replace the mask and coastline cells with copies of the windows
+        covering `extent` (padded by a cell), so that the memmaps are no
+        longer used by this instance.
+        """
+        from .window import Window
+
+        x0, y0 = self.invtransform * (extent[0], extent[1])
+        x1, y1 = self.invtransform * (extent[2], extent[3])
+        rows = (max(int(y0) - 1, 0), min(int(y1) + 2, self.ny))
+        cells = (max(int(x0) - 1, 0), min(int(x1) + 2, self.nx))
+
+        self.mask = Window(self.mask, rows, cells, self.transform,
+                           crop == 'packed')
+        if self.coast is not None:
+            self.coast = Window(self.coast, rows, cells, self.transform,
+                                crop == 'packed')
+
+        logger.debug("cropped mask to %d x %d cells (%d bytes)" %
+                     (self.mask.shape + (self.mask.nbytes, )))
+
+    def __full_mask__(self):
+        """
+        The mask of the world, also when cropped.
+        """
+        if not hasattr(self.mask, 'lookup'):
+            return self.mask
+        elif self.storage == 'tiles':
+            return self.__tiled_mask__()
+        else:
+            return self.__load_packed__(self.mmapf)
+
+    def __cells__(self, x, y):
+        """
+        Cells xm, ym of coordinates x, y, clamped at the far edges.
+        """
+        xm, ym = self.invtransform * (x, y)
+
+        xm = xm.astype(np.int32)
+        ym = ym.astype(np.int32)
+        xm[xm == self.nx] = self.nx - 1
+        ym[ym == self.ny] = self.ny - 1
+
+        return xm, ym
+
+    def __classify__(self, xm, ym, skippoly, bbox=None):
+        """
+        Classify cells xm, ym as land in the mask and, unless `skippoly`,
+        crossed by the coastline (those are land or water depending on the
+        polygons). If the bounding box of the cells is known to be all land
+        (`bbox`, see `__bbox_class__`) the mask is not looked up.
+
+        Returns:
+
+          land, coastal (arrays of bools)
+        """
+        stats = self.__stats__
+
+        with stats.time('contains.raster'):
+            if bbox == self.LAND:
+                land = np.ones(xm.shape, dtype=bool)
+            else:
+                block = self.pyramid[0][ym >> self.pyramid_shift,
+                                        xm >> self.pyramid_shift]
+                land = block == self.LAND
+
+                # only cells in mixed blocks are looked up in the packed mask
+                mixed = block == self.MIXED
+                land[mixed] = self.__lookup__(self.mask, xm[mixed],
+                                              ym[mixed])
+
+        coastal = np.zeros(xm.shape, dtype=bool)
+        if not skippoly:
+            # only land cells crossed by the coastline need to be checked
+            # against the polygons, the rest are certainly land.
+            with stats.time('contains.coast'):
+                landi = np.flatnonzero(land)
+                coastal[landi] = self.__lookup__(self.coast, xm[landi],
+                                                 ym[landi])
+
+        return land, coastal
+
+    def __bbox_class__(self, x, y):
+        """
+        Classify the bounding box of the points as WATER, LAND or MIXED using
+        the mask pyramid, starting at the coarsest level.
+        """
+        x0, y0 = self.invtransform * (np.min(x), np.min(y))
+        x1, y1 = self.invtransform * (np.max(x), np.max(y))
+        x0, x1 = np.clip([x0, x1], 0, self.nx - 1).astype(np.int32)
+        y0, y1 = np.clip([y0, y1], 0, self.ny - 1).astype(np.int32)
+
+        for l in reversed(range(len(self.pyramid))):
+            s = self.pyramid_shift + l
+            w = self.pyramid[l][y0 >> s:(y1 >> s) + 1, x0 >> s:(x1 >> s) + 1]
+            if w.min() == w.max() and w.flat[0] != self.MIXED:
+                return w.flat[0]
+
+        return self.MIXED
+
     def __init__(self,
                  extent=None,
                  skippoly=False,
+                 workers=1,
+                 backend=None,
+                 storage='memmap',
+                 crop=None,
+                 resolution=None,
+                 stats=False,
+                 background=False,
+                 refine='polygons',
                  __concurrency_delay__=0,
                  __concurrency_abort__=False,
                  __no_retry__=False,
@@ -284,6 +1154,16 @@ class Landmask:
 
           extent (array): [xmin, ymin, xmax, ymax]
           skippoly (bool): do not load polygons
+          workers (int): check points in chunks in parallel on this many threads (see `contains`)
+          backend (str): backend for checking points against polygons: 'contains_xy' (default with shapely 2), 'shapely' (default otherwise) or 'numpy' (see `backends`)
+          storage (str): 'memmap' (default): decompress the mask to `tmpdir` and memorymap it, 'tiles': decompress tiles of the mask (and of the coast cells) on first use, keeping at most `tiled_cache` bytes in memory. Nothing decompressed is written to `tmpdir`, but unless `skippoly` the polygons are still parsed to generate the (compressed) coast cells and tile index the first time.
+          crop (str): copy the part of the mask (and coastline cells) covering `extent` into memory, 'packed': bit-packed, 'bytes': one byte per cell. Points must be inside the extent.
+          resolution (str): resolution of coastline and mask: 'c' (crude, 4 nm cells), 'l' (low, 2 nm), 'i' (intermediate, 1 nm), 'h' (high, 0.5 nm) or 'f' (full, 0.25 nm, default)
+          stats (bool): record timings of the stages of initialization and `contains`, and counts of points reaching each stage (see `stats`)
+
+          background (bool): return at once, and open (or generate) the mask and load the polygons in a background thread (see `wait_ready`). Until then `contains` answers points that are certainly water, and waits for the rest.
+
+          refine (str): check points in cells crossed by the coastline against the 'polygons', or against the 'quadtree' of the cells (no geometry is used, see `QuadTree` for the accuracy). The quadtree is generated on first use.
 
           __concurrency_delay__: internally used for race condition testing, do not use.
           __concurrency_abort__: internally used for race condition testing, do not use.
@@ -295,36 +1175,126 @@ class Landmask:
         self.transform = self.get_transform()
         self.invtransform = self.get_inverse_transform()
         self.skippoly = skippoly
+        self.workers = workers
+        self.backend = get_backend(backend)
+        assert storage in ('memmap', 'tiles'), "unknown storage: %s" % storage
+        assert crop in (None, 'packed', 'bytes'), "unknown crop: %s" % crop
+        assert not crop or extent, "crop requires an extent"
+        assert refine in ('polygons', 'quadtree'), "unknown refine: %s" % refine
+        assert resolution is None or resolution == self.resolution, "Landmask of resolution '%s' constructed with resolution '%s': pass resolution as keyword, or use Landmask.for_resolution('%s')" % (
+            self.resolution, resolution, resolution)
+        self.storage = storage
         self.__concurrency_delay__ = __concurrency_delay__
         self.__concurrency_abort__ = __concurrency_abort__
         self.__no_retry__ = __no_retry__
         self.__retry_delete__ = __retry_delete__
         self.__fake_32_bit__ = __fake_32_bit__
 
-        self.__check_permissions__()
+        self.__stats__ = Stats() if stats else NullStats()
 
-        if not self.__mask_exists__():
-            self.__generate__()
+        with self.__stats__.time('init.pyramid'):
+            self.__load_pyramid__()
+        self.__cache_files__()
+
+        self.mask_ready = threading.Event()
+        if background:
+            from concurrent.futures import ThreadPoolExecutor
+
+            executor = ThreadPoolExecutor(max_workers=1)
+            self.ready = executor.submit(self.__load__, extent, skippoly,
+                                         storage, crop, refine)
+            executor.shutdown(wait=False)
+        else:
+            from concurrent.futures import Future
 
-        self.__open_mask__()
+            self.__load__(extent, skippoly, storage, crop, refine)
+            self.ready = Future()
+            self.ready.set_result(None)
+
+    def __load__(self, extent, skippoly, storage, crop, refine):
+        """
+        Open (or generate) the mask, and load the polygons.
+        """
+        timed = self.__stats__.time
+
+        if storage == 'tiles':
+            with timed('init.tiled'):
+                self.__open_tiled_mask__()
+        else:
+            self.__check_permissions__()
+
+            if not self.__mask_exists__():
+                with timed('init.generate'):
+                    self.__generate__()
+
+            with timed('init.memmap'):
+                self.__open_mask__()
+
+        if not crop:
+            self.mask_ready.set()
 
         if not skippoly:
-            from .gshhs import get_gshhs_f
-            with get_gshhs_f() as fd:
-                self.land = wkb.load(fd)
+            # the polygons of the world are only parsed if the coastline
+            # cells, tile index or quadtree are generated from them. they are
+            # held until loaded, so that they are parsed at most once.
+            world = self.__world_polygons__()
+            self.__polygons_cache_files__()
 
+        if not skippoly and refine == 'quadtree':
             if extent:
-                self.extent = box(*extent)
-                self.extent = shapely.prepared.prep(self.extent)
+                self.extent = shapely.prepared.prep(box(*extent))
+            with timed('init.coast'):
+                self.__open_coast__()
+            with timed('init.quadtree'):
+                self.__open_quadtree__()
+
+        elif not skippoly:
+            with timed('init.polygons'):
+                self.__load_polygons__(extent)
+            with timed('init.coast'):
+                self.__open_coast__()
+            with timed('init.tiles'):
+                self.__open_tiles__()
+
+        if crop:
+            with timed('init.crop'):
+                self.__crop__(extent, crop)
+            self.mask_ready.set()
+
+        self.__stats__.log(logging.DEBUG)
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait until the mask is opened and the polygons are loaded, when
+        constructed with `background=True`. Exceptions raised while loading
+        are raised here.
+
+        Args:
 
-                # polygons
-                self.land = MultiPolygon(
-                    [l for l in self.land.geoms if self.extent.intersects(l)])
+          timeout (float): seconds to wait, default no limit
 
-            self.polys = self.land
-            self.land = shapely.prepared.prep(self.land)
+        Returns:
+
+          self
+        """
+        self.ready.result(timeout)
+        return self
 
-    def contains(self, x, y, skippoly=None, checkextent=True):
+    def __wait_mask__(self):
+        """
+        Wait until the mask is opened, or loading fails.
+        """
+        while not self.mask_ready.wait(.05):
+            if self.ready.done():
+                self.ready.result()
+                break
+
+    def contains(self,
+                 x,
+                 y,
+                 skippoly=None,
+                 checkextent=True,
+                 workers=None):
         """
         Check if coordinates x, y are on land
 
@@ -337,6 +1307,8 @@ class Landmask:
 
           checkextent (bool): check if points are within extent of landmask, default True
 
+          workers (int): check points in chunks in parallel on this many threads, default as constructed.
+
         Returns:
 
           array of bools same length as x and y
@@ -348,31 +1320,543 @@ class Landmask:
         else:
             skippoly = self.skippoly
 
+        if workers is None:
+            workers = self.workers
+
         if not isinstance(x, np.ndarray):
             x = np.array(x, ndmin=1, dtype=np.float32)
 
         if not isinstance(y, np.ndarray):
             y = np.array(y, ndmin=1, dtype=np.float32)
 
-        xm, ym = self.invtransform * (x, y)
+        if not self.ready.done():
+            return self.__contains_loading__(x, y, skippoly, checkextent,
+                                             workers)
 
-        xm = xm.astype(np.int32)
-        ym = ym.astype(np.int32)
-        xm[xm == self.nx] = self.nx - 1
-        ym[ym == self.ny] = self.ny - 1
+        if workers > 1 and len(x) > self.chunksize:
+            return self.__contains_parallel__(x, y, skippoly, checkextent,
+                                              workers)
+        else:
+            return self.__contains_chunk__(x, y, skippoly, checkextent,
+                                           self.__refiner__())
+
+    def __contains_loading__(self, x, y, skippoly, checkextent, workers):
+        """
+        Check points while loading in the background. Points in water blocks
+        of the pyramid are water before the mask is opened, and points in
+        water in the mask are water before the polygons are loaded. Only the
+        rest wait.
+        """
+        land = np.zeros(x.shape, dtype=bool)
+        if len(x) == 0 or self.__bbox_class__(x, y) == self.WATER:
+            return land
+
+        if not self.mask_ready.is_set():
+            xm, ym = self.__cells__(x, y)
+            block = self.pyramid[0][ym >> self.pyramid_shift,
+                                    xm >> self.pyramid_shift]
+            i = np.flatnonzero(block != self.WATER)
+            if len(i) == 0:
+                return land
+
+            logger.debug("waiting for mask to check %d points.." % len(i))
+            self.__wait_mask__()
+        else:
+            i = np.arange(len(x))
+
+        land[i] = self.__contains_chunk__(x[i], y[i], True, checkextent,
+                                          None)
+        if skippoly or not np.any(land):
+            return land
+
+        i = np.flatnonzero(land)
+        logger.debug("waiting for polygons to check %d points.." % len(i))
+        self.wait_ready()
+        land[i] = self.contains(x[i], y[i], skippoly, checkextent, workers)
+
+        return land
+
+    def plan(self, n, skippoly=None, checkextent=True):
+        """
+        Plan for checking batches of up to `n` points repeatedly, reusing
+        preallocated buffers. See `QueryPlan`.
 
-        land = self.mask[ym, xm] == 1
+        Args:
+          n (int): maximum number of points in a batch
+
+          skippoly (bool): skip check against polygons, default False unless constructed with True.
+
+          checkextent (bool): check if points are within extent of landmask, default True
+
+        Returns:
+
+          `QueryPlan`, check points with `plan.contains(x, y, out=...)`.
+        """
+        self.wait_ready()
+
+        from .plan import QueryPlan
+        return QueryPlan(self, n, skippoly, checkextent)
+
+    def particles(self, x=(), y=(), skippoly=None):
+        """
+        Particles checked against the mask step by step, only re-evaluating
+        the particles that have moved to another cell or are in cells crossed
+        by the coastline. See `Particles`.
+
+        Args:
+          x, y (arrays, deg): initial positions of particles
+
+          skippoly (bool): skip check against polygons, default False unless constructed with True.
+
+        Returns:
+
+          `Particles`
+        """
+        self.wait_ready()
+
+        from .particles import Particles
+
+        p = Particles(self, skippoly)
+        p.add(x, y)
+        return p
+
+    def __contains_parallel__(self, x, y, skippoly, checkextent, workers):
+        """
+        Check points in chunks of `chunksize` on a pool of threads. If the
+        polygon check does not release the GIL it is run on a pool of
+        processes.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        refine = self.__refiner__()
+        if (not skippoly and refine is self.tiles
+                and not self.backend.releases_gil):
+            refine = self.__process_pool__(workers)
+
+        land = np.empty(x.shape, dtype=bool)
+
+        def f(i):
+            land[i:i + self.chunksize] = self.__contains_chunk__(
+                x[i:i + self.chunksize], y[i:i + self.chunksize], skippoly,
+                checkextent, refine)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # raise any exceptions
+            list(executor.map(f, range(0, len(x), self.chunksize)))
+
+        return land
+
+    def __process_pool__(self, workers):
+        """
+        Pool of processes checking points against the tile index, loaded from
+        the saved tile index, or sent to the processes if it is only in
+        memory.
+        """
+        if self.pool is None or self.pool.workers != workers:
+            from .tiles import TileIndexPool
+
+            if self.__cached__(self.tilesf, self.tiles_key):
+                tiles = self.tilesf
+            else:
+                logger.debug("tile index is not saved, sending it to the "
+                             "processes")
+                tiles = self.tiles
+
+            logger.debug("starting %d processes for checking polygons.." %
+                         workers)
+            self.pool = TileIndexPool(tiles, workers)
+
+        return self.pool
+
+    def __contains_chunk__(self, x, y, skippoly, checkextent, refine):
+        if len(x) == 0:
+            return np.zeros(x.shape, dtype=bool)
+
+        stats = self.__stats__
+        stats.count('points', len(x))
+
+        if hasattr(self.mask, 'lookup'):
+            # cropped, the rest of the mask is not available
+            assert self.mask.contains(x, y), "Points are not inside extent."
+
+        # all points in open water, the mask does not need to be touched
+        with stats.time('contains.bbox'):
+            bbox = self.__bbox_class__(x, y)
+        if bbox == self.WATER:
+            return np.zeros(x.shape, dtype=bool)
+
+        with stats.time('contains.transform'):
+            xm, ym = self.__cells__(x, y)
+
+        land, coastal = self.__classify__(xm, ym, skippoly, bbox)
+
+        if stats.enabled:
+            stats.count('raster_land', np.count_nonzero(land))
 
         # checking against polygons
-        if not skippoly and len(x[land]) > 0:
+        if not skippoly and np.any(land):
 
             if checkextent and self.extent is not None:
-                assert np.all(
-                    shapely.vectorized.contains(
-                        self.extent, x[land],
-                        y[land])), "Points are not inside extent."
-
-            land[land] = shapely.vectorized.contains(self.land, x[land],
-                                                     y[land])
+                with stats.time('contains.extent'):
+                    assert np.all(
+                        shapely.vectorized.contains(
+                            self.extent, x[land],
+                            y[land])), "Points are not inside extent."
+
+            # each point in a cell crossed by the coastline is checked
+            # against the polygons clipped to its tile.
+            coastal = np.flatnonzero(coastal)
+            with stats.time('contains.polygons'):
+                land[coastal] = refine.contains(x[coastal], y[coastal],
+                                                xm[coastal], ym[coastal],
+                                                self.backend)
+
+            stats.count('polygon_checks', len(coastal))
 
         return land
+
+    def stats(self, reset=False):
+        """
+        Cumulative timings (s) of the stages of initialization and of
+        `contains` (and the points checked at each stage), when constructed
+        with `stats=True`. The stats are also logged (at debug level).
+
+        Timings of the stages of `contains` are summed over threads when
+        checking points in parallel.
+
+        Args:
+
+          reset (bool): reset the stats after returning them
+
+        Returns:
+
+          dict with 'timings' (stage: seconds) and 'counts' ('points', 'raster_land', 'polygon_checks'), or None if not enabled.
+        """
+        s = self.__stats__.as_dict()
+        self.__stats__.log(logging.DEBUG)
+        if reset:
+            self.__stats__.reset()
+        return s
+
+    def prefetch(self, extent, sequential=True):
+        """
+        Read the rows of the mask (and coastline cells) covering `extent` in a
+        background thread, so that the first checks of points in the extent
+        do not wait for the disk. With the tiled storage the tiles covering
+        the extent are decompressed (as far as they fit in the cache).
+
+        Args:
+
+          extent (array): [xmin, ymin, xmax, ymax]
+
+          sequential (bool): advise the kernel to read ahead while reading the rows, the mask is otherwise advised to be accessed randomly.
+
+        Returns:
+
+          `concurrent.futures.Future`, done when the extent has been read.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.__prefetch__, extent, sequential)
+        executor.shutdown(wait=False)
+        return future
+
+    def __prefetch__(self, extent, sequential, rows=512):
+        import time
+        self.wait_ready()
+        t0 = time.time()
+
+        x0, y0 = self.invtransform * (extent[0], extent[1])
+        x1, y1 = self.invtransform * (extent[2], extent[3])
+        x0, x1 = np.clip([x0, x1], 0, self.nx - 1).astype(np.int32)
+        y0, y1 = np.clip([y0, y1], 0, self.ny - 1).astype(np.int32)
+        r0, r1 = int(y0), int(y1) + 1
+        c0, c1 = int(x0) >> 3, (int(x1) >> 3) + 1
+
+        for m in (self.mask, self.coast):
+            if m is None or hasattr(m, 'lookup'):
+                continue  # not loaded, or cropped in memory
+
+            if sequential:
+                self.__madvise__(m, 'MADV_SEQUENTIAL', (r0, r1))
+            self.__madvise__(m, 'MADV_WILLNEED', (r0, r1))
+
+            # touch every byte in the extent
+            for r in range(r0, r1, rows):
+                np.max(m[r:min(r + rows, r1), c0:c1])
+
+            if sequential:
+                self.__madvise__(m, 'MADV_RANDOM', (r0, r1))
+
+        logger.debug("prefetched extent %s in %.2fs" %
+                     (extent, time.time() - t0))
+
+    def distance_to_coast(self, x, y):
+        """
+        Distance from coordinates x, y to the nearest land.
+
+        The distance is interpolated (bilinearly) from a raster of distances
+        between the centers of cells of 4 x 4 mask cells (1 nm), and is
+        accurate to about a cell. The raster is generated on first use (this
+        requires `scipy`).
+
+        Args:
+          x (scalar or array, deg): longitude
+
+          y (scalar or array, deg): latitude
+
+        Returns:
+
+          array of distances (m) same length as x and y, at most `distance_max`.
+        """
+        self.wait_ready()
+
+        if self.distance is None:
+            self.__open_distance__()
+
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
+
+        ny, nx = self.distance.shape
+        u, v = ~self.get_distance_transform() * (x, y)
+
+        # interpolate between the centers of the surrounding cells
+        u = u - .5
+        v = v - .5
+        i = np.clip(np.floor(u).astype(np.int32), 0, nx - 2)
+        j = np.clip(np.floor(v).astype(np.int32), 0, ny - 2)
+        wu = np.clip(u - i, 0., 1.)
+        wv = np.clip(v - j, 0., 1.)
+
+        d = (1. - wv) * ((1. - wu) * self.distance[j, i] +
+                         wu * self.distance[j, i + 1]) + wv * (
+                             (1. - wu) * self.distance[j + 1, i] +
+                             wu * self.distance[j + 1, i + 1])
+
+        return (d * self.distance_unit).astype(np.float32)
+
+    def land_fraction(self, x0, y0, x1, y1):
+        """
+        Fraction of the cells of the mask in the boxes x0..x1, y0..y1 that
+        are land.
+
+        Each box costs a constant number of lookups in a summed-area table of
+        blocks of 8 x 8 cells, generated on first use. The land is assumed to
+        be spread evenly over the blocks on the edges of the box, so the
+        fraction is exact for boxes with edges on the blocks (multiples of 2
+        nm). Cells are not weighted by area (which shrinks with latitude),
+        and land cells of the mask include the cells touched by the coastline
+        (no polygons are used).
+
+        Args:
+          x0, y0, x1, y1 (scalar or array, deg): corners of boxes
+
+        Returns:
+
+          array of fractions (0 to 1), nan for empty boxes.
+        """
+        self.wait_ready()
+
+        x0, y0, x1, y1 = [
+            np.asarray(a, dtype=np.float64).reshape(-1)
+            for a in (x0, y0, x1, y1)
+        ]
+
+        ua, va = self.__sat_coords__(np.minimum(x0, x1), np.minimum(y0, y1))
+        ub, vb = self.__sat_coords__(np.maximum(x0, x1), np.maximum(y0, y1))
+
+        return self.__sat_fraction__(ua, va, ub, vb)
+
+    def land_fraction_grid(self, extent, shape):
+        """
+        Land fraction of the cells of a regular grid (see `land_fraction`).
+
+        Args:
+          extent (array): [xmin, ymin, xmax, ymax] edges of grid
+
+          shape (tuple): (rows, columns) of grid
+
+        Returns:
+
+          (rows, columns) array of fractions, row 0 at ymin.
+        """
+        self.wait_ready()
+
+        u, _ = self.__sat_coords__(
+            np.linspace(extent[0], extent[2], shape[1] + 1), extent[1])
+        _, v = self.__sat_coords__(
+            extent[0], np.linspace(extent[1], extent[3], shape[0] + 1))
+
+        # corners are shared between neighbouring cells
+        return self.__sat_fraction__(u[None, :-1], v[:-1, None], u[None, 1:],
+                                     v[1:, None])
+
+    def __sat_coords__(self, x, y):
+        """
+        Coordinates of x, y in blocks of the summed-area table, clipped to
+        the grid.
+        """
+        u, v = self.invtransform * (np.asarray(x, dtype=np.float64),
+                                    np.asarray(y, dtype=np.float64))
+        return (np.clip(u, 0., self.nx) / self.sat_block,
+                np.clip(v, 0., self.ny) / self.sat_block)
+
+    def __sat_fraction__(self, ua, va, ub, vb):
+        from .sat import sat_integral
+
+        if self.sat is None:
+            self.__open_sat__()
+
+        land = (sat_integral(self.sat, ub, vb) - sat_integral(
+            self.sat, ua, vb) - sat_integral(self.sat, ub, va) +
+                sat_integral(self.sat, ua, va))
+        area = (ub - ua) * (vb - va) * self.sat_block**2
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.clip(np.where(area > 0, land / area, np.nan), 0., 1.)
+
+    def nearest_water(self, x, y, max_distance=None, skippoly=None):
+        """
+        Move points on land to the centre of the nearest water cell of the
+        mask, e.g. to push stranded particles back to sea. Points in water
+        are not moved.
+
+        The water cells next to land are indexed in a KD-tree on first use
+        (this requires `scipy`). Distances are great-circle distances to the
+        centres of the cells, so the points are moved up to half a cell
+        further than the coastline of the polygons.
+
+        Args:
+          x (scalar or array, deg): longitude
+
+          y (scalar or array, deg): latitude
+
+          max_distance (float): largest distance to move points (m), default `distance_max`.
+
+          skippoly (bool): skip check against polygons, default False unless constructed with True.
+
+        Returns:
+
+          x, y (arrays, deg): points moved to water, points on land without water within `max_distance` are not moved
+
+          distance (array): distance moved (m), inf for points that could not be moved
+        """
+        self.wait_ready()
+
+        if max_distance is None:
+            max_distance = self.distance_max
+
+        x = np.array(x, dtype=np.float64, ndmin=1).reshape(-1)
+        y = np.array(y, dtype=np.float64, ndmin=1).reshape(-1)
+        distance = np.zeros(x.shape)
+
+        land = np.flatnonzero(self.contains(x, y, skippoly=skippoly))
+        if len(land) == 0:
+            return x, y, distance
+
+        if self.nearest is None:
+            self.__open_nearest__()
+
+        wx, wy, d = self.nearest.query(x[land], y[land], max_distance,
+                                       self.workers)
+        distance[land] = d
+
+        found = np.isfinite(d)
+        x[land[found]] = wx[found]
+        y[land[found]] = wy[found]
+
+        return x, y, distance
+
+    def first_land_crossing(self, x0, y0, x1, y1, skippoly=None, samples=8):
+        """
+        Find where the segments from x0, y0 to x1, y1 first hit land, e.g.
+        particles moving from one time step to the next.
+
+        The mask cells crossed by each segment are walked in order. Land cells
+        crossed by the coastline are refined by checking `samples` points,
+        evenly spaced along the part of the segment in the cell, against the
+        polygons: the crossing point is the first of these on land. In other
+        land cells, or with `skippoly`, the crossing point is where the
+        segment enters the cell. Segments go the short way round, also across
+        the antimeridian.
+
+        Args:
+          x0, y0 (scalar or array, deg): start of segments
+
+          x1, y1 (scalar or array, deg): end of segments
+
+          skippoly (bool): skip check against polygons, default False unless constructed with True.
+
+          samples (int): points to check in each cell crossed by the coastline
+
+        Returns:
+
+          hit (array of bools): segments hitting land
+
+          x, y (arrays, deg): approximate crossing points, nan where the segment does not hit land
+        """
+        self.wait_ready()
+
+        if skippoly is not None:
+            assert not (
+                not skippoly and self.skippoly
+            ), "cannot check against polygons when not constructed with polygons"
+        else:
+            skippoly = self.skippoly
+
+        from .crossing import traverse
+
+        x0, y0, x1, y1 = [
+            np.asarray(a, dtype=np.float64).reshape(-1)
+            for a in (x0, y0, x1, y1)
+        ]
+
+        # go the short way round across the antimeridian
+        x1 = np.where(x1 - x0 > 180., x1 - 360.,
+                      np.where(x0 - x1 > 180., x1 + 360., x1))
+
+        u0, v0 = self.invtransform * (x0, y0)
+        u1, v1 = self.invtransform * (x1, y1)
+
+        seg, t0, t1, cx, cy = traverse(u0, v0, u1, v1, self.nx, self.ny)
+
+        # parameter of the crossing in each piece, inf if it does not hit land
+        th = np.full(t0.shape, np.inf)
+        land, coastal = self.__classify__(cx, cy, skippoly)
+
+        li = np.flatnonzero(land & ~coastal)
+        th[li] = t0[li]
+
+        if not skippoly:
+            ci = np.flatnonzero(coastal)
+            ts = t0[ci, None] + (t1 - t0)[ci, None] * np.linspace(
+                0., 1., samples)[None, :]
+            sg = seg[ci, None]
+            xs = self.__wrap__(x0[sg] + (x1 - x0)[sg] * ts)
+            ys = y0[sg] + (y1 - y0)[sg] * ts
+
+            inside = self.__refiner__().contains(xs.ravel(), ys.ravel(),
+                                                 np.repeat(cx[ci], samples),
+                                                 np.repeat(cy[ci], samples),
+                                                 self.backend)
+            inside = inside.reshape(ts.shape)
+
+            th[ci] = np.where(inside.any(axis=1),
+                              ts[np.arange(len(ci)),
+                                 inside.argmax(axis=1)], np.inf)
+
+        # first crossing along each segment
+        t = np.full(x0.shape, np.inf)
+        np.minimum.at(t, seg, th)
+        hit = np.isfinite(t)
+
+        t[~hit] = np.nan
+        return hit, self.__wrap__(x0 + (x1 - x0) * t), y0 + (y1 - y0) * t
+
+    @staticmethod
+    def __wrap__(x):
+        """
+        Longitudes x wrapped into [-180, 180].
+        """
+        return np.where((x < -180.) | (x > 180.), (x + 180.) % 360. - 180., x)
@@ -0,0 +1,150 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+## radius of the earth matching the grid: a minute of latitude is a nautical
+## mile
+R = 1852. * 60. * 180. / np.pi
+
+
+def coastal_water(mask, blocks, shift, water, mixed):
+    """
+    Water cells of the mask next to land (of their 8 neighbours, wrapping
+    around in longitude). The water cell nearest to a point on land is always
+    one of these.
+
+    Only the blocks of the mask pyramid that are mixed, or water next to
+    blocks that are not, are unpacked.
+
+    Args:
+
+        mask (array): bit-packed (ny, nx // 8) mask
+
+        blocks (array): finest level of the mask pyramid
+
+        shift (int): log2 of block size in cells
+
+        water, mixed (int): classes of blocks
+
+    Returns:
+
+        sorted (ny * nx) indices of cells
+    """
+    ny, nxp = mask.shape
+    nx = nxp * 8
+    s = 1 << shift
+    bp = s // 8
+
+    # blocks next to blocks that are not water
+    notwater = np.pad(blocks != water, ((1, 1), (0, 0)))
+    notwater = np.concatenate(
+        (notwater[:, -1:], notwater, notwater[:, :1]), axis=1)
+    near = np.zeros(blocks.shape, dtype=bool)
+    for dy in range(3):
+        for dx in range(3):
+            near |= notwater[dy:dy + blocks.shape[0], dx:dx + blocks.shape[1]]
+
+    candidates = (blocks == mixed) | ((blocks == water) & near)
+
+    cells = []
+    for bi, bj in zip(*np.nonzero(candidates)):
+        r0, r1 = bi * s, min((bi + 1) * s, ny)
+        h0, h1 = max(r0 - 1, 0), min(r1 + 1, ny)
+
+        # a byte either side, wrapping around in longitude
+        b0, b1 = bj * bp - 1, (bj + 1) * bp + 1
+        if b0 >= 0 and b1 <= nxp:
+            w = np.asarray(mask[h0:h1, b0:b1])
+        else:
+            w = np.asarray(mask[h0:h1, :])[:, np.arange(b0, b1) % nxp]
+        land = np.unpackbits(w, axis=1)[:, 7:-7].astype(bool)
+
+        # pad rows at the poles with water
+        land = np.pad(land, ((int(r0 == h0), int(r1 == h1)), (0, 0)))
+
+        neighbour = np.zeros((r1 - r0, s), dtype=bool)
+        for dy in range(3):
+            for dx in range(3):
+                if dy != 1 or dx != 1:
+                    neighbour |= land[dy:dy + r1 - r0, dx:dx + s]
+
+        coastal = ~land[1:-1, 1:-1] & neighbour
+        i, j = np.nonzero(coastal)
+        cells.append((i + r0).astype(np.int64) * nx + j + bj * s)
+
+    if len(cells) == 0:
+        return np.zeros((0, ), dtype=np.int64)
+
+    return np.sort(np.concatenate(cells))
+
+
+def to_xyz(x, y):
+    """
+    Points on the unit sphere of longitudes x and latitudes y (deg).
+    """
+    x = np.radians(x)
+    y = np.radians(y)
+    c = np.cos(y)
+    return np.stack((c * np.cos(x), c * np.sin(x), np.sin(y)), axis=-1)
+
+
+class NearestWater:
+    """
+    Index of the water cells of the mask next to land (see `coastal_water`),
+    for finding the nearest water cell of points on land. The centres of the
+    cells are indexed in a KD-tree (`scipy`) on the unit sphere, so that
+    distances are great-circle distances and longitudes wrap around.
+    """
+
+    def __init__(self, cells, nx, transform):
+        """
+        Args:
+
+            cells (array): (ny * nx) indices of cells
+
+            nx (int): cells along x
+
+            transform (Affine): transform from cells to lon, lat
+        """
+        from scipy.spatial import cKDTree
+
+        self.cells = cells
+        self.nx = nx
+        self.x, self.y = transform * (cells % nx + .5, cells // nx + .5)
+
+        logger.debug("indexing %d coastal water cells.." % len(cells))
+        self.tree = cKDTree(to_xyz(self.x, self.y))
+
+    def __len__(self):
+        return len(self.cells)
+
+    def query(self, x, y, max_distance, workers=1):
+        """
+        Nearest water cell of the points x, y.
+
+        Args:
+
+            x, y (arrays, deg): points
+
+            max_distance (float): largest distance to search, in metres
+
+            workers (int): number of threads
+
+        Returns:
+
+            x, y (arrays, deg): centres of nearest water cells, nan if none within `max_distance`
+
+            distance (array): great-circle distance (m), inf if none within `max_distance`
+        """
+        chord = 2. * np.sin(min(max_distance / R, np.pi) / 2.)
+        d, i = self.tree.query(to_xyz(x, y),
+                               distance_upper_bound=chord * (1. + 1.e-9),
+                               workers=workers)
+
+        found = np.isfinite(d)
+        i = np.where(found, i, 0)
+        d = np.where(found, 2. * R * np.arcsin(np.minimum(d / 2., 1.)),
+                     np.inf)
+
+        return (np.where(found, self.x[i], np.nan),
+                np.where(found, self.y[i], np.nan), d)
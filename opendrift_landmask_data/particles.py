@@ -0,0 +1,165 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Particles:
+    """
+    Particles checked against a `Landmask` step by step, as in a drift
+    simulation where most particles stay in the same cell of the mask from one
+    time step to the next.
+
+    The cell of each particle, and whether the cell is land in the mask and
+    crossed by the coastline, is kept between steps. On each step only the
+    particles that have moved to another cell are looked up in the mask, and
+    only the particles in cells crossed by the coastline are checked against
+    the polygons. The rest keep their previous classification.
+
+    Particles are identified by the ids returned by `add`, and positions are
+    passed in the order of `ids`, which is kept when particles are removed.
+
+    Attributes:
+
+        ids (array): ids of particles, increasing
+
+        land (array): particles on land at the last step
+    """
+
+    def __init__(self, landmask, skippoly=None):
+        if skippoly is not None:
+            assert not (
+                not skippoly and landmask.skippoly
+            ), "cannot check against polygons when not constructed with polygons"
+        else:
+            skippoly = landmask.skippoly
+
+        self.landmask = landmask
+        self.skippoly = skippoly
+        self.next_id = 0
+
+        self.ids = np.zeros((0, ), dtype=np.int64)
+        self.cells = np.zeros((0, ), dtype=np.int64)
+        self.land = np.zeros((0, ), dtype=bool)
+        self.coastal = np.zeros((0, ), dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __cells__(self, x, y):
+        lm = self.landmask
+
+        if hasattr(lm.mask, 'lookup') and len(x) > 0:
+            # cropped, the rest of the mask is not available
+            assert lm.mask.contains(x, y), "Points are not inside extent."
+
+        xm, ym = lm.__cells__(x, y)
+        return xm, ym, ym.astype(np.int64) * lm.nx + xm
+
+    def __classify__(self, x, y, xm, ym):
+        """
+        Look up cells xm, ym of particles at x, y in the mask and coastline
+        cells.
+
+        Returns:
+
+          land, coastal (arrays of bools)
+        """
+        lm = self.landmask
+        land, coastal = lm.__classify__(xm, ym, self.skippoly)
+
+        if not self.skippoly and lm.extent is not None and np.any(land):
+            import shapely.vectorized
+            assert np.all(
+                shapely.vectorized.contains(
+                    lm.extent, x[land],
+                    y[land])), "Points are not inside extent."
+
+        return land, coastal
+
+    def __refine__(self, x, y, xm, ym, c):
+        """
+        Check particles `c` (in cells crossed by the coastline) against the
+        polygons.
+        """
+        lm = self.landmask
+        return lm.__refiner__().contains(x[c], y[c], xm[c], ym[c],
+                                         lm.backend)
+
+    @staticmethod
+    def __positions__(x, y):
+        return (np.asarray(x, dtype=np.float64).reshape(-1),
+                np.asarray(y, dtype=np.float64).reshape(-1))
+
+    def add(self, x, y):
+        """
+        Add particles at x, y.
+
+        Returns:
+
+          ids of the new particles
+        """
+        x, y = self.__positions__(x, y)
+        n = len(x)
+
+        ids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+        self.next_id += n
+
+        xm, ym, cells = self.__cells__(x, y)
+        land, coastal = self.__classify__(x, y, xm, ym)
+
+        c = np.flatnonzero(coastal)
+        if len(c) > 0:
+            land[c] = self.__refine__(x, y, xm, ym, c)
+
+        self.ids = np.concatenate((self.ids, ids))
+        self.cells = np.concatenate((self.cells, cells))
+        self.land = np.concatenate((self.land, land))
+        self.coastal = np.concatenate((self.coastal, coastal))
+
+        return ids
+
+    def remove(self, ids):
+        """
+        Remove particles `ids`.
+        """
+        keep = ~np.isin(self.ids, ids)
+
+        self.ids = self.ids[keep]
+        self.cells = self.cells[keep]
+        self.land = self.land[keep]
+        self.coastal = self.coastal[keep]
+
+    def update(self, x, y):
+        """
+        Move the particles to x, y (in the order of `ids`) and check if they
+        are on land.
+
+        Returns:
+
+          array of bools, particles on land
+        """
+        x, y = self.__positions__(x, y)
+        assert len(x) == len(self.ids), "positions of %d particles, got %d" % (
+            len(self.ids), len(x))
+
+        xm, ym, cells = self.__cells__(x, y)
+
+        moved = np.flatnonzero(cells != self.cells)
+        if len(moved) > 0:
+            land, coastal = self.__classify__(x[moved], y[moved], xm[moved],
+                                              ym[moved])
+            self.land[moved] = land
+            self.coastal[moved] = coastal
+            self.cells[moved] = cells[moved]
+
+        # the position in the cell matters for particles in cells crossed by
+        # the coastline, these are checked every step.
+        coastal = np.flatnonzero(self.coastal)
+        if len(coastal) > 0:
+            self.land[coastal] = self.__refine__(x, y, xm, ym, coastal)
+
+        stats = self.landmask.__stats__
+        stats.count('particles.moved', len(moved))
+        stats.count('particles.coastal', len(coastal))
+
+        return self.land.copy()
@@ -0,0 +1,212 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+
+class QueryPlan:
+    """
+    Check batches of up to `n` points against a `Landmask` without allocating
+    temporary arrays, for checking the same (fixed-size) arrays of particles
+    every time step.
+
+    The cell coordinates are computed in float64 (also for float32 input),
+    and the cells, mask blocks and mask bytes of the points are computed in
+    preallocated scratch buffers. Points not in mixed blocks of the mask are
+    looked up at the first byte of the mask, and masked out, so that the
+    lookup does not depend on the number of points in mixed blocks.
+
+    Checking points against the polygons (and the extent) allocates arrays
+    for the points on land in the mask, and with a cropped or tiled mask the
+    points in mixed blocks are looked up as in `Landmask.contains`.
+    """
+
+    def __init__(self, landmask, n, skippoly=None, checkextent=True):
+        if skippoly is not None:
+            assert not (
+                not skippoly and landmask.skippoly
+            ), "cannot check against polygons when not constructed with polygons"
+        else:
+            skippoly = landmask.skippoly
+
+        self.landmask = landmask
+        self.n = n
+        self.skippoly = skippoly
+        self.checkextent = checkextent
+
+        # the affine transform has no rotation, x * a + y * 0 + c == x * a + c
+        t = landmask.invtransform
+        assert t.b == 0 and t.d == 0
+        self.a, self.c, self.e, self.f = t.a, t.c, t.e, t.f
+
+        self.blocks = np.ascontiguousarray(landmask.pyramid[0])
+        self.blocks_flat = self.blocks.reshape(-1)
+
+        # direct lookups only in plain (memmapped) bit-packed arrays
+        self.mask_flat = self.__flat__(landmask.mask)
+        self.coast_flat = None if skippoly else self.__flat__(landmask.coast)
+
+        self.u = np.empty(n, dtype=np.float64)
+        self.v = np.empty(n, dtype=np.float64)
+        self.xm = np.empty(n, dtype=np.int32)
+        self.ym = np.empty(n, dtype=np.int32)
+        self.i = np.empty(n, dtype=np.int64)
+        self.k = np.empty(n, dtype=np.int32)
+        self.block = np.empty(n, dtype=np.uint8)
+        self.byte = np.empty(n, dtype=np.uint8)
+        self.mixed = np.empty(n, dtype=bool)
+        self.bit = np.empty(n, dtype=bool)
+
+    @staticmethod
+    def __flat__(packed):
+        if isinstance(packed, np.ndarray) and packed.flags.c_contiguous:
+            return packed.reshape(-1)
+        else:
+            return None
+
+    @property
+    def nbytes(self):
+        """
+        Size of the scratch buffers.
+        """
+        return sum(
+            b.nbytes for b in (self.u, self.v, self.xm, self.ym, self.i,
+                               self.k, self.block, self.byte, self.mixed,
+                               self.bit))
+
+    def __cells__(self, x, y, m):
+        xm, ym = self.xm[:m], self.ym[:m]
+        u, v = self.u[:m], self.v[:m]
+        lm = self.landmask
+
+        np.multiply(x, self.a, out=u, dtype=np.float64)
+        np.add(u, self.c, out=u)
+        np.multiply(y, self.e, out=v, dtype=np.float64)
+        np.add(v, self.f, out=v)
+
+        np.copyto(xm, u, casting='unsafe')
+        np.copyto(ym, v, casting='unsafe')
+        np.minimum(xm, lm.nx - 1, out=xm)
+        np.minimum(ym, lm.ny - 1, out=ym)
+
+        return xm, ym
+
+    def __lookup__(self, flat, xm, ym, select, out):
+        """
+        Look up cells xm, ym in the flattened bit-packed array, where `select`
+        (and False elsewhere).
+        """
+        m = len(xm)
+        i, k, byte = self.i[:m], self.k[:m], self.byte[:m]
+
+        # byte of each cell, the first byte of the array where not selected
+        np.multiply(ym, self.landmask.nxp, out=i, dtype=np.int64)
+        np.right_shift(xm, 3, out=k)
+        np.add(i, k, out=i)
+        np.multiply(i, select, out=i)
+        np.take(flat, i, out=byte, mode='clip')
+
+        # bit of each cell, MSB first
+        np.bitwise_and(xm, 7, out=k)
+        np.subtract(7, k, out=k)
+        np.right_shift(byte, k, out=k)
+        np.bitwise_and(k, 1, out=k)
+        np.not_equal(k, 0, out=out)
+        np.logical_and(out, select, out=out)
+
+        return out
+
+    def contains(self, x, y, out=None):
+        """
+        Check if coordinates x, y are on land, as `Landmask.contains`.
+
+        Args:
+          x, y (arrays, deg): at most `n` points
+
+          out (array of bools): write the result here, default a new array
+
+        Returns:
+
+          `out`
+        """
+        m = len(x)
+        assert m <= self.n, "plan is for at most %d points, got %d" % (self.n,
+                                                                      m)
+        lm = self.landmask
+
+        if out is None:
+            out = np.empty(m, dtype=bool)
+        assert out.dtype == bool and out.shape == (m, ), "out must be %d bools" % m
+
+        lm.__stats__.count('points', m)
+        if m == 0:
+            return out
+
+        if hasattr(lm.mask, 'lookup'):
+            # cropped, the rest of the mask is not available
+            assert lm.mask.contains(x, y), "Points are not inside extent."
+
+        bbox = lm.__bbox_class__(x, y)
+        if bbox == lm.WATER:
+            out[:] = False
+            return out
+
+        xm, ym = self.__cells__(x, y, m)
+
+        if bbox == lm.LAND:
+            out[:] = True
+        else:
+            block, mixed = self.block[:m], self.mixed[:m]
+            i, k = self.i[:m], self.k[:m]
+
+            # block of the pyramid of each cell
+            np.right_shift(ym, lm.pyramid_shift, out=k)
+            np.multiply(k, self.blocks.shape[1], out=k)
+            np.right_shift(xm, lm.pyramid_shift, out=i)
+            np.add(i, k, out=i)
+            np.take(self.blocks_flat, i, out=block, mode='clip')
+
+            np.equal(block, lm.MIXED, out=mixed)
+
+            if self.mask_flat is not None:
+                self.__lookup__(self.mask_flat, xm, ym, mixed, out)
+            else:
+                mi = np.flatnonzero(mixed)
+                out[:] = False
+                out[mi] = lm.__lookup__(lm.mask, xm[mi], ym[mi])
+
+            np.logical_or(out, np.equal(block, lm.LAND, out=self.bit[:m]),
+                          out=out)
+
+        if not self.skippoly:
+            self.__refine__(x, y, xm, ym, out)
+
+        return out
+
+    def __refine__(self, x, y, xm, ym, out):
+        """
+        Check the points on land in cells crossed by the coastline against the
+        polygons.
+        """
+        lm = self.landmask
+        m = len(x)
+
+        if self.checkextent and lm.extent is not None:
+            import shapely.vectorized
+            landi = np.flatnonzero(out)
+            if len(landi) > 0:
+                assert np.all(
+                    shapely.vectorized.contains(
+                        lm.extent, x[landi],
+                        y[landi])), "Points are not inside extent."
+
+        if self.coast_flat is not None:
+            coastal = np.flatnonzero(
+                self.__lookup__(self.coast_flat, xm, ym, out, self.bit[:m]))
+        else:
+            landi = np.flatnonzero(out)
+            coastal = landi[lm.__lookup__(lm.coast, xm[landi], ym[landi])]
+
+        if len(coastal) > 0:
+            out[coastal] = lm.__refiner__().contains(
+                x[coastal], y[coastal], xm[coastal], ym[coastal], lm.backend)
+        lm.__stats__.count('polygon_checks', len(coastal))
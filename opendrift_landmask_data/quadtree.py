@@ -0,0 +1,320 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+## codes of roots that are leaves, internal roots are coded by the index of
+## their node (>= 0)
+WATER = -1
+LAND = -2
+
+## codes of quadrants in nodes, 2 bits each
+QWATER = 0
+QLAND = 1
+QNODE = 2
+
+## codes of the quadrants of each node, the number of quadrants that are nodes
+## in each node, and before each quadrant
+QUADRANTS = (np.arange(256)[:, None] >> (2 * np.arange(4))) & 3
+NODES = (QUADRANTS == QNODE).sum(axis=1).astype(np.uint8)
+NODES_BELOW = np.concatenate(
+    (np.zeros((256, 1), dtype=np.int64),
+     np.cumsum(QUADRANTS == QNODE, axis=1)[:, :3]),
+    axis=1).astype(np.uint8)
+
+## nodes per sample of the rank of the nodes
+RANK_BLOCK = 8
+
+
+class QuadTree:
+    """
+    The land cells of the mask crossed by the coastline, subdivided
+    recursively into quadrants where the coastline crosses them, down to
+    `depth` levels (cells of 1 / 2**depth of a mask cell). Quadrants that are
+    not crossed by the coastline are leaves (land or water), and so are the
+    quadrants at the deepest level, classified by their centre.
+
+    A point is classified by descending the tree of its cell, no geometry is
+    needed. Points are exact (as the polygons) except in the deepest
+    quadrants crossed by the coastline, so a misclassified point is closer
+    to the coastline than the diagonal of a deepest quadrant: `accuracy` (in
+    cells of the mask, multiply by `Landmask.dm` for metres at the equator).
+
+    The coastline crosses about 2**(k + 1) quadrants at level k of a cell, so
+    a cell has about 2**(depth + 1) nodes. Each node is a byte with the codes
+    (`QWATER`, `QLAND` or `QNODE`) of its 4 quadrants, in the order (x, y):
+    (0, 0), (1, 0), (0, 1), (1, 1). The nodes are stored level by level
+    (breadth first), so that the nodes of the quadrants that are nodes follow
+    in the same order as the quadrants: the node of a quadrant is found by
+    counting the quadrants that are nodes before it (its rank). The rank is
+    sampled every `RANK_BLOCK` nodes, 1.5 bytes per node in all.
+
+    The tree is stored in flat arrays, in a single `.npy` file that is
+    memmapped:
+
+        cells (uint32): sorted (ny * nx) indices of the roots (cells)
+
+        roots (int32): code of each root, `WATER`, `LAND` or the index of its node
+
+        ranks (uint32): index of the node of the first quadrant that is a node in each block of `RANK_BLOCK` nodes
+
+        nodes (uint8): codes of the quadrants of each node
+    """
+
+    def __init__(self, depth, nx, transform, cells, roots, nodes, ranks):
+        self.depth = int(depth)
+        self.nx = nx
+        self.transform = transform
+        self.invtransform = ~transform
+        self.cells = cells
+        self.roots = roots
+        self.nodes = nodes
+        self.ranks = ranks
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def accuracy(self):
+        """
+        Maximum distance (in cells) of misclassified points from the
+        coastline.
+        """
+        return np.sqrt(2.) / 2**self.depth
+
+    @property
+    def nbytes(self):
+        return (self.cells.nbytes + self.roots.nbytes + self.nodes.nbytes +
+                self.ranks.nbytes)
+
+    @staticmethod
+    def build(tiles, cells, nx, transform, depth, chunk=4096):
+        """
+        Build the trees of `cells` from the polygons of `tiles`.
+
+        The cells are subdivided `chunk` cells at the time, keeping only the
+        polygons of the rows of tiles of the chunk, so that memory use does
+        not grow with the number of cells (beyond the tree itself).
+
+        Args:
+
+            tiles (TileIndex): land polygons clipped to tiles
+
+            cells (array): sorted (ny * nx) indices of land cells crossed by the coastline
+
+            nx (int): cells along x
+
+            transform (Affine): transform from cells to lon, lat
+
+            depth (int): levels of quadrants below the cells
+
+            chunk (int): cells subdivided at the time
+        """
+        cells = np.asarray(cells, dtype=np.int64)
+        roots = np.empty(len(cells), dtype=np.int32)
+        levels = [[] for _ in range(depth)]  # nodes of each level, by chunk
+        geoms = {}
+        n = 0  # roots that are nodes
+
+        for c0 in range(0, len(cells), chunk):
+            c = cells[c0:c0 + chunk]
+
+            # only the fragments of the rows of tiles of this chunk and below
+            # are needed from now on
+            row = (c[0] // nx) >> tiles.shift
+            for i in [i for i, g in geoms.items() if g[2] < row]:
+                del geoms[i]
+
+            code = QuadTree.__classify__(tiles, geoms, transform, c % nx,
+                                         c // nx, 1., depth > 0)
+            node = code == QNODE
+            roots[c0:c0 + chunk] = np.where(
+                node, n + np.cumsum(node) - 1,
+                np.where(code == QLAND, LAND, WATER))
+            n += np.count_nonzero(node)
+
+            # corners (in cells) of the nodes of the current level
+            xm = c[node] % nx
+            ym = c[node] // nx
+            u0 = xm.astype(np.float64)
+            v0 = ym.astype(np.float64)
+
+            q = np.arange(4)
+            for k in range(1, depth + 1):
+                if len(xm) == 0:
+                    break
+
+                s = .5**k
+                u0 = (u0[:, None] + (q & 1) * s).ravel()
+                v0 = (v0[:, None] + (q >> 1) * s).ravel()
+                xm = np.repeat(xm, 4)
+                ym = np.repeat(ym, 4)
+
+                code = QuadTree.__classify__(tiles, geoms, transform, xm, ym,
+                                             s, k < depth, u0, v0)
+                levels[k - 1].append(
+                    (code.reshape(-1, 4).astype(np.uint8) <<
+                     (2 * q).astype(np.uint8)).sum(axis=1, dtype=np.uint8))
+
+                node = code == QNODE
+                xm, ym, u0, v0 = xm[node], ym[node], u0[node], v0[node]
+
+        nodes = np.concatenate([np.zeros((0, ), dtype=np.uint8)] +
+                               [l for level in levels for l in level])
+        counts = np.concatenate(([0], np.cumsum(NODES[nodes],
+                                                dtype=np.int64)))
+        ranks = (n + counts[::RANK_BLOCK][:(len(nodes) + RANK_BLOCK - 1) //
+                                          RANK_BLOCK]).astype(np.uint32)
+
+        logger.debug("%d nodes in %d levels" % (len(nodes), depth))
+
+        return QuadTree(depth, nx, transform, cells.astype(np.uint32), roots,
+                        nodes, ranks)
+
+    @staticmethod
+    def __classify__(tiles,
+                     geoms,
+                     transform,
+                     xm,
+                     ym,
+                     s,
+                     subdivide,
+                     u0=None,
+                     v0=None):
+        """
+        Codes of the quadrants of size `s` with corners u0, v0 (default the
+        cells xm, ym): `QNODE` if the coastline crosses them (and
+        `subdivide`), else `QLAND` or `QWATER` by their centre.
+        """
+        import shapely
+
+        if u0 is None:
+            u0 = xm.astype(np.float64)
+            v0 = ym.astype(np.float64)
+
+        x0, y0 = transform * (u0, v0)
+        x1, y1 = transform * (u0 + s, v0 + s)
+        cx, cy = transform * (u0 + .5 * s, v0 + .5 * s)
+
+        t = tiles.index[ym >> tiles.shift, xm >> tiles.shift]
+        code = np.full(len(u0), QWATER, dtype=np.uint8)
+
+        # group quadrants by tile
+        order = np.argsort(t, kind='stable')
+        ts = t[order]
+        splits = np.flatnonzero(np.diff(ts)) + 1
+        for a, b in zip(np.r_[0, splits], np.r_[splits, len(ts)]):
+            if a == b or ts[a] < 0:
+                continue
+
+            i = order[a:b]
+            g = geoms.get(ts[a])
+            if g is None:
+                g = tiles.geometry(ts[a])
+                boundary = g.boundary
+                shapely.prepare(g)
+                shapely.prepare(boundary)
+                g = geoms[ts[a]] = (g, boundary, ym[i[0]] >> tiles.shift)
+            g, boundary, _ = g
+
+            code[i] = np.where(shapely.contains_xy(g, cx[i], cy[i]), QLAND,
+                               QWATER)
+            if subdivide:
+                crossed = shapely.intersects(
+                    boundary,
+                    shapely.box(np.minimum(x0[i], x1[i]),
+                                np.minimum(y0[i], y1[i]),
+                                np.maximum(x0[i], x1[i]),
+                                np.maximum(y0[i], y1[i])))
+                code[i[crossed]] = QNODE
+
+        return code
+
+    def save(self, f):
+        header = np.array([self.depth, len(self.cells), len(self.nodes), 0],
+                          dtype=np.int32)
+        np.save(
+            f,
+            np.concatenate([
+                a.view(np.uint8) for a in (header, self.cells, self.roots,
+                                           self.ranks, self.nodes)
+            ]))
+
+    @staticmethod
+    def load(f, nx, transform):
+        d = np.load(f, mmap_mode='r')
+        depth, n, m, _ = (int(v) for v in d[:16].view(np.int32))
+        nr = (m + RANK_BLOCK - 1) // RANK_BLOCK
+
+        o = 16
+        cells = d[o:o + 4 * n].view(np.uint32)
+        o += 4 * n
+        roots = d[o:o + 4 * n].view(np.int32)
+        o += 4 * n
+        ranks = d[o:o + 4 * nr].view(np.uint32)
+        o += 4 * nr
+        nodes = d[o:o + m]
+
+        return QuadTree(depth, nx, transform, cells, roots, nodes, ranks)
+
+    def __rank__(self, j):
+        """
+        Index of the node of the first quadrant that is a node in nodes `j`.
+        """
+        r = self.ranks[j // RANK_BLOCK].astype(np.int64)
+        base = j - j % RANK_BLOCK
+        last = len(self.nodes) - 1
+        for t in range(RANK_BLOCK - 1):
+            i = base + t
+            r += NODES[self.nodes[np.minimum(i, last)]] * (i < j)
+        return r
+
+    def contains(self, x, y, xm, ym, backend=None):
+        """
+        Check points x, y in cells xm, ym (which must be land cells crossed
+        by the coastline) by descending the trees of their cells. Same
+        signature as `TileIndex.contains`, `backend` is not used.
+
+        Returns:
+
+            array of bools same length as x and y
+        """
+        if len(x) == 0:
+            return np.zeros(x.shape, dtype=bool)
+
+        r = np.searchsorted(self.cells,
+                            (ym.astype(np.int64) * self.nx + xm).astype(
+                                np.uint32))
+        r = np.minimum(r, len(self.cells) - 1)
+        assert np.all(self.cells[r] == ym.astype(np.int64) * self.nx +
+                      xm), "cells are not in quadtree"
+        code = np.array(self.roots[r], dtype=np.int64)
+
+        # position in the cell, in [0, 1)
+        u, v = self.invtransform * (np.asarray(x, dtype=np.float64),
+                                    np.asarray(y, dtype=np.float64))
+        below = np.nextafter(1., 0.)
+        fu = np.clip(u - xm, 0., below)
+        fv = np.clip(v - ym, 0., below)
+
+        for _ in range(self.depth):
+            a = np.flatnonzero(code >= 0)
+            if len(a) == 0:
+                break
+
+            fu[a] *= 2.
+            fv[a] *= 2.
+            qx = (fu[a] >= 1.).astype(np.int64)
+            qy = (fv[a] >= 1.).astype(np.int64)
+            fu[a] -= qx
+            fv[a] -= qy
+            q = qx + 2 * qy
+
+            j = code[a]
+            node = np.asarray(self.nodes[j])
+            c = (node >> (2 * q).astype(np.uint8)) & 3
+            code[a] = np.where(
+                c == QNODE,
+                self.__rank__(j) + NODES_BELOW[node, q],
+                np.where(c == QLAND, LAND, WATER))
+
+        return code == LAND
@@ -1,21 +1,25 @@
+import os.path
+import tempfile
 import numpy as np
 import rasterio
 from rasterio.features import rasterize, geometry_mask
 from rasterio import Affine
 import shapely.wkb as wkb
 
-if __name__ == '__main__':
-    from gshhs import get_gshhs_f
-    from mask import Landmask
-else:
-    from .gshhs import get_gshhs_f
-    from .mask import Landmask
+if not __package__:
+    raise SystemExit("run as: python -m opendrift_landmask_data.rasterize")
+from .gshhs import shapes
+from .mask import Landmask
+from .tiledmask import TiledMask
+from .tiles import polygons
+
+masks = os.path.join(os.path.dirname(__file__), 'masks')
 
 
-def gshhs_rasterize(inwkb, outtif):
-    dnm = Landmask.dnm
-    nx = Landmask.nx
-    ny = Landmask.ny
+def gshhs_rasterize(inwkb, outtif, landmask=Landmask):
+    dnm = landmask.dnm
+    nx = landmask.nx
+    ny = landmask.ny
     x = [-180, 180]
     y = [-90, 90]
 
@@ -23,7 +27,7 @@ def gshhs_rasterize(inwkb, outtif):
 
     resx = float(x[1] - x[0]) / nx
     resy = float(y[1] - y[0]) / ny
-    transform = Landmask.get_transform()
+    transform = landmask.get_transform()
     print("transform = ", transform)
 
     land = wkb.load(inwkb)
@@ -56,28 +60,54 @@ def gshhs_rasterize(inwkb, outtif):
     return img
 
 
-def mask_rasterize(inwkb, outnp):
-    dnm = Landmask.dnm
-    nx = Landmask.nx
-    ny = Landmask.ny
-    x = [-180, 180]
-    y = [-90, 90]
+def mask_rasterize(inwkb, outnp, landmask=Landmask, tile=4096,
+                   workers=None):
+    """
+    Rasterize the polygons on the grid of `landmask` (the class for a
+    resolution, see `Landmask.for_resolution`).
+
+    The grid is rasterized in tiles of `tile` x `tile` cells on a pool of
+    `workers` processes (default: number of CPUs), each tile with the polygons
+    clipped to it (padded by a couple of cells, so that the clipped edges do
+    not touch the tile), and written directly to the memmap. Only a few tiles
+    are in memory at the time.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import os
+
+    dnm = landmask.dnm
+    nx = landmask.nx
+    ny = landmask.ny
 
     print('nx =', nx, 'ny =', ny)
 
-    resx = float(x[1] - x[0]) / nx
-    resy = float(y[1] - y[0]) / ny
-    transform = Landmask.get_transform()
+    assert tile % 8 == 0, "tiles must be whole bytes wide"
+
+    transform = landmask.get_transform()
     print("transform = ", transform)
 
-    img = np.memmap(outnp, dtype='uint8', mode='w+', shape=(ny, nx))
-    land = wkb.load(inwkb)
+    if workers is None:
+        workers = os.cpu_count() or 1
 
-    img[:] = geometry_mask(land,
-                           invert=True,
-                           out_shape=(ny, nx),
-                           all_touched=True,
-                           transform=transform).astype('uint8')
+    # bit-packed along x, 8 cells per byte
+    img = np.memmap(outnp, dtype='uint8', mode='w+', shape=(ny, nx // 8))
+
+    windows = [((r, min(r + tile, ny)), (c, min(c + tile, nx)))
+               for r in range(0, ny, tile) for c in range(0, nx, tile)]
+    print('rasterizing %d tiles on %d processes..' % (len(windows), workers))
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=worker_init,
+                             initargs=(inwkb.read(), )) as executor:
+        # a limited number of tiles ahead, to limit memory use
+        for w0 in range(0, len(windows), 2 * workers):
+            ws = windows[w0:w0 + 2 * workers]
+            for (rows, cols), t in zip(
+                    ws,
+                    executor.map(worker_rasterize, [transform] * len(ws),
+                                 *zip(*ws))):
+                if t is not None:
+                    img[rows[0]:rows[1], cols[0] // 8:cols[1] // 8] = t
 
     img.flush()
     print("img shape:", img.shape)
@@ -85,9 +115,175 @@ def mask_rasterize(inwkb, outnp):
     return img
 
 
+worker_polygons = None  # polygons and their index in rasterizing process
+
+
+def worker_init(data):
+    global worker_polygons
+    import shapely
+
+    land = polygons(wkb.loads(data))
+    worker_polygons = (land, shapely.STRtree(land))
+
+
+def worker_rasterize(transform, rows, cols, pad=2):
+    """
+    Rasterize cells rows[0]:rows[1], cols[0]:cols[1] bit-packed, None if
+    there is no land.
+    """
+    import shapely
+
+    land, tree = worker_polygons
+    r0, r1 = rows
+    c0, c1 = cols
+
+    x0, y0 = transform * (c0 - pad, r0 - pad)
+    x1, y1 = transform * (c1 + pad, r1 + pad)
+    xmin, xmax = min(x0, x1), max(x0, x1)
+    ymin, ymax = min(y0, y1), max(y0, y1)
+
+    clipped = [
+        shapely.clip_by_rect(land[i], xmin, ymin, xmax, ymax)
+        for i in tree.query(shapely.box(xmin, ymin, xmax, ymax))
+    ]
+    clipped = [p for p in clipped if not p.is_empty]
+    if len(clipped) == 0:
+        return None
+
+    return np.packbits(geometry_mask(clipped,
+                                     invert=True,
+                                     out_shape=(r1 - r0, c1 - c0),
+                                     all_touched=True,
+                                     transform=transform *
+                                     Affine.translation(c0, r0)),
+                       axis=1)
+
+
+def pyramid_rasterize(mask, outnpz):
+    """
+    Summarize the bit-packed mask in blocks of 512 x 512 cells, and
+    successively coarser levels of 2 x 2 blocks. Each block is classified as
+    all water (0), all land (1) or mixed (2).
+    """
+    ny, nxp = mask.shape
+    bs = 1 << Landmask.pyramid_shift
+    bsp = bs // 8
+
+    print('pyramid block size =', bs)
+
+    starts = np.arange(0, nxp, bsp)
+    level = np.empty(((ny + bs - 1) // bs, len(starts)), dtype='uint8')
+
+    for i, r in enumerate(range(0, ny, bs)):
+        band = mask[r:r + bs, :]
+        anyland = np.logical_or.reduceat((band != 0).any(axis=0), starts)
+        allland = np.logical_and.reduceat((band == 0xff).all(axis=0), starts)
+
+        level[i, :] = np.where(allland, Landmask.LAND,
+                               np.where(anyland, Landmask.MIXED,
+                                        Landmask.WATER))
+
+    levels = [level]
+    while level.shape != (1, 1):
+        # pad odd edges by repeating the last block, this does not change
+        # the classification of the parent block.
+        level = np.pad(level, ((0, level.shape[0] % 2), (0, level.shape[1] % 2)),
+                       mode='edge')
+        c = [level[0::2, 0::2], level[0::2, 1::2],
+             level[1::2, 0::2], level[1::2, 1::2]]
+        level = np.where((c[0] == c[1]) & (c[0] == c[2]) & (c[0] == c[3]),
+                         c[0], Landmask.MIXED).astype('uint8')
+        levels.append(level)
+
+    print('pyramid levels:', [l.shape for l in levels])
+    np.savez(outnpz, *levels)
+
+    return levels
+
+
+def tiled_rasterize(mask, levels, outnpz):
+    """
+    Store the mixed blocks of the finest pyramid level of the bit-packed mask
+    as independently compressed tiles (see `TiledMask`).
+    """
+    tiled = TiledMask.build(mask, levels[0] == Landmask.MIXED,
+                            np.where(levels[0] == Landmask.LAND, 0xff, 0),
+                            Landmask.pyramid_shift, Landmask.tiled_cache)
+    print('compressed tiles:', len(tiled.data), 'bytes')
+    tiled.save(outnpz)
+
+    return tiled
+
+
+def shapes_file(resolution, shapesdir=shapes):
+    return os.path.join(
+        shapesdir,
+        'gshhs_%s_-180.000000E-90.000000N180.000000E90.000000N.wkb' %
+        resolution)
+
+
+def generate(resolution, shapesdir=shapes, outdir=masks, workers=None):
+    """
+    Rasterize the polygons of `resolution` in `shapesdir` on the grid of the
+    resolution, and write the pyramid and tiles of the mask to `outdir`. The
+    bit-packed mask itself is only written to a temporary file in `outdir`,
+    removed when done.
+
+    Returns:
+
+        pyramid and tiles files
+    """
+    landmask = Landmask.for_resolution(resolution)
+    wkbf = shapes_file(resolution, shapesdir)
+    pyramidf = os.path.join(outdir, 'pyramid_%.2f_nm.npz' % landmask.dnm)
+    tilesf = os.path.join(outdir, 'mask_%.2f_nm.tiles.npz' % landmask.dnm)
+
+    print("resolution '%s', m =" % resolution, landmask.dm)
+    with open(wkbf, 'rb') as fd, tempfile.NamedTemporaryFile(
+            dir=outdir, prefix='mask_%.2f_nm.' % landmask.dnm,
+            suffix='.packed.mm') as tmp:
+        img = mask_rasterize(fd, tmp, landmask, workers=workers)
+        levels = pyramid_rasterize(img, pyramidf)
+        tiled_rasterize(img, levels, tilesf)
+        del img
+
+    return pyramidf, tilesf
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Rasterize the GSHHS polygons to the masks of the package.'
+    )
+    parser.add_argument('resolutions',
+                        nargs='*',
+                        default=list(Landmask.resolutions),
+                        help='resolutions to rasterize (default: all)')
+    parser.add_argument('--shapes',
+                        default=shapes,
+                        help='directory of the polygons (default: %(default)s)')
+    parser.add_argument('--outdir',
+                        default=masks,
+                        help='directory of the masks (default: %(default)s)')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None,
+                        help='number of processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    for resolution in args.resolutions:
+        assert resolution in Landmask.resolutions, "unknown resolution: %s" % resolution
+        if not os.path.exists(shapes_file(resolution, args.shapes)):
+            print("no shapes for resolution '%s', skipping" % resolution)
+            continue
+
+        generate(resolution, args.shapes, args.outdir, args.workers)
+
+
 if __name__ == '__main__':
-    print("resolution, m =", Landmask.dm)
-    img = mask_rasterize(get_gshhs_f(), 'masks/mask_%.2f_nm.mm' % Landmask.dnm)
+    main()
+
     # img = gshhs_rasterize (get_gshhs_f(), 'masks/mask_%.2f_nm.tif' % Landmask.dnm)
 
     # print ("plotting.. (won't work at high res)")
@@ -1,19 +1,147 @@
 import os
 import os.path
-import cartopy
+import numpy as np
 from shapely.ops import unary_union
+from shapely.geometry import MultiPolygon
+import shapely
 import shapely.wkb
 
+if not __package__:
+    raise SystemExit("run as: python -m opendrift_landmask_data.regenerate")
+from .gshhs import shapes
+from .tiles import polygons
+
+
+def partition(geoms, partitions):
+    """
+    Split `geoms` into `partitions` groups of about the same number of
+    geometries, in strips along x, and within each strip along y, by the
+    centers of their bounding boxes.
+    """
+    bounds = shapely.bounds(geoms)
+    cx = .5 * (bounds[:, 0] + bounds[:, 2])
+    cy = .5 * (bounds[:, 1] + bounds[:, 3])
+
+    strips = max(int(np.sqrt(partitions)), 1)
+    groups = []
+    for s in np.array_split(np.argsort(cx, kind='stable'), strips):
+        per = max(partitions // strips, 1)
+        for g in np.array_split(s[np.argsort(cy[s], kind='stable')], per):
+            if len(g) > 0:
+                groups.append(geoms[g])
+
+    return groups
+
+
+def stitch(parts):
+    """
+    Merge the unions of partitions: only the polygons that intersect (or
+    touch) polygons of other partitions, along the seams between the
+    partitions, are joined.
+    """
+    polys = []
+    part = []
+    for k, p in enumerate(parts):
+        ps = polygons(p)
+        polys.extend(ps)
+        part.extend([k] * len(ps))
+
+    if len(polys) == 0:
+        return MultiPolygon()
+
+    polys = np.array(polys, dtype=object)
+    part = np.array(part)
+
+    a, b = shapely.STRtree(polys).query(polys, predicate='intersects')
+    seam = part[a] != part[b]
+    a = a[seam]
+    b = b[seam]
+
+    # join connected polygons
+    parent = np.arange(len(polys))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(a, b):
+        ri, rj = root(i), root(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    roots = np.array([root(i) for i in range(len(polys))])
+    joined = []
+    for r in np.unique(roots):
+        c = np.flatnonzero(roots == r)
+        if len(c) == 1:
+            joined.append(polys[c[0]])
+        else:
+            joined.extend(polygons(unary_union(polys[c])))
+
+    print("stitched %d polygons along seams" % len(np.unique(a)))
+
+    return MultiPolygon(joined)
+
+
+def union(geoms, partitions=None, workers=None):
+    """
+    Union of `geoms`, computed for spatial partitions of the geometries on a
+    pool of `workers` processes (default: number of CPUs) and stitched
+    together along the seams.
+
+    Args:
+
+        geoms (list): polygons
+
+        partitions (int): number of partitions, default: 4 per worker
+
+        workers (int): number of processes
+
+    Returns:
+
+        MultiPolygon
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if partitions is None:
+        partitions = 4 * workers
+
+    geoms = np.array(list(geoms), dtype=object)
+    if len(geoms) == 0:
+        return MultiPolygon()
+
+    groups = partition(geoms, partitions)
+    print("union of %d polygons in %d partitions on %d processes.." %
+          (len(geoms), len(groups), workers))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(unary_union, groups))
+    else:
+        parts = [unary_union(g) for g in groups]
+
+    return stitch(parts)
+
+
+def generate(resolution, outdir=shapes, workers=None):
+    """
+    Join the GSHHS land polygons (from cartopy) at `resolution` and save them
+    as WKB in `outdir`.
+    """
+    import cartopy.feature
 
-def generate(resolution):
     reader = cartopy.feature.GSHHSFeature(scale=resolution, level=2)
-    land_geom = unary_union(list(reader.geometries()))
+    land_geom = union(reader.geometries(), workers=workers)
 
     xmin, ymin = -180, -90
     xmax, ymax = 180, 90
-    if not os.path.exists("shapes"): os.makedirs("shapes")
+    if not os.path.exists(outdir): os.makedirs(outdir)
     cachef = os.path.join(
-        "shapes", "%s_%s_%3.6fE%3.6fN%3.6fE%3.6fN.wkb" %
+        outdir, "%s_%s_%3.6fE%3.6fN%3.6fE%3.6fN.wkb" %
         ("gshhs", resolution, xmin, ymin, xmax, ymax))
 
     print("saving cache to: %s.." % cachef)
@@ -21,14 +149,34 @@ def generate(resolution):
     with open(cachef, 'wb') as fd:
         fd.write(shapely.wkb.dumps(land_geom))
 
+    return cachef
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Join the GSHHS polygons (from cartopy) and save them.')
+    parser.add_argument('resolutions',
+                        nargs='*',
+                        default=['c', 'l', 'i', 'h', 'f'],
+                        help='resolutions to join (default: all)')
+    parser.add_argument('--outdir',
+                        default=shapes,
+                        help='directory of the polygons (default: %(default)s)')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None,
+                        help='number of processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    print("pre generating cache for sources and resolutions for entire world")
+    for resolution in args.resolutions:
+        print("preparing cache for %s, resolution '%s'.." %
+              ("gshhs", resolution))
+        generate(resolution, args.outdir, args.workers)
+    print("done.")
+
 
-print("pre generating cache for sources and resolutions for entire world")
-from concurrent.futures import ProcessPoolExecutor
-with ProcessPoolExecutor(max_workers=8) as executor:
-    resolutions = ['c', 'l', 'i', 'h', 'f']
-    for resolution in resolutions:
-        print(
-            "preparing cache for %s, resolution '%s'.. this will take a while"
-            % ("gshhs", resolution))
-        executor.submit(generate, resolution)
-print("done.")
+if __name__ == '__main__':
+    main()
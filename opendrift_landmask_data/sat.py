@@ -0,0 +1,77 @@
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+## number of bits set in each byte
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None],
+                         axis=1).sum(axis=1).astype(np.uint8)
+
+
+def sat_rasterize(mask, out, block=8, rows=512):
+    """
+    Summed-area table of the land cells of the bit-packed mask, in blocks of
+    `block` x `block` cells: `out[j, i]` is the number of land cells in blocks
+    [0, j) x [0, i), so `out` has a row and column more than there are blocks.
+
+    Args:
+
+        mask (array): bit-packed (ny, nx // 8) mask
+
+        out (array): (ceil(ny / block) + 1, nx // block + 1) uint32 array
+
+        block (int): block size in cells, a multiple of 8
+
+        rows (int): number of mask rows to count at the time
+    """
+    ny, nxp = mask.shape
+    bp = block // 8
+    rows = max(rows // block, 1) * block
+
+    assert block % 8 == 0 and nxp % bp == 0
+    assert out.shape == ((ny + block - 1) // block + 1, nxp // bp + 1)
+
+    out[0, :] = 0
+    out[:, 0] = 0
+    above = np.zeros(out.shape[1] - 1, dtype=np.int64)
+
+    for r in range(0, ny, rows):
+        m = POPCOUNT[mask[r:r + rows, :]]
+        if len(m) % block:
+            m = np.pad(m, ((0, block - len(m) % block), (0, 0)))
+
+        # land cells in each block of the band
+        counts = m.reshape(-1, block, nxp // bp, bp).sum(axis=(1, 3),
+                                                         dtype=np.int64)
+
+        # sums over all blocks above and to the left
+        sums = np.cumsum(np.cumsum(counts, axis=0), axis=1) + above
+        above = sums[-1, :]
+
+        j = r // block + 1
+        out[j:j + len(sums), 1:] = sums
+
+    return out
+
+
+def sat_integral(sat, u, v):
+    """
+    Land cells in blocks [0, u) x [0, v) (continuous, in blocks), assuming
+    the land is spread evenly over each block. This is the bilinear
+    interpolation of the summed-area table.
+    """
+    nj, ni = sat.shape
+    u = np.clip(u, 0., ni - 1.)
+    v = np.clip(v, 0., nj - 1.)
+
+    i = np.minimum(np.floor(u).astype(np.int64), ni - 2)
+    j = np.minimum(np.floor(v).astype(np.int64), nj - 2)
+    wu = u - i
+    wv = v - j
+
+    s00 = sat[j, i].astype(np.float64)
+    s01 = sat[j, i + 1].astype(np.float64)
+    s10 = sat[j + 1, i].astype(np.float64)
+    s11 = sat[j + 1, i + 1].astype(np.float64)
+
+    return (1. - wv) * ((1. - wu) * s00 + wu * s01) + wv * (
+        (1. - wu) * s10 + wu * s11)
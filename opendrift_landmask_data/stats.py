@@ -0,0 +1,74 @@
+import time
+import threading
+import contextlib
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Stats:
+    """
+    Cumulative timings (s) and counters of the stages of `Landmask`, safe to
+    update from several threads.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.timings = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            with self.lock:
+                self.timings[stage] = self.timings.get(stage, 0.) + dt
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def reset(self):
+        with self.lock:
+            self.timings.clear()
+            self.counts.clear()
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'timings': dict(self.timings),
+                'counts': dict(self.counts)
+            }
+
+    def log(self, level=logging.INFO):
+        s = self.as_dict()
+        for k, v in sorted(s['timings'].items()):
+            logger.log(level, "%-20s %10.4f s" % (k, v))
+        for k, v in sorted(s['counts'].items()):
+            logger.log(level, "%-20s %10d" % (k, v))
+
+
+class NullStats:
+    """
+    Stats that are not recorded.
+    """
+    enabled = False
+    null = contextlib.nullcontext()
+
+    def time(self, stage):
+        return self.null
+
+    def count(self, name, n=1):
+        pass
+
+    def reset(self):
+        pass
+
+    def as_dict(self):
+        return None
+
+    def log(self, level=logging.INFO):
+        pass
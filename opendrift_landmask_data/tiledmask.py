@@ -0,0 +1,236 @@
+import numpy as np
+import os
+import zlib
+import threading
+from collections import OrderedDict
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TiledMask:
+    """
+    Read-only bit-packed mask stored as independently compressed (zlib) tiles
+    of the blocks of the mask pyramid. Only mixed blocks are stored, all water
+    and all land blocks are filled in with a constant. Tiles are decompressed
+    the first time they are used and kept in a least-recently-used cache of at
+    most `max_bytes`.
+
+    Supports the indexing the mask is used with: pairs of integer arrays
+    (rows, packed columns) and slices.
+    """
+
+    def __init__(self, shape, shift, fill, offsets, sizes, data, max_bytes):
+        """
+        Args:
+
+            shape (tuple): (ny, nx // 8) shape of packed mask
+
+            shift (int): log2 of tile size in cells
+
+            fill (array): (nty, ntx) value of all bytes of tiles not stored (0x00 or 0xff)
+
+            offsets (array): (nty, ntx) offsets of compressed tiles in data, -1 for tiles not stored
+
+            sizes (array): (nty, ntx) sizes of compressed tiles
+
+            data (array): concatenated compressed tiles
+
+            max_bytes (int): maximum size of decompressed tiles to keep
+        """
+        self.shape = tuple(int(s) for s in shape)
+        self.shift = shift
+        self.fill = fill
+        self.offsets = offsets
+        self.sizes = sizes
+        self.data = data
+        self.max_bytes = max_bytes
+
+        self.rows = 1 << shift
+        self.cols = (1 << shift) // 8
+
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def build(mask, mixed, fill, shift, max_bytes):
+        """
+        Split up the bit-packed `mask` in tiles of (1 << shift) x (1 << shift)
+        cells and compress the tiles that are `mixed` (array of bools). The
+        rest are assumed to be filled with `fill`.
+        """
+        rows = 1 << shift
+        cols = rows // 8
+
+        offsets = np.full(mixed.shape, -1, dtype=np.int64)
+        sizes = np.zeros(mixed.shape, dtype=np.int64)
+        data = []
+        n = 0
+        for i, j in zip(*np.nonzero(mixed)):
+            t = zlib.compress(
+                np.ascontiguousarray(mask[i * rows:(i + 1) * rows,
+                                          j * cols:(j + 1) * cols]).tobytes(),
+                9)
+            offsets[i, j] = n
+            sizes[i, j] = len(t)
+            data.append(t)
+            n += len(t)
+
+        logger.debug("compressed %d tiles to %d bytes" % (len(data), n))
+
+        return TiledMask(mask.shape, shift, fill, offsets, sizes,
+                         np.frombuffer(b''.join(data), dtype=np.uint8),
+                         max_bytes)
+
+    def save(self, f):
+        np.savez(f,
+                 shape=np.array(self.shape),
+                 shift=self.shift,
+                 offsets=self.offsets,
+                 sizes=self.sizes,
+                 data=self.data)
+
+    @staticmethod
+    def load(f, fill, max_bytes):
+        with np.load(f) as d:
+            return TiledMask(d['shape'], int(d['shift']), fill, d['offsets'],
+                             d['sizes'], d['data'], max_bytes)
+
+    def decompress(self, i, j):
+        """
+        Tile i, j as (rows, cols) array, not cached.
+        """
+        shape = (min(self.rows, self.shape[0] - i * self.rows),
+                 min(self.cols, self.shape[1] - j * self.cols))
+
+        o = self.offsets[i, j]
+        if o < 0:
+            return np.full(shape, self.fill[i, j], dtype=np.uint8)
+
+        n = self.sizes[i, j]
+
+        logger.debug("decompressing tile %d, %d" % (i, j))
+        return np.frombuffer(zlib.decompress(self.data[o:o + n].tobytes()),
+                             dtype=np.uint8).reshape(shape)
+
+    def band(self, i):
+        """
+        Row of tiles `i` as (rows, nx // 8) array, not cached.
+        """
+        out = np.empty((min(self.rows, self.shape[0] - i * self.rows),
+                        self.shape[1]),
+                       dtype=np.uint8)
+        for j in range(self.fill.shape[1]):
+            out[:, j * self.cols:(j + 1) * self.cols] = self.decompress(i, j)
+        return out
+
+    def write(self, fd, workers=None):
+        """
+        Write the whole mask to the file `fd`. The rows of tiles are
+        decompressed in parallel on `workers` threads (default: number of
+        CPUs), zlib releases the GIL while decompressing.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        nty = self.fill.shape[0]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # a limited number of rows ahead, to limit memory use
+            for b0 in range(0, nty, 2 * workers):
+                for band in executor.map(self.band,
+                                         range(b0, min(b0 + 2 * workers,
+                                                       nty))):
+                    fd.write(band.tobytes())
+
+    def tile(self, i, j):
+        """
+        Tile i, j as (rows, cols) array, decompressed if necessary.
+        """
+        with self.lock:
+            t = self.cache.get((i, j))
+            if t is not None:
+                self.cache.move_to_end((i, j))
+                return t
+
+        t = self.decompress(i, j)
+        if self.offsets[i, j] < 0:
+            return t
+
+        with self.lock:
+            # another thread may have decompressed the same tile meanwhile
+            cached = self.cache.get((i, j))
+            if cached is not None:
+                self.cache.move_to_end((i, j))
+                return cached
+
+            self.cache[(i, j)] = t
+            self.cache_bytes += t.nbytes
+
+            while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+                _, old = self.cache.popitem(last=False)
+                self.cache_bytes -= old.nbytes
+
+        return t
+
+    def __getitem__(self, key):
+        r, c = key
+
+        if isinstance(r, slice) or isinstance(c, slice):
+            return self.region(r, c)
+
+        r = np.asarray(r)
+        c = np.asarray(c)
+        out = np.empty(r.shape, dtype=np.uint8)
+        if r.size == 0:
+            return out
+
+        ti = r // self.rows
+        tj = c // self.cols
+
+        # group by tile
+        t = ti * self.fill.shape[1] + tj
+        order = np.argsort(t.ravel(), kind='stable')
+        ts = t.ravel()[order]
+        splits = np.flatnonzero(np.diff(ts)) + 1
+
+        rf = r.ravel()
+        cf = c.ravel()
+        of = out.reshape(-1)
+        for a, b in zip(np.r_[0, splits], np.r_[splits, len(ts)]):
+            k = order[a:b]
+            i, j = divmod(int(ts[a]), self.fill.shape[1])
+            of[k] = self.tile(i, j)[rf[k] - i * self.rows,
+                                    cf[k] - j * self.cols]
+
+        return out
+
+    def region(self, r, c):
+        """
+        Rows `r` and columns `c` (ints or slices, step 1) as an array.
+        """
+        r0, r1, _ = (r if isinstance(r, slice) else slice(r, r + 1)).indices(
+            self.shape[0])
+        c0, c1, _ = (c if isinstance(c, slice) else slice(c, c + 1)).indices(
+            self.shape[1])
+
+        out = np.empty((max(r1 - r0, 0), max(c1 - c0, 0)), dtype=np.uint8)
+
+        for i in range(r0 // self.rows, (r1 - 1) // self.rows + 1):
+            for j in range(c0 // self.cols, (c1 - 1) // self.cols + 1):
+                a0 = max(r0, i * self.rows)
+                a1 = min(r1, (i + 1) * self.rows)
+                b0 = max(c0, j * self.cols)
+                b1 = min(c1, (j + 1) * self.cols)
+
+                out[a0 - r0:a1 - r0, b0 - c0:b1 - c0] = self.tile(i, j)[
+                    a0 - i * self.rows:a1 - i * self.rows,
+                    b0 - j * self.cols:b1 - j * self.cols]
+
+        if not isinstance(r, slice):
+            out = out[0, :]
+        if not isinstance(c, slice):
+            out = out[..., 0]
+
+        return out
@@ -0,0 +1,252 @@
+import numpy as np
+import shapely.wkb as wkb
+from shapely.geometry import box, MultiPolygon
+import logging
+logger = logging.getLogger(__name__)
+
+
+def polygons(geom):
+    """
+    The polygonal parts of `geom`.
+    """
+    if geom.geom_type == 'Polygon':
+        return [geom] if not geom.is_empty else []
+    elif hasattr(geom, 'geoms'):
+        return [p for g in geom.geoms for p in polygons(g)]
+    else:
+        return []
+
+
+class TileIndex:
+    """
+    The land polygons clipped to a fixed grid of tiles of (1 << shift) x (1 <<
+    shift) mask cells. A point is only checked against the fragment of the
+    coastline in its tile, so that the cost of the check depends on the local
+    complexity of the coastline rather than on the size of the continent.
+
+    Tiles are padded by one cell on each side so that points clamped to the
+    edge cells of the mask are covered as well. Fragments are stored as WKB and
+    parsed and prepared (by the backend checking the points, see `backends`)
+    the first time a tile is used.
+    """
+
+    def __init__(self, shift, transform, index, offsets, data):
+        """
+        Args:
+
+            shift (int): log2 of tile size in cells
+
+            transform (Affine): transform from cells to lon, lat
+
+            index (array): (nty, ntx) index of fragment in tile, -1 if no land
+
+            offsets (array): offsets of fragments in data
+
+            data (array): concatenated WKB of fragments
+        """
+        self.shift = shift
+        self.transform = transform
+        self.index = index
+        self.offsets = offsets
+        self.data = data
+        self.fragments = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getstate__(self):
+        # the parsed fragments are not pickled, they are parsed again on use
+        state = self.__dict__.copy()
+        state['fragments'] = {}
+        return state
+
+    @staticmethod
+    def tile_box(transform, shift, tx0, ty0, tx1, ty1):
+        """
+        Bounding box of tiles tx0..tx1, ty0..ty1 (inclusive) padded by one cell.
+        """
+        s = 1 << shift
+        x0, y0 = transform * (tx0 * s - 1, ty0 * s - 1)
+        x1, y1 = transform * ((tx1 + 1) * s + 1, (ty1 + 1) * s + 1)
+        return box(x0, y0, x1, y1)
+
+    @staticmethod
+    def build(land, shape, shift, transform):
+        """
+        Clip the polygons in `land` to tiles.
+
+        Polygons spanning several tiles are clipped recursively, halving the
+        range of tiles each time, so that large polygons are not intersected
+        with every tile they cover.
+
+        Args:
+
+            land (MultiPolygon): land polygons
+
+            shape (tuple): (ny, nx) shape of mask in cells
+
+            shift (int): log2 of tile size in cells
+
+            transform (Affine): transform from cells to lon, lat
+        """
+        s = 1 << shift
+        nty = (shape[0] + s - 1) >> shift
+        ntx = (shape[1] + s - 1) >> shift
+        invtransform = ~transform
+
+        pieces = {}
+
+        def clip(geom, tx0, ty0, tx1, ty1):
+            if geom.is_empty:
+                return
+
+            if tx0 == tx1 and ty0 == ty1:
+                pieces.setdefault((ty0, tx0), []).extend(polygons(geom))
+
+            elif tx1 - tx0 >= ty1 - ty0:
+                m = (tx0 + tx1) // 2
+                for h in ((tx0, ty0, m, ty1), (m + 1, ty0, tx1, ty1)):
+                    clip(
+                        geom.intersection(
+                            TileIndex.tile_box(transform, shift, *h)), *h)
+
+            else:
+                m = (ty0 + ty1) // 2
+                for h in ((tx0, ty0, tx1, m), (tx0, m + 1, tx1, ty1)):
+                    clip(
+                        geom.intersection(
+                            TileIndex.tile_box(transform, shift, *h)), *h)
+
+        for p in polygons(land):
+            xmin, ymin, xmax, ymax = p.bounds
+            xm0, ym0 = invtransform * (xmin, ymin)
+            xm1, ym1 = invtransform * (xmax, ymax)
+
+            tx0 = min(max(int(np.floor((xm0 - 1) / s)), 0), ntx - 1)
+            tx1 = min(max(int(np.floor((xm1 + 1) / s)), 0), ntx - 1)
+            ty0 = min(max(int(np.floor((ym0 - 1) / s)), 0), nty - 1)
+            ty1 = min(max(int(np.floor((ym1 + 1) / s)), 0), nty - 1)
+
+            clip(p, tx0, ty0, tx1, ty1)
+
+        index = np.full((nty, ntx), -1, dtype=np.int32)
+        wkbs = []
+        for i, (t, ps) in enumerate(sorted(pieces.items())):
+            index[t] = i
+            wkbs.append(wkb.dumps(MultiPolygon(ps)))
+
+        offsets = np.cumsum([0] + [len(w) for w in wkbs]).astype(np.int64)
+        data = np.frombuffer(b''.join(wkbs), dtype=np.uint8)
+
+        logger.debug("clipped polygons to %d tiles" % len(wkbs))
+
+        return TileIndex(shift, transform, index, offsets, data)
+
+    def save(self, f):
+        np.savez(f,
+                 shift=self.shift,
+                 transform=np.array(self.transform),
+                 index=self.index,
+                 offsets=self.offsets,
+                 data=self.data)
+
+    @staticmethod
+    def load(f):
+        from affine import Affine
+        with np.load(f) as d:
+            return TileIndex(int(d['shift']), Affine(*d['transform'][:6]),
+                             d['index'], d['offsets'], d['data'])
+
+    def geometry(self, i):
+        """
+        The fragment with index `i`, not prepared (or kept).
+        """
+        return wkb.loads(self.data[self.offsets[i]:self.offsets[i +
+                                                               1]].tobytes())
+
+    def fragment(self, i, backend):
+        """
+        The fragment with index `i`, prepared for `backend`.
+        """
+        f = self.fragments.get((backend.name, i))
+        if f is None:
+            f = backend.prepare(
+                wkb.loads(self.data[self.offsets[i]:self.offsets[i +
+                                                                 1]].tobytes()))
+            self.fragments[(backend.name, i)] = f
+        return f
+
+    def contains(self, x, y, xm, ym, backend):
+        """
+        Check points x, y in mask cells xm, ym against the fragment of their
+        tile using `backend`.
+
+        Returns:
+
+            array of bools same length as x and y
+        """
+        inside = np.zeros(x.shape, dtype=bool)
+        if len(x) == 0:
+            return inside
+
+        tiles = self.index[ym >> self.shift, xm >> self.shift]
+
+        # group points by tile
+        order = np.argsort(tiles, kind='stable')
+        tiles = tiles[order]
+        splits = np.flatnonzero(np.diff(tiles)) + 1
+        for a, b in zip(np.r_[0, splits], np.r_[splits, len(tiles)]):
+            if tiles[a] < 0:
+                continue
+
+            i = order[a:b]
+            inside[i] = backend.contains(self.fragment(tiles[a], backend),
+                                         x[i], y[i])
+
+        return inside
+
+
+worker_tiles = None  # tile index of worker process
+
+
+def worker_init(tiles):
+    global worker_tiles
+    if isinstance(tiles, TileIndex):
+        worker_tiles = tiles
+    else:
+        worker_tiles = TileIndex.load(tiles)
+
+
+def worker_contains(x, y, xm, ym, backend):
+    from .backends import get_backend
+    return worker_tiles.contains(x, y, xm, ym, get_backend(backend))
+
+
+class TileIndexPool:
+    """
+    Check points against a tile index on a pool of processes, for when
+    checking points against the polygons does not release the GIL. Each
+    process loads the saved tile index from `f`, or is sent the tile index
+    itself if `f` is a `TileIndex` (e.g. when it could not be saved).
+    """
+
+    def __init__(self, f, workers):
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            initializer=worker_init,
+                                            initargs=(f, ))
+
+    def __del__(self):
+        self.executor.shutdown(wait=False)
+
+    def contains(self, x, y, xm, ym, backend):
+        """
+        Same as `TileIndex.contains`, blocks until a process has checked the
+        points.
+        """
+        if len(x) == 0:
+            return np.zeros(x.shape, dtype=bool)
+
+        return self.executor.submit(worker_contains, x, y, xm, ym,
+                                    backend.name).result()
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class Window:
+    """
+    A window of a bit-packed raster (such as the mask) copied into memory,
+    either bit-packed or with one byte per cell (faster to look up, 8 times
+    larger). Cells are looked up with the cell indices of the full raster.
+
+    Attributes:
+
+        r0, c0 (int): first row and column (cell) of the window in the raster
+
+        shape (tuple): (rows, cells) of window
+
+        transform (Affine): transform from cells of the window to lon, lat
+
+        bounds (tuple): (xmin, ymin, xmax, ymax) lon, lat of edges of window
+    """
+
+    def __init__(self, raster, rows, cells, transform, packed=True):
+        """
+        Args:
+
+            raster (array): bit-packed (ny, nx // 8) raster
+
+            rows (tuple): rows r0:r1 of window
+
+            cells (tuple): cells c0:c1 of window, widened to whole bytes
+
+            transform (Affine): transform from cells of the raster to lon, lat
+
+            packed (bool): keep window bit-packed
+        """
+        from affine import Affine
+
+        r0, r1 = rows
+        c0 = cells[0] >> 3
+        c1 = (cells[1] + 7) >> 3
+
+        self.r0 = r0
+        self.c0 = c0 << 3
+        self.packed = packed
+
+        w = np.array(raster[r0:r1, c0:c1], dtype=np.uint8)
+        if packed:
+            self.data = w
+        else:
+            self.data = np.unpackbits(w, axis=1).view(bool)
+
+        self.shape = (w.shape[0], w.shape[1] * 8)
+        self.transform = transform * Affine.translation(self.c0, self.r0)
+        self.bounds = self.transform * (0, 0) + self.transform * (
+            self.shape[1], self.shape[0])
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def contains(self, x, y):
+        """
+        All points x, y (lon, lat) are inside the window.
+        """
+        return (np.min(x) >= self.bounds[0] and np.min(y) >= self.bounds[1]
+                and np.max(x) <= self.bounds[2]
+                and np.max(y) <= self.bounds[3])
+
+    def lookup(self, xm, ym):
+        """
+        Look up cells xm, ym (of the full raster), which must be inside the
+        window.
+        """
+        r = ym - self.r0
+        c = xm - self.c0
+
+        assert np.all((r >= 0) & (r < self.shape[0]) & (c >= 0)
+                      & (c < self.shape[1])), "Points are not inside extent."
+
+        if self.packed:
+            return (self.data[r, c >> 3] >> (7 - (c & 7))) & 1 == 1
+        else:
+            return self.data[r, c]
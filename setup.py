@@ -28,13 +28,14 @@ setuptools.setup (name = 'opendrift_landmask_data',
        author_email = 'gaute.hope@met.no',
        url = 'http://github.com/OpenDrift/opendrift-landmask-data',
        packages = setuptools.find_packages(exclude = ['*.compressed']),
-       package_data = { '': [ 'shapes/*.wkb', 'masks/*.tif', 'masks/*.xz' ] },
+       package_data = { '': [ 'shapes/*.wkb', 'masks/*.tif', 'masks/*.npz' ] },
        include_package_data = False,
        setup_requires = [ 'setuptools_scm' ],
        extra_require = {
          'contains': [ 'shapely[vectorized]',
                        'numpy',
-                       'affine' ]
+                       'affine' ],
+         'distance': [ 'scipy' ]
                        },
        cmdclass = { 'build_py': BuildPyCommand }
        )
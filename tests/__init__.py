@@ -2,8 +2,10 @@ import pytest
 import tempfile
 import os
 
-tmpdir = os.path.join (tempfile.gettempdir(), 'landmask')
-mmapf = os.path.join(tmpdir, 'mask.dat')
+from opendrift_landmask_data import Landmask
+
+tmpdir = Landmask.tmpdir
+mmapf = Landmask.get_mmapf()
 
 def delete_mask():
   print("deleting mask:", mmapf)
@@ -0,0 +1,49 @@
+import pytest
+import numpy as np
+from shapely.geometry import Point, box, MultiPolygon
+from opendrift_landmask_data.backends import backends, get_backend
+
+from opendrift_landmask_data import Landmask
+
+def land():
+  rng = np.random.default_rng(0)
+  polys = [ Point(c).buffer(r, 3).difference(Point(c).buffer(r / 3, 2))
+              for c, r in zip(rng.uniform(0, 100, (20, 2)), rng.uniform(1, 8, 20)) ]
+  polys.append(box(10, 10, 30, 12))
+
+  from shapely.ops import unary_union
+  return MultiPolygon(list(unary_union(polys).geoms))
+
+@pytest.mark.parametrize('backend', list(backends))
+def test_backend_contains(backend):
+  b = get_backend(backend)
+  assert b.name == backend
+
+  rng = np.random.default_rng(1)
+  x, y = rng.uniform(-5, 105, (2, 100000))
+
+  g = land()
+  c = b.contains(b.prepare(g), x, y)
+  assert c.shape == x.shape
+  assert np.any(c) and not np.all(c)
+
+  ref = get_backend('shapely')
+  np.testing.assert_array_equal(c, ref.contains(ref.prepare(g), x, y))
+
+def test_backend_default():
+  assert get_backend().name in backends
+
+  with pytest.raises(AssertionError):
+    get_backend('unknown')
+
+@pytest.mark.parametrize('backend', list(backends))
+def test_landmask_backend(backend):
+  l = Landmask(backend = backend)
+  assert l.backend.name == backend
+
+  x = np.linspace(4, 6, 300)
+  y = np.linspace(58, 62, 300)
+  xx, yy = np.meshgrid(x,y)
+
+  np.testing.assert_array_equal(l.contains(xx.ravel(), yy.ravel()),
+                                Landmask(backend = 'shapely').contains(xx.ravel(), yy.ravel()))
@@ -0,0 +1,140 @@
+import os
+import io
+import time
+import pytest
+from opendrift_landmask_data.cache import stream_hash, cache_key, cached_file, write_sidecar, valid, FileLock
+
+def test_stream_hash(tmpdir):
+  f = str(tmpdir.join('source.wkb'))
+  with open(f, 'wb') as fd:
+    fd.write(b'polygons')
+
+  with open(f, 'rb') as fd:
+    h = stream_hash(fd, str(tmpdir))
+
+  assert h == stream_hash(io.BytesIO(b'polygons'))
+
+  # remembered in cache directory
+  memo = [m for m in os.listdir(str(tmpdir)) if m.endswith('.sha256')]
+  assert len(memo) == 1
+
+  with open(f, 'rb') as fd:
+    assert stream_hash(fd, str(tmpdir)) == h
+
+def test_cache_key():
+  assert cache_key('abc', 'packed-1') == cache_key('abc', 'packed-1')
+  assert cache_key('abc', 'packed-1') != cache_key('abc', 'packed-2')
+  assert cache_key('abc', 'packed-1') != cache_key('abd', 'packed-1')
+  assert len(cache_key('abc', 'packed-1')) == 16
+
+def test_sidecar(tmpdir):
+  f = str(tmpdir.join('mask.dat'))
+  tmpf = str(tmpdir.join('tmp'))
+
+  with open(tmpf, 'wb') as fd:
+    fd.write(b'mask')
+
+  assert not valid(f, 'key')
+
+  write_sidecar(f, tmpf, 'key')
+  assert not valid(f, 'key')
+
+  os.rename(tmpf, f)
+  assert valid(f, 'key')
+  assert not valid(f, 'other')
+
+  # modified
+  with open(f, 'ab') as fd:
+    fd.write(b'more')
+  assert not valid(f, 'key')
+
+def test_cached_file(tmpdir):
+  f = str(tmpdir.join('coast.dat'))
+
+  def write(fd):
+    fd.write(b'coast')
+
+  assert cached_file(f, 'key', write)
+  assert valid(f, 'key')
+  assert not os.stat(f).st_mode & 0o222
+  assert not cached_file(f, 'key', lambda fd: 1 / 0)
+
+  # failing to write leaves nothing behind
+  g = str(tmpdir.join('distance.dat'))
+  with pytest.raises(ZeroDivisionError):
+    cached_file(g, 'key', lambda fd: 1 / 0)
+  assert sorted(os.listdir(str(tmpdir))) == ['coast.dat', 'coast.dat.json']
+
+def test_file_lock(tmpdir):
+  f = str(tmpdir.join('mask.dat.lock'))
+
+  l = FileLock(f)
+  assert l.acquire(blocking = False)
+  assert os.path.exists(f)
+
+  l2 = FileLock(f)
+  assert not l2.acquire(blocking = False)
+
+  l.release()
+  assert not os.path.exists(f)
+
+  with l2:
+    assert os.path.exists(f)
+  assert not os.path.exists(f)
+
+def test_file_lock_stale(tmpdir):
+  f = str(tmpdir.join('mask.dat.lock'))
+
+  # held by another node, not refreshed
+  with open(f, 'w') as fd:
+    fd.write('othernode 1')
+  old = time.time() - 120
+  os.utime(f, (old, old))
+
+  l = FileLock(f, stale = 60.)
+  assert l.acquire(blocking = False)
+  l.release()
+
+  # held by another node, refreshed
+  with open(f, 'w') as fd:
+    fd.write('othernode 1')
+
+  assert not l.acquire(blocking = False)
+  os.unlink(f)
+
+def test_file_lock_stale_race(tmpdir):
+  f = str(tmpdir.join('mask.dat.lock'))
+
+  with open(f, 'w') as fd:
+    fd.write('othernode 1')
+  old = time.time() - 120
+  os.utime(f, (old, old))
+
+  # found stale, but broken and taken by another process before breaking it
+  l = FileLock(f, stale = 60.)
+  stale = l.__stale__()
+  assert stale is not None
+
+  l2 = FileLock(f, stale = 60.)
+  assert l2.acquire(blocking = False)
+
+  assert not l.__break__(stale)
+  assert not l.acquire(blocking = False)
+  assert not l.held.is_set()
+
+  with open(f, 'r') as fd:
+    assert fd.read() == l2.owner
+  assert os.listdir(str(tmpdir)) == ['mask.dat.lock']
+
+  l2.release()
+  assert not os.path.exists(f)
+
+def test_file_lock_optional(tmpdir):
+  f = str(tmpdir.join('missing', 'mask.dat.lock'))
+
+  with pytest.raises(OSError):
+    with FileLock(f):
+      pass
+
+  with FileLock(f, optional = True) as l:
+    assert not l.held.is_set()
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+from affine import Affine
+from shapely.geometry import Point, box, MultiPolygon
+from opendrift_landmask_data.coast import coastline_rasterize
+
+from opendrift_landmask_data import Landmask
+
+def test_coastline_rasterize():
+  # 1 x 1 cells centered on integers
+  transform = Affine.translation(-.5, -.5)
+  land = MultiPolygon([
+    box(2.5, 2.5, 10.5, 6.5),  # along cell edges
+    Point(20, 20).buffer(6.3).difference(Point(20, 20).buffer(.2)),  # lake
+    box(30.2, 3.2, 30.4, 3.4),  # island inside a single cell
+    ])
+
+  coast = np.zeros((32, 40 // 8), dtype = np.uint8)
+  coastline_rasterize(land, ~transform, coast)
+  coast = np.unpackbits(coast, axis = 1).astype(bool)
+
+  # cells along the edges of the box are crossed, interior cells not
+  assert coast[2, 2] and coast[6, 10] and coast[4, 2] and coast[2, 4]
+  assert not coast[4, 5]
+  assert coast[4:6, 4:10].sum() == 0
+
+  assert coast[20, 20]  # lake
+  assert coast[3, 30]  # island
+
+  # cells not crossed by the coastline are either entirely on land or in water
+  for (y, x) in zip(*np.nonzero(~coast)):
+    c = box(x - .5, y - .5, x + .5, y + .5)
+    assert land.contains(c) or not land.intersects(c)
+
+def test_landmask_coast():
+  l = Landmask()
+
+  assert os.path.exists(l.coastf)
+  assert Landmask.__coast__() is l.coast
+
+  # inland
+  assert not l.__lookup__(l.coast, *[np.array([int(v)]) for v in l.invtransform * (15., 65.6)])
@@ -0,0 +1,87 @@
+import numpy as np
+from opendrift_landmask_data.crossing import traverse
+
+from opendrift_landmask_data import Landmask
+
+def test_traverse():
+  seg, t0, t1, cx, cy = traverse(np.array([.5, 2.5, 1.2]), np.array([.5, 2.5, 1.2]),
+                                 np.array([3.5, 2.5, 1.7]), np.array([1.7, .5, 1.4]),
+                                 10, 10)
+
+  np.testing.assert_array_equal(seg, [0, 0, 0, 0, 0, 1, 1, 1, 2])
+  np.testing.assert_array_equal(cx, [0, 1, 1, 2, 3, 2, 2, 2, 1])
+  np.testing.assert_array_equal(cy, [0, 0, 1, 1, 1, 2, 1, 0, 1])
+  np.testing.assert_allclose(t0, [0, 1/6, 5/12, 1/2, 5/6, 0, 1/4, 3/4, 0])
+  np.testing.assert_allclose(t1, [1/6, 5/12, 1/2, 5/6, 1, 1/4, 3/4, 1, 1])
+
+def test_traverse_covers():
+  rng = np.random.default_rng(0)
+  u0, v0 = rng.uniform(20, 50, (2, 500))
+  u1, v1 = u0 + rng.normal(0, 5, 500), v0 + rng.normal(0, 5, 500)
+
+  seg, t0, t1, cx, cy = traverse(u0, v0, u1, v1, 100, 100)
+  assert np.all(t0 <= t1)
+
+  t = np.linspace(0, 1, 10001)
+  for i in range(len(u0)):
+    sampled = set(zip(np.floor(u0[i] + (u1[i] - u0[i]) * t).astype(int),
+                      np.floor(v0[i] + (v1[i] - v0[i]) * t).astype(int)))
+    assert sampled <= set(zip(cx[seg == i], cy[seg == i]))
+
+def test_first_land_crossing_skippoly():
+  l = Landmask(skippoly = True)
+
+  # from the sea, across Norway, into Sweden, and along the sea
+  hit, x, y = l.first_land_crossing([3., 3.], [65.6, 60.], [15., 3.5], [65.6, 60.])
+  np.testing.assert_array_equal(hit, [True, False])
+  assert 3. < x[0] < 15.
+  assert y[0] == 65.6
+  assert l.contains(x[0] + Landmask.dx / 2, y[0])
+  assert not l.contains(x[0] - Landmask.dx / 2, y[0])
+  assert np.isnan(x[1]) and np.isnan(y[1])
+
+  # starting on land
+  hit, x, y = l.first_land_crossing(15., 65.6, 16., 65.6)
+  assert hit[0] and x[0] == 15.
+
+def test_first_land_crossing():
+  l = Landmask()
+
+  rng = np.random.default_rng(0)
+  x0, y0 = rng.uniform(4, 6, 2000), rng.uniform(58, 60, 2000)
+  x1, y1 = x0 + rng.normal(0, .05, 2000), y0 + rng.normal(0, .05, 2000)
+
+  hit, x, y = l.first_land_crossing(x0, y0, x1, y1)
+
+  # segments ending on land hit land, crossing points are on the segments
+  assert np.all(hit[l.contains(x1, y1)])
+  assert np.all(np.isnan(x[~hit]))
+  t = (x[hit] - x0[hit]) / (x1[hit] - x0[hit])
+  assert np.all((t >= 0) & (t <= 1))
+  np.testing.assert_allclose(y[hit], y0[hit] + t * (y1[hit] - y0[hit]))
+
+def test_traverse_wraps():
+  # across the edge of the grid, the short way round
+  seg, t0, t1, cx, cy = traverse(np.array([9.5, .5]), np.array([.5, .5]),
+                                 np.array([.5, 9.5]), np.array([.5, .5]),
+                                 10, 10)
+  np.testing.assert_array_equal(seg, [0, 0, 1, 1])
+  np.testing.assert_array_equal(cx, [9, 0, 0, 9])
+  np.testing.assert_allclose(t0, [0, .5, 0, .5])
+
+def test_first_land_crossing_antimeridian():
+  l = Landmask(skippoly = True)
+
+  # open water in the Pacific, across the antimeridian both ways
+  hit, x, y = l.first_land_crossing([179.95, -179.95], [0., 0.], [-179.95, 179.95], [0., 0.])
+  np.testing.assert_array_equal(hit, [False, False])
+
+  # around Fiji, which straddles the antimeridian: the segments hit land
+  # where the cells crossed the short way round are land
+  y = np.linspace(-17.5, -15.5, 200)
+  hit, x, _ = l.first_land_crossing(np.full(200, 179.9), y, np.full(200, -179.9), y)
+  xs, ys = np.meshgrid((179.9 + np.linspace(0, .2, 1000) + 180.) % 360. - 180., y,
+                       indexing = 'ij')
+  land = l.contains(xs.ravel(), ys.ravel()).reshape(xs.shape)
+  np.testing.assert_array_equal(hit, land.any(axis=0))
+  assert np.all(np.abs(x[hit]) >= 179.9 - 1e-9)
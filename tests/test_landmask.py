@@ -12,6 +12,23 @@ def test_generate_landmask():
 
   assert os.path.exists(mmapf)
 
+def test_generate_landmask_failed(monkeypatch):
+  from opendrift_landmask_data.tiledmask import TiledMask
+  delete_mask()
+  before = set(f for f in os.listdir(tmpdir) if f.startswith('tmp'))
+
+  def write(self, fd, workers = None):
+    fd.write(b'partial')
+    raise IOError("disk full")
+
+  monkeypatch.setattr(TiledMask, 'write', write)
+  with pytest.raises(IOError):
+    Landmask(skippoly = True, __no_retry__ = True)
+
+  # the partially written mask is removed
+  assert not os.path.exists(mmapf)
+  assert set(f for f in os.listdir(tmpdir) if f.startswith('tmp')) <= before
+
 def test_concurrent_threads_landmask_generation():
   delete_mask()
 
@@ -109,6 +126,199 @@ def test_landmask_contains():
   l.contains([180], [-90])
   l.contains([-180], [-90])
 
+def test_landmask_packed():
+  l = Landmask(skippoly = True)
+
+  assert l.mask.shape == (Landmask.ny, Landmask.nx // 8)
+  assert os.stat(l.mmapf).st_size == Landmask.ny * Landmask.nx // 8
+
+  # neighbouring cells in the same packed byte
+  x = np.array([15., 5., 15. + Landmask.dx, 5. + Landmask.dx])
+  y = np.array([65.6, 65.6, 65.6, 65.6])
+  np.testing.assert_array_equal(l.contains(x, y), [True, False, True, False])
+
+def test_landmask_cache_files():
+  Landmask.mmapf = Landmask.DEFAULT_MMAPF  # in case generated in temporary location
+  l = Landmask(skippoly = True)
+
+  # named by hash of resource and format, with sidecar
+  assert l.mmapf == mmapf
+  assert os.path.dirname(l.mmapf) == Landmask.tmpdir
+  assert os.path.basename(l.mmapf) == 'mask_packed.%s.dat' % Landmask.mask_key
+  assert os.path.exists(l.mmapf + '.json')
+  assert l.__mask_exists__()
+
+def test_landmask_prefetch():
+  l = Landmask(skippoly = True)
+
+  f = l.prefetch([0., 55., 15., 70.])
+  f.result()
+  assert f.done()
+
+  x = np.array([5., 15.])
+  y = np.array([65.6, 65.6])
+  np.testing.assert_array_equal(l.contains(x, y), [False, True])
+
+def test_landmask_stats():
+  l = Landmask(skippoly = True, stats = True)
+
+  x = np.array([5., 15., 180.])
+  y = np.array([65.6, 65.6, 0.])
+  l.contains(x, y)
+
+  s = l.stats(reset = True)
+  assert 'init.pyramid' in s['timings']
+  assert 'contains.raster' in s['timings']
+  assert s['counts']['points'] == 3
+  assert s['counts']['raster_land'] == 1
+
+  assert l.stats()['counts'] == {}
+
+  assert Landmask(skippoly = True).stats() is None
+
+def test_landmask_pyramid():
+  l = Landmask(skippoly = True)
+
+  assert l.pyramid[0].shape == (85, 169)
+  assert l.pyramid[-1].shape == (1, 1)
+
+  # blocks agree with the packed mask
+  bs = 1 << Landmask.pyramid_shift
+  for (i, j) in zip(*np.nonzero(l.pyramid[0] != Landmask.MIXED)):
+    b = l.mask[i * bs:(i + 1) * bs, j * bs // 8:(j + 1) * bs // 8]
+    assert np.all(b == (0xff if l.pyramid[0][i, j] == Landmask.LAND else 0))
+
+  # open ocean point cloud
+  x = np.linspace(-30, -20, 1000)
+  y = np.linspace(0, 10, 1000)
+  assert l.__bbox_class__(x, y) == Landmask.WATER
+  assert not np.any(l.contains(x, y))
+
+  # cloud spanning land and water
+  x = np.linspace(4, 16, 1000)
+  y = np.full(x.shape, 65.6)
+  assert l.__bbox_class__(x, y) == Landmask.MIXED
+  c = l.contains(x, y)
+  assert np.any(c) and not np.all(c)
+
+def test_landmask_distance():
+  l = Landmask(skippoly = True)
+
+  d = l.distance_to_coast([-30., 5., 15., 4.9], [30., 65.6, 65.6, 60.5])
+  assert d.shape == (4,)
+  np.testing.assert_array_equal(d, [Landmask.distance_max, Landmask.distance_max, 0, 0])
+
+  assert l.distance.shape == (Landmask.ny // 4, Landmask.nx // 4)
+  assert os.path.exists(l.distancef)
+
+  # increases away from the coast
+  d = l.distance_to_coast(np.linspace(4.5, 3, 10), np.full(10, 60.5))
+  assert np.all(np.diff(d) > 0)
+
+def test_landmask_land_fraction():
+  l = Landmask(skippoly = True)
+
+  np.testing.assert_array_equal(l.land_fraction([-30., 10.], [30., 60.], [-29., 12.], [31., 61.]), [0., 1.])
+  assert np.isnan(l.land_fraction(5., 60., 5., 61.)[0])
+
+  # boxes on blocks are exact
+  x0, y0 = l.transform * (43200, 30000)
+  x1, y1 = l.transform * (44000, 30400)
+  m = np.unpackbits(np.asarray(l.mask[30000:30400, 43200 // 8:44000 // 8]), axis = 1)
+  np.testing.assert_allclose(l.land_fraction(x0, y0, x1, y1), m.mean())
+
+  g = l.land_fraction_grid([x0, y0, x1, y1], (2, 4))
+  assert g.shape == (2, 4)
+  np.testing.assert_allclose(g.mean(), m.mean())
+  np.testing.assert_allclose(g[1, 0], m[200:, :200].mean())
+
+def test_landmask_nearest_water():
+  l = Landmask(skippoly = True)
+
+  x, y, d = l.nearest_water([15., 5.], [65.6, 65.6])
+  assert l.contains(15., 65.6, True)
+  assert not l.contains(x[0], y[0], True)
+  assert 0 < d[0] < l.distance_max
+  assert x[1] == 5. and y[1] == 65.6 and d[1] == 0.
+
+  # nothing within max distance
+  x, y, d = l.nearest_water(15., 65.6, max_distance = 10.)
+  assert x[0] == 15. and y[0] == 65.6 and np.isinf(d[0])
+
+def test_landmask_distance_many(benchmark):
+  l = Landmask(skippoly = True)
+
+  x = np.arange(-180, 180, .5)
+  y = np.arange(-90, 90, .5)
+  xx, yy = np.meshgrid(x,y)
+
+  d = benchmark(l.distance_to_coast, xx.ravel(), yy.ravel())
+  assert np.all(d[l.contains(xx.ravel(), yy.ravel(), True)] < 1852 * 2)
+
+def test_landmask_contains_parallel_skippoly():
+  l = Landmask(skippoly = True, workers = 4)
+  l.chunksize = 1000
+
+  x = np.arange(-180, 180, .5)
+  y = np.arange(-90, 90, .5)
+  xx, yy = np.meshgrid(x,y)
+
+  c = l.contains(xx.ravel(), yy.ravel())
+  np.testing.assert_array_equal(c, l.contains(xx.ravel(), yy.ravel(), workers = 1))
+
+def test_landmask_contains_parallel():
+  l = Landmask()
+  l.chunksize = 1000
+
+  x = np.linspace(4, 6, 300)
+  y = np.linspace(58, 62, 300)
+  xx, yy = np.meshgrid(x,y)
+
+  c = l.contains(xx.ravel(), yy.ravel())
+  np.testing.assert_array_equal(c, l.contains(xx.ravel(), yy.ravel(), workers = 4))
+
+def test_landmask_contains_parallel_processes(monkeypatch):
+  l = Landmask()
+  monkeypatch.setattr(l.backend, 'releases_gil', False)
+
+  l.chunksize = 1000
+
+  x = np.linspace(4, 6, 300)
+  y = np.linspace(58, 62, 300)
+  xx, yy = np.meshgrid(x,y)
+
+  c = l.contains(xx.ravel(), yy.ravel(), workers = 2)
+  assert l.pool is not None
+  np.testing.assert_array_equal(c, l.contains(xx.ravel(), yy.ravel()))
+
+def test_landmask_contains_parallel_processes_unsaved(monkeypatch, tmpdir):
+  l = Landmask()
+  monkeypatch.setattr(l.backend, 'releases_gil', False)
+
+  # the tile index is only in memory, it is sent to the processes
+  monkeypatch.setattr(l, 'tilesf', str(tmpdir.join('coast_tiles.npz')))
+  l.chunksize = 1000
+
+  x = np.linspace(4, 6, 300)
+  y = np.linspace(58, 62, 300)
+  xx, yy = np.meshgrid(x,y)
+
+  c = l.contains(xx.ravel(), yy.ravel(), workers = 2)
+  assert l.pool is not None
+  np.testing.assert_array_equal(c, l.contains(xx.ravel(), yy.ravel()))
+
+def test_landmask_many_parallel(benchmark):
+  l = Landmask(workers = 4)
+  l.chunksize = 10000
+
+  x = np.arange(-180, 180, .5)
+  y = np.arange(-90, 90, .5)
+
+  xx, yy = np.meshgrid(x,y)
+
+  print ("points:", len(xx.ravel()))
+  benchmark(l.contains, xx.ravel(), yy.ravel())
+
 def test_landmask_onland(benchmark):
   l = Landmask()
 
@@ -240,3 +450,68 @@ def test_tromsoe(tmpdir):
   # ax.set_global()
   plt.savefig(os.path.join(tmpdir, 'tromsoe.png'))
   # plt.show()
+
+def test_landmask_particles():
+  l = Landmask(skippoly = True)
+
+  x = np.array([5., 15., 5.])
+  y = np.array([65.6, 65.6, 60.])
+  p = l.particles(x, y)
+  np.testing.assert_array_equal(p.land, [False, True, False])
+
+  # second particle moves into the sea, the others do not change cell
+  x[1] = 3.
+  np.testing.assert_array_equal(p.update(x, y), [False, False, False])
+
+  p.remove([0])
+  ids = p.add([15.], [65.6])
+  np.testing.assert_array_equal(ids, [3])
+  np.testing.assert_array_equal(p.ids, [1, 2, 3])
+  np.testing.assert_array_equal(p.update([3., 5., 10.], [65.6, 60., 60.]),
+                                [False, False, True])
+
+def test_landmask_particles_random():
+  l = Landmask(skippoly = True)
+
+  rng = np.random.default_rng(0)
+  x = rng.uniform(-10, 30, 10000)
+  y = rng.uniform(50, 70, 10000)
+  p = l.particles(x, y)
+
+  for _ in range(3):
+    x = x + rng.normal(0, .01, len(x))
+    y = y + rng.normal(0, .01, len(y))
+    np.testing.assert_array_equal(p.update(x, y), l.contains(x, y))
+
+def test_landmask_plan():
+  l = Landmask(skippoly = True)
+
+  rng = np.random.default_rng(0)
+  x = rng.uniform(-10, 30, 10000)
+  y = rng.uniform(50, 70, 10000)
+
+  p = l.plan(len(x))
+  out = np.empty(len(x), dtype = bool)
+  assert p.contains(x, y, out = out) is out
+  np.testing.assert_array_equal(out, l.contains(x, y))
+
+  # smaller batch, float32
+  np.testing.assert_array_equal(
+    p.contains(np.array([5., 15.], dtype = np.float32),
+               np.array([65.6, 65.6], dtype = np.float32)), [False, True])
+
+  # the whole globe in land or water blocks
+  x = rng.uniform(-180, 180, 10000)
+  y = rng.uniform(-90, 90, 10000)
+  np.testing.assert_array_equal(p.contains(x, y), l.contains(x, y))
+
+def test_landmask_background():
+  l = Landmask(skippoly = True, background = True)
+
+  # open ocean is answered from the pyramid
+  assert not l.contains(-150., 0.)
+
+  np.testing.assert_array_equal(l.contains([5., 15.], [65.6, 65.6]), [False, True])
+  assert l.wait_ready(timeout = 60) is l
+  assert l.ready.done()
+  assert l.mask_ready.is_set()
@@ -0,0 +1,52 @@
+import numpy as np
+from affine import Affine
+from opendrift_landmask_data.nearest import coastal_water, NearestWater, R
+
+def brute(land):
+  ny, nx = land.shape
+  padded = np.pad(land, ((1, 1), (0, 0)))
+  padded = np.concatenate((padded[:, -1:], padded, padded[:, :1]), axis = 1)
+  neighbour = np.zeros(land.shape, dtype = bool)
+  for dy in range(3):
+    for dx in range(3):
+      if dy != 1 or dx != 1:
+        neighbour |= padded[dy:dy + ny, dx:dx + nx]
+  return np.flatnonzero(~land & neighbour)
+
+def blocks(land, s):
+  ny, nx = land.shape
+  b = np.pad(land, ((0, -ny % s), (0, 0))).reshape(-1, s, nx // s, s).mean(axis = (1, 3))
+  return np.where(b == 0, 0, np.where(b == 1, 1, 2)).astype(np.uint8)
+
+def test_coastal_water():
+  rng = np.random.default_rng(0)
+  land = np.zeros((40, 64), dtype = bool)
+  land[5:20, 10:30] = True
+  land[30:, 60:] = True  # wraps around
+  land[:, 40:48] = rng.uniform(size = (40, 8)) < .5
+  land[0, 0] = True
+
+  cells = coastal_water(np.packbits(land, axis = 1), blocks(land, 16), 4, 0, 2)
+  np.testing.assert_array_equal(cells, brute(land))
+  assert 30 * 64 + 0 in cells  # next to land at the other end
+
+def test_coastal_water_none():
+  land = np.zeros((16, 32), dtype = bool)
+  cells = coastal_water(np.packbits(land, axis = 1), blocks(land, 16), 4, 0, 2)
+  assert len(cells) == 0
+
+def test_nearest_water():
+  t = Affine.translation(-180, -90) * Affine.scale(1. / 60.)
+  nx = 360 * 60
+  cells = np.array([10 * nx + 5, 10 * nx + nx - 1], dtype = np.int64)
+  n = NearestWater(cells, nx, t)
+
+  x, y, d = n.query(np.array([-179.9, 179.99, 0.]), np.array([-89.8, -89.8, 0.]), 20000.)
+  np.testing.assert_allclose(x[:2], [-180 + 5.5 / 60, 180 - .5 / 60])
+  np.testing.assert_allclose(y[:2], -90 + 10.5 / 60)
+  assert np.all(d[:2] < 20000.)
+  assert np.isnan(x[2]) and np.isinf(d[2])
+
+  # a minute of latitude is a nautical mile
+  x, y, d = n.query(np.array([-180 + 5.5 / 60]), np.array([-90 + 11.5 / 60]), 20000.)
+  np.testing.assert_allclose(d, 1852.)
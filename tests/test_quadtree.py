@@ -0,0 +1,59 @@
+import numpy as np
+import shapely
+from affine import Affine
+from opendrift_landmask_data.tiles import TileIndex
+from opendrift_landmask_data.quadtree import QuadTree, NODES, RANK_BLOCK
+
+from .test_tiles import land, cells
+
+def test_quadtree_contains(tmpdir):
+  transform = Affine.translation(-.5, -.5)
+  t = TileIndex.build(land(), (32, 64), 3, transform)
+
+  # every cell is a root
+  q = QuadTree.build(t, np.arange(32 * 64), 64, transform, 5)
+  assert q.accuracy == np.sqrt(2.) / 32
+
+  x, y, xm, ym = cells()
+  inside = shapely.contains_xy(land(), x, y)
+  qc = q.contains(x, y, xm, ym)
+
+  # only points close to the coastline may be misclassified
+  d = np.flatnonzero(qc != inside)
+  assert len(d) < len(x) / 1000
+  assert np.all(shapely.distance(land().boundary, shapely.points(x[d], y[d])) <= q.accuracy)
+
+  f = str(tmpdir.join('quadtree.npy'))
+  q.save(f)
+  ql = QuadTree.load(f, 64, transform)
+  assert ql.depth == 5
+  assert len(ql) == len(q)
+  np.testing.assert_array_equal(ql.contains(x, y, xm, ym), qc)
+
+def test_quadtree_leaves():
+  transform = Affine.translation(-.5, -.5)
+  t = TileIndex.build(land(), (32, 64), 3, transform)
+
+  # cells inside and outside land are leaves
+  q = QuadTree.build(t, np.array([4 * 64 + 10, 15 * 64 + 60]), 64, transform, 5)
+  assert len(q) == 0
+  np.testing.assert_array_equal(q.contains(np.array([10., 60.]), np.array([4., 15.]),
+                                           np.array([10, 60]), np.array([4, 15])),
+                                [True, False])
+
+def test_quadtree_chunks():
+  transform = Affine.translation(-.5, -.5)
+  t = TileIndex.build(land(), (32, 64), 3, transform)
+
+  # building a few cells at the time gives the same tree
+  q = QuadTree.build(t, np.arange(32 * 64), 64, transform, 4)
+  qc = QuadTree.build(t, np.arange(32 * 64), 64, transform, 4, chunk = 37)
+  for a in ('cells', 'roots', 'ranks', 'nodes'):
+    np.testing.assert_array_equal(getattr(qc, a), getattr(q, a))
+
+  # ranks count the quadrants that are nodes before each block
+  n = np.count_nonzero(q.roots >= 0)
+  j = np.arange(len(q))
+  counts = n + np.concatenate(([0], np.cumsum(NODES[q.nodes])))[:-1]
+  np.testing.assert_array_equal(q.__rank__(j), counts)
+  np.testing.assert_array_equal(q.ranks, counts[::RANK_BLOCK])
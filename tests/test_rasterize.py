@@ -0,0 +1,59 @@
+import pytest
+import io
+import os
+import numpy as np
+import shapely
+import shapely.wkb
+
+from opendrift_landmask_data import Landmask
+
+rasterio = pytest.importorskip('rasterio')
+
+@pytest.mark.parametrize('tile', [512, 1000, 4096])
+def test_mask_rasterize_tiled(tmpdir, tile):
+  from rasterio.features import geometry_mask
+  from opendrift_landmask_data.rasterize import mask_rasterize
+
+  land = shapely.MultiPolygon([
+    shapely.box(-170, -80, -20, 10),
+    shapely.Point(100, 30).buffer(40, 64).difference(shapely.Point(100, 30).buffer(10)),
+    shapely.Point(5.01, 60.02).buffer(.3, 5),
+    shapely.box(170, -90, 180, -85)])
+
+  landmask = Landmask.for_resolution('c')
+  img = mask_rasterize(io.BytesIO(shapely.wkb.dumps(land)),
+                       str(tmpdir.join('mask.dat')), landmask, tile = tile,
+                       workers = 2)
+
+  whole = np.packbits(geometry_mask(list(land.geoms), invert = True,
+                                    out_shape = (landmask.ny, landmask.nx),
+                                    all_touched = True,
+                                    transform = landmask.get_transform()),
+                      axis = 1)
+
+  np.testing.assert_array_equal(img, whole)
+
+def test_rasterize_main(tmpdir):
+  import subprocess
+  import sys
+  from opendrift_landmask_data.rasterize import shapes_file
+
+  land = shapely.MultiPolygon([shapely.box(-170, -80, -20, 10),
+                               shapely.Point(5.01, 60.02).buffer(.3, 5)])
+  with open(shapes_file('c', str(tmpdir)), 'wb') as fd:
+    fd.write(shapely.wkb.dumps(land))
+
+  subprocess.run([sys.executable, '-m', 'opendrift_landmask_data.rasterize',
+                  'c', 'l', '--shapes', str(tmpdir), '--outdir', str(tmpdir),
+                  '--workers', '2'],
+                 check = True, cwd = str(tmpdir),
+                 env = dict(os.environ, PYTHONPATH = os.path.dirname(os.path.dirname(__file__))))
+
+  landmask = Landmask.for_resolution('c')
+  levels = np.load(str(tmpdir.join('pyramid_4.00_nm.npz')))
+  assert levels['arr_0'].shape == ((landmask.ny + 511) // 512, (landmask.nx + 511) // 512)
+  assert tmpdir.join('mask_4.00_nm.tiles.npz').exists()
+  assert not tmpdir.join('pyramid_2.00_nm.npz').exists()  # no shapes
+
+  # the bit-packed mask is not left behind
+  assert not tmpdir.listdir(lambda p: p.ext == '.mm')
@@ -0,0 +1,21 @@
+import pytest
+import numpy as np
+import shapely
+from shapely.ops import unary_union
+
+from opendrift_landmask_data.regenerate import union
+
+@pytest.mark.parametrize('partitions', [1, 4, 9])
+def test_union(partitions):
+  rng = np.random.default_rng(0)
+  geoms = [shapely.Point(x, y).buffer(r, 8) for x, y, r in
+           zip(rng.uniform(-30, 30, 300), rng.uniform(-20, 20, 300),
+               rng.uniform(.1, 3, 300))]
+  geoms.append(shapely.box(-40, -1, 40, 1))  # across all partitions
+
+  land = union(geoms, partitions = partitions, workers = 2)
+  ref = unary_union(geoms)
+
+  assert land.geom_type == 'MultiPolygon'
+  assert len(land.geoms) == len(ref.geoms)
+  assert land.symmetric_difference(ref).area < 1.e-9 * ref.area
@@ -0,0 +1,86 @@
+import pytest
+import weakref
+import numpy as np
+from opendrift_landmask_data import Landmask
+
+@pytest.mark.parametrize('resolution', ['c', 'l', 'i', 'h', 'f'])
+def test_for_resolution(resolution):
+  L = Landmask.for_resolution(resolution)
+
+  assert issubclass(L, Landmask)
+  assert L.resolution == resolution
+  assert L.for_resolution(resolution) is L
+  assert L.dnm == Landmask.resolutions[resolution]
+
+  assert L.nx == 2 * L.ny
+  assert L.nx % 8 == 0 and L.nxp == L.nx // 8
+  assert L.ny % L.distance_factor == 0
+
+  t = L.get_transform()
+  assert t.a == pytest.approx(L.dx)
+  assert t * (.5, .5) == pytest.approx((-180, -90))
+
+def test_resolution_slots():
+  C = Landmask.for_resolution('c')
+
+  assert C is not Landmask
+  assert C.nx == Landmask.nx // 16
+  assert C.__mask__() is None
+  assert C.__quadtree__() is None
+  assert C.__extent_polygons__ is not Landmask.__extent_polygons__
+
+def test_landmask_resolution():
+  l = Landmask(skippoly = True, resolution = 'f')
+  assert type(l) is Landmask
+
+  with pytest.raises(AssertionError):
+    Landmask(skippoly = True, resolution = 'x')
+
+  with pytest.raises(AssertionError, match = 'as keyword'):
+    Landmask(None, True, 1, None, 'memmap', None, 'c')
+
+def test_resolution_attributes():
+  # each resolution has its own class weakrefs and cache files
+  own = [k for k, v in vars(Landmask).items()
+         if (k.startswith('__') and (isinstance(v, weakref.ref) or
+                                     getattr(v, '__name__', None) == '<lambda>'))
+         or k.endswith('_key')]
+  assert '__quadtree__' in own and 'mask_key' in own
+  assert set(own) <= set(Landmask.__resolution_attributes__)
+
+def fresh(C, monkeypatch, masksdir):
+  # nothing loaded or cached, masks in masksdir
+  for name in Landmask.__resolution_attributes__:
+    value = getattr(C, name)
+    if isinstance(value, weakref.WeakValueDictionary):
+      monkeypatch.setattr(C, name, weakref.WeakValueDictionary())
+    elif callable(value):
+      monkeypatch.setattr(C, name, lambda: None)
+    else:
+      monkeypatch.setattr(C, name, None)
+  monkeypatch.setattr(C, 'masksdir', masksdir)
+
+def test_landmask_resolution_missing(tmpdir, monkeypatch):
+  C = Landmask.for_resolution('c')
+  fresh(C, monkeypatch, str(tmpdir))
+
+  with pytest.raises(FileNotFoundError, match = 'opendrift_landmask_data.rasterize c'):
+    Landmask(skippoly = True, resolution = 'c')
+
+def test_landmask_resolution_generated(tmpdir, monkeypatch):
+  pytest.importorskip('rasterio')
+  import shapely
+  import shapely.wkb
+  from opendrift_landmask_data.rasterize import generate, shapes_file
+
+  land = shapely.MultiPolygon([shapely.box(-170, -80, -20, 10)])
+  with open(shapes_file('c', str(tmpdir)), 'wb') as fd:
+    fd.write(shapely.wkb.dumps(land))
+  generate('c', str(tmpdir), str(tmpdir), workers = 1)
+
+  C = Landmask.for_resolution('c')
+  fresh(C, monkeypatch, str(tmpdir))
+
+  l = Landmask(skippoly = True, resolution = 'c')
+  assert type(l) is C
+  np.testing.assert_array_equal(l.contains([-100., 0.], [0., 0.]), [True, False])
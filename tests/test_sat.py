@@ -0,0 +1,20 @@
+import numpy as np
+from opendrift_landmask_data.sat import sat_rasterize, sat_integral
+
+def test_sat_rasterize():
+  rng = np.random.default_rng(0)
+  land = rng.uniform(size = (20, 64)) < .3
+  mask = np.packbits(land, axis = 1)
+
+  sat = np.empty((4, 9), dtype = np.uint32)
+  sat_rasterize(mask, sat, 8, rows = 8)
+
+  padded = np.zeros((24, 64), dtype = np.int64)
+  padded[:20] = land
+  blocks = padded.reshape(3, 8, 8, 8).sum(axis = (1, 3))
+  np.testing.assert_array_equal(sat[1:, 1:], blocks.cumsum(axis = 0).cumsum(axis = 1))
+  assert sat[0, :].sum() == 0 and sat[:, 0].sum() == 0
+
+  # corners on blocks are exact, between blocks land is spread evenly
+  assert sat_integral(sat, 8., 3.) == land.sum()
+  np.testing.assert_allclose(sat_integral(sat, np.array([.5]), np.array([1.])), blocks[0, 0] / 2.)
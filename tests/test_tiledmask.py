@@ -0,0 +1,135 @@
+import numpy as np
+from opendrift_landmask_data.tiledmask import TiledMask
+from opendrift_landmask_data import Landmask
+
+def packed():
+  rng = np.random.default_rng(0)
+  m = rng.integers(0, 256, (40, 10), dtype=np.uint8)
+  m[:16, :2] = 0
+  m[16:32, 2:4] = 0xff
+  return m
+
+def tiled(m, max_bytes = 1 << 20):
+  # 16 x 16 cell tiles, 16 x 2 bytes
+  mixed = np.ones((3, 5), dtype=bool)
+  mixed[0, 0] = False
+  mixed[1, 1] = False
+  fill = np.zeros((3, 5), dtype=np.uint8)
+  fill[1, 1] = 0xff
+  return TiledMask.build(m, mixed, fill, 4, max_bytes)
+
+def test_tiledmask_lookup():
+  m = packed()
+  t = tiled(m)
+
+  assert t.shape == m.shape
+  assert t.sizes[0, 0] == 0 and t.offsets[1, 1] == -1
+
+  r, c = np.meshgrid(np.arange(40), np.arange(10), indexing = 'ij')
+  np.testing.assert_array_equal(t[r, c], m)
+  np.testing.assert_array_equal(t[r.ravel()[::-1], c.ravel()[::-1]], m.ravel()[::-1])
+
+def test_tiledmask_region():
+  m = packed()
+  t = tiled(m)
+
+  np.testing.assert_array_equal(t[:, :], m)
+  np.testing.assert_array_equal(t[5:37, 1:9], m[5:37, 1:9])
+  np.testing.assert_array_equal(t[33, :], m[33, :])
+  np.testing.assert_array_equal(t[:, 9], m[:, 9])
+
+def test_tiledmask_lru():
+  m = packed()
+  t = tiled(m, max_bytes = 2 * 32)
+
+  np.testing.assert_array_equal(t[:, :], m)
+  # the last tiles are 8 x 2 bytes
+  assert len(t.cache) == 4
+  assert t.cache_bytes <= 64
+
+def test_tiledmask_lru_threads():
+  import threading
+  from concurrent.futures import ThreadPoolExecutor
+
+  m = packed()
+  t = tiled(m)
+
+  # all threads miss on the same tile before any of them caches it
+  barrier = threading.Barrier(4)
+  decompress = t.decompress
+  def slow(i, j):
+    barrier.wait()
+    return decompress(i, j)
+  t.decompress = slow
+
+  with ThreadPoolExecutor(max_workers = 4) as executor:
+    tiles = list(executor.map(lambda _: t.tile(0, 1), range(4)))
+
+  assert len(t.cache) == 1
+  assert t.cache_bytes == 32
+  assert all(x is tiles[0] for x in tiles)
+  np.testing.assert_array_equal(tiles[0], m[:16, 2:4])
+
+def test_tiledmask_save_load(tmpdir):
+  m = packed()
+  t = tiled(m)
+
+  f = str(tmpdir.join('tiled.npz'))
+  t.save(f)
+  t2 = TiledMask.load(f, t.fill, 1 << 20)
+
+  np.testing.assert_array_equal(t2[:, :], m)
+
+def test_landmask_tiled():
+  l = Landmask(skippoly = True)
+  lt = Landmask(skippoly = True, storage = 'tiles')
+
+  assert isinstance(lt.mask, TiledMask)
+
+  rng = np.random.default_rng(0)
+  x = rng.uniform(-180, 180, 100000)
+  y = rng.uniform(-90, 90, 100000)
+  np.testing.assert_array_equal(l.contains(x, y), lt.contains(x, y))
+
+  x = rng.uniform(4, 6, 100000)
+  y = rng.uniform(59, 61, 100000)
+  np.testing.assert_array_equal(l.contains(x, y), lt.contains(x, y))
+
+def test_landmask_tiled_coast(monkeypatch):
+  monkeypatch.setattr(Landmask, '__coast__', lambda: None)
+  lt = Landmask(storage = 'tiles')
+  assert isinstance(lt.coast, TiledMask)
+
+  # same as the memmapped coast cells
+  monkeypatch.setattr(Landmask, '__coast__', lambda: None)
+  l = Landmask()
+  assert not isinstance(l.coast, TiledMask)
+
+  r0, r1 = 35000, 36500
+  np.testing.assert_array_equal(lt.coast[r0:r1, :], l.coast[r0:r1, :])
+
+  rng = np.random.default_rng(0)
+  x = rng.uniform(4, 6, 100000)
+  y = rng.uniform(59, 61, 100000)
+  np.testing.assert_array_equal(l.contains(x, y), lt.contains(x, y))
+
+def test_tiledmask_write(tmpdir):
+  m = packed()
+  t = tiled(m)
+
+  f = str(tmpdir.join('mask.dat'))
+  with open(f, 'wb') as fd:
+    t.write(fd, workers = 3)
+
+  np.testing.assert_array_equal(np.fromfile(f, dtype = np.uint8).reshape(m.shape), m)
+
+def test_landmask_tiled_prefetch():
+  lt = Landmask(skippoly = True, storage = 'tiles')
+  lt.mask.cache.clear()
+  lt.mask.cache_bytes = 0
+
+  lt.prefetch([4., 59., 6., 61.]).result()
+
+  # the mixed tiles covering the extent are decompressed
+  assert len(lt.mask.cache) > 0
+  assert all(lt.mask.offsets[k] >= 0 for k in lt.mask.cache)
@@ -0,0 +1,45 @@
+import numpy as np
+import shapely.vectorized
+from affine import Affine
+from shapely.geometry import Point, box, MultiPolygon
+from opendrift_landmask_data.tiles import TileIndex
+from opendrift_landmask_data.backends import get_backend
+
+def land():
+  return MultiPolygon([
+    box(2.5, 2.5, 40.5, 6.5),
+    Point(20, 20).buffer(9.3).difference(Point(21, 19).buffer(2.2)),
+    box(30.2, 13.2, 30.4, 13.4),
+    ])
+
+def cells(n = 100000):
+  rng = np.random.default_rng(0)
+  x = rng.uniform(-.5, 63.5, n)
+  y = rng.uniform(-.5, 31.5, n)
+  return x, y, np.clip(x + .5, 0, 63).astype(np.int32), np.clip(y + .5, 0, 31).astype(np.int32)
+
+def test_tiles_contains():
+  transform = Affine.translation(-.5, -.5)
+  t = TileIndex.build(land(), (32, 64), 3, transform)
+
+  assert t.index.shape == (4, 8)
+  assert t.index[3, 7] == -1
+
+  x, y, xm, ym = cells()
+  np.testing.assert_array_equal(t.contains(x, y, xm, ym, get_backend()),
+                                shapely.vectorized.contains(land(), x, y))
+
+def test_tiles_save_load(tmpdir):
+  transform = Affine.translation(-.5, -.5)
+  t = TileIndex.build(land(), (32, 64), 3, transform)
+
+  f = str(tmpdir.join('tiles.npz'))
+  t.save(f)
+  t2 = TileIndex.load(f)
+
+  assert t2.shift == 3
+  assert t2.transform == transform
+  assert len(t2) == len(t)
+
+  x, y, xm, ym = cells()
+  np.testing.assert_array_equal(t2.contains(x, y, xm, ym, get_backend()), t.contains(x, y, xm, ym, get_backend()))
@@ -66,3 +66,52 @@ def test_setup_landmask_retry_weakref():
   finally:
     os.chmod(tmpdir, m)
 
+
+def test_polygons_weakref():
+  gc.collect()
+  assert Landmask.__polygons__() is None
+
+  l = Landmask()
+  assert Landmask.__polygons__() is l.polygons
+
+  # second landmask shares the parsed and prepared polygons
+  l2 = Landmask()
+  assert l2.polys is l.polys
+  assert l2.land is l.land
+
+  del l
+  gc.collect()
+  assert Landmask.__polygons__() is not None
+
+  del l2
+  gc.collect()
+  assert Landmask.__polygons__() is None
+
+def test_polygons_extent_weakref():
+  gc.collect()
+  extent = [-1, 44, 41, 68]
+
+  l = Landmask(extent=extent)
+  l2 = Landmask(extent=extent)
+  l3 = Landmask(extent=[50, 0, 65, 40])
+
+  assert l2.polys is l.polys
+  assert l2.extent is l.extent
+  assert l3.polys is not l.polys
+  assert tuple(map(float, extent)) in Landmask.__extent_polygons__
+
+  del l, l2, l3
+  gc.collect()
+  assert len(Landmask.__extent_polygons__) == 0
+
+def test_polygons_extent_not_parsed():
+  Landmask() # make sure coastline cells and tile index are generated
+  gc.collect()
+
+  # checking points does not need the polygons, only the tile index
+  l = Landmask(extent=[-1, 44, 41, 68])
+  assert l.polygons.__polys__ is None
+  assert Landmask.__polygons__() is None or Landmask.__polygons__().__polys__ is None
+
+  assert len(l.polys.geoms) > 0
+  assert l.polygons.__polys__ is not None
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from affine import Affine
+from opendrift_landmask_data.window import Window
+from opendrift_landmask_data import Landmask
+
+def raster():
+  rng = np.random.default_rng(0)
+  return rng.integers(0, 256, (40, 10), dtype = np.uint8)
+
+@pytest.mark.parametrize('packed', [True, False])
+def test_window_lookup(packed):
+  m = raster()
+  w = Window(m, (5, 30), (11, 60), Affine.identity(), packed)
+
+  # widened to whole bytes
+  assert w.r0 == 5 and w.c0 == 8
+  assert w.shape == (25, 56)
+  assert w.transform * (0, 0) == (8, 5)
+
+  ym, xm = np.meshgrid(np.arange(5, 30), np.arange(8, 64), indexing = 'ij')
+  ym, xm = ym.ravel(), xm.ravel()
+  np.testing.assert_array_equal(w.lookup(xm, ym),
+                                Landmask.__lookup__(m, xm, ym))
+
+  with pytest.raises(AssertionError):
+    w.lookup(np.array([7]), np.array([10]))
+
+@pytest.mark.parametrize('crop', ['packed', 'bytes'])
+def test_landmask_crop(crop):
+  extent = [3., 58., 7., 62.]
+  l = Landmask(skippoly = True)
+  lc = Landmask(extent = extent, skippoly = True, crop = crop)
+
+  assert isinstance(lc.mask, Window)
+
+  rng = np.random.default_rng(0)
+  x = rng.uniform(3, 7, 100000)
+  y = rng.uniform(58, 62, 100000)
+  np.testing.assert_array_equal(l.contains(x, y), lc.contains(x, y))
+
+  with pytest.raises(AssertionError):
+    lc.contains([15.], [65.6])